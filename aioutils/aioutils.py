@@ -0,0 +1,312 @@
+import os
+import ssl
+import json
+import signal
+import asyncio
+import threading
+import subprocess
+import urllib.parse
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+
+from tracing.tracing import get_tracer, TracedPopen, record_rusage
+from scheduler.scheduler import child_env
+
+# 终止子进程时，SIGTERM之后等待多久再发送SIGKILL（秒）
+KILL_GRACE_SECONDS = 3.0
+
+
+async def _terminate(process: Any, wait: Optional[Callable[[], Awaitable[Any]]] = None) -> None:
+    """
+    终止子进程及其进程组，先SIGTERM，超时后SIGKILL
+
+    Args:
+        process: asyncio子进程或 subprocess.Popen
+        wait: 等待子进程退出的协程函数，默认为 process.wait
+    """
+    wait = wait or process.wait
+    if process.returncode is not None:
+        return
+
+    def send(sig: int) -> None:
+        try:
+            if os.name == "posix":
+                # 子进程以新会话启动，杀掉整个进程组以连带清理其派生的进程
+                os.killpg(process.pid, sig)
+            else:
+                process.send_signal(sig)
+        except ProcessLookupError:
+            pass
+
+    send(signal.SIGTERM)
+    try:
+        await asyncio.wait_for(wait(), KILL_GRACE_SECONDS)
+    except asyncio.TimeoutError:
+        send(signal.SIGKILL if os.name == "posix" else signal.SIGTERM)
+        await wait()
+
+
+async def run_command(cmd: List[str], timeout: Optional[float] = None, check: bool = False,
+                      cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+                      text: bool = True) -> subprocess.CompletedProcess:
+    """
+    以异步方式执行外部命令，语义与 subprocess.run(capture_output=True) 一致
+
+    超时或所在任务被取消时，子进程会被真正终止而不是留在后台继续运行
+
+    Args:
+        cmd: 命令及参数列表
+        timeout: 超时时间（秒），None表示不限制
+        check: 返回码非0时是否抛出 CalledProcessError
+        cwd: 工作目录
+        env: 环境变量
+        text: 是否将输出解码为字符串
+
+    Returns:
+        subprocess.CompletedProcess
+    """
+    env = child_env(env)  # 在资源预留内时限制子进程的线程数
+    tracer = get_tracer()
+    with tracer.span(f"exec:{os.path.basename(cmd[0])}", "subprocess", argv=" ".join(cmd)) as span:
+        if tracer.enabled and hasattr(os, "wait4"):
+            result = await _run_command_traced(cmd, timeout, cwd, env, text, span)
+        else:
+            result = await _run_command(cmd, timeout, cwd, env, text)
+        span.set(returncode=result.returncode)
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, cmd, result.stdout, result.stderr)
+    return result
+
+
+async def _run_command(cmd: List[str], timeout: Optional[float], cwd: Optional[str],
+                       env: Optional[Dict[str, str]], text: bool) -> subprocess.CompletedProcess:
+    """run_command 的实现，负责在超时或取消时终止子进程"""
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        start_new_session=(os.name == "posix"),
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        await _terminate(process)
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    except asyncio.CancelledError:
+        # 任务被取消时在屏蔽取消的情况下完成清理，避免遗留子进程
+        await asyncio.shield(_terminate(process))
+        raise
+
+    if text:
+        stdout = stdout.decode(errors="replace")
+        stderr = stderr.decode(errors="replace")
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+async def to_thread_owned(func: Callable[..., Any], release: Callable[[Any], None], *args: Any) -> Any:
+    """
+    在线程池中执行获取资源的函数（如打开文件、预留内存）
+
+    与 asyncio.to_thread 不同，等待期间任务被取消时，线程仍会执行完毕，
+    此时在线程完成后用 release 释放其返回的资源，避免资源泄漏
+
+    Args:
+        func: 获取资源的阻塞函数
+        release: 释放资源的函数，参数为 func 的返回值
+        args: 传给 func 的参数
+
+    Returns:
+        func 的返回值
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        def settle(done: "asyncio.Future") -> None:
+            if not done.cancelled() and done.exception() is None:
+                release(done.result())
+        future.add_done_callback(settle)
+        raise
+
+
+def _in_thread(func: Callable[[], Any]) -> "asyncio.Future":
+    """
+    在独立线程中执行阻塞函数，返回事件循环上的Future
+
+    子进程可能运行很久，不占用默认线程池，避免阻塞 asyncio.to_thread 的其他调用
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(result: Any, error: Optional[BaseException]) -> None:
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def target() -> None:
+        try:
+            result = func()
+        except BaseException as e:
+            loop.call_soon_threadsafe(settle, None, e)
+        else:
+            loop.call_soon_threadsafe(settle, result, None)
+
+    threading.Thread(target=target, name="run-command", daemon=True).start()
+    return future
+
+
+async def _run_command_traced(cmd: List[str], timeout: Optional[float], cwd: Optional[str],
+                              env: Optional[Dict[str, str]], text: bool, span: Any) -> subprocess.CompletedProcess:
+    """
+    追踪开启时的 _run_command
+
+    asyncio回收子进程时会丢弃其rusage，因此改为在线程中用 TracedPopen 等待子进程，
+    通过 os.wait4 记录该子进程自身的CPU时间和峰值内存；超时和取消的处理与 _run_command 相同
+    """
+    process = TracedPopen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        start_new_session=(os.name == "posix"),
+    )
+    communicate = _in_thread(process.communicate)
+
+    async def wait() -> None:
+        await asyncio.shield(communicate)
+
+    try:
+        stdout, stderr = await asyncio.wait_for(asyncio.shield(communicate), timeout)
+    except asyncio.TimeoutError:
+        await _terminate(process, wait)
+        record_rusage(span, process.rusage)
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    except asyncio.CancelledError:
+        await asyncio.shield(_terminate(process, wait))
+        record_rusage(span, process.rusage)
+        raise
+    record_rusage(span, process.rusage)
+
+    if text:
+        stdout = stdout.decode(errors="replace")
+        stderr = stderr.decode(errors="replace")
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+class HTTPResponse:
+    """异步HTTP请求的响应"""
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def text(self) -> str:
+        return self.body.decode(errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.body.decode())
+
+
+async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+    """读取 Transfer-Encoding: chunked 的响应体"""
+    chunks = []
+    while True:
+        size_line = await reader.readline()
+        size = int(size_line.split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            # 跳过可能存在的尾部头字段
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            break
+        chunks.append(await reader.readexactly(size))
+        await reader.readline()
+    return b"".join(chunks)
+
+
+async def _request(method: str, url: str, body: bytes, headers: Dict[str, str]) -> HTTPResponse:
+    """基于asyncio流实现的最小HTTP/1.1客户端，每个请求使用独立连接"""
+    parts = urllib.parse.urlsplit(url)
+    secure = parts.scheme == "https"
+    host = parts.hostname or ""
+    port = parts.port or (443 if secure else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    reader, writer = await asyncio.open_connection(
+        host, port, ssl=ssl.create_default_context() if secure else None
+    )
+    try:
+        request_headers = {
+            "Host": parts.netloc,
+            "Connection": "close",
+            "Content-Length": str(len(body)),
+            "User-Agent": "voice-embedding",
+        }
+        request_headers.update(headers)
+        head = f"{method} {path} HTTP/1.1\r\n" + "".join(
+            f"{name}: {value}\r\n" for name, value in request_headers.items()
+        ) + "\r\n"
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        status = int(status_line.split()[1])
+        response_headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            data = await _read_chunked(reader)
+        elif "content-length" in response_headers:
+            data = await reader.readexactly(int(response_headers["content-length"]))
+        else:
+            data = await reader.read()
+        return HTTPResponse(status, response_headers, data)
+    finally:
+        writer.close()
+
+
+async def http_request(method: str, url: str, params: Optional[Dict[str, Any]] = None,
+                       data: Optional[bytes] = None, headers: Optional[Dict[str, str]] = None,
+                       timeout: Optional[float] = None) -> HTTPResponse:
+    """
+    发送异步HTTP请求，取消或超时时立即关闭连接
+
+    Args:
+        method: 请求方法，如 "GET"、"POST"
+        url: 请求地址
+        params: 附加到URL查询字符串的参数
+        data: 请求体
+        headers: 请求头
+        timeout: 超时时间（秒）
+
+    Returns:
+        HTTPResponse
+    """
+    if params:
+        separator = "&" if urllib.parse.urlsplit(url).query else "?"
+        url = url + separator + urllib.parse.urlencode(params)
+    return await asyncio.wait_for(_request(method, url, data or b"", headers or {}), timeout)
+
+
+if __name__ == "__main__":
+    # 使用示例：超时后子进程会被终止
+    async def demo() -> None:
+        try:
+            await run_command(["sleep", "10"], timeout=1)
+        except subprocess.TimeoutExpired as e:
+            print(f"命令超时并已终止: {e}")
+
+    asyncio.run(demo())
@@ -0,0 +1,362 @@
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import platform
+import argparse
+import subprocess
+import statistics
+from typing import Optional, Dict, Any, List, Callable
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SEED = 1234
+AUDIO_LENGTHS = [5, 30]                    # 合成语音的时长（秒）
+VIDEO_CASES = [                            # (时长, 分辨率)
+    (5, "320x240"),
+    (5, "1280x720"),
+    (30, "640x360"),
+]
+# 比较时使用的指标，数值越大越差
+COMPARED_METRICS = ["wall_s", "cpu_s", "peak_rss_mb"]
+
+
+# ----------------------------------------------------------------------
+# 输入生成
+# ----------------------------------------------------------------------
+
+def write_wav(path: str, samples: np.ndarray, sample_rate: int, channels: int = 1) -> None:
+    """将 [-1, 1] 范围的浮点数组写为16位PCM WAV"""
+    data = np.clip(samples, -1.0, 1.0)
+    if channels > 1:
+        data = np.repeat(data[:, None], channels, axis=1)
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes((data * 32767).astype("<i2").tobytes())
+
+
+def synth_speech(seconds: float, sample_rate: int, seed: int = SEED) -> np.ndarray:
+    """
+    生成语音替代信号：基频带谐波的音节 + 噪声，音节之间有停顿
+    只用于性能测试，保证时长、能量分布与真实语音相近且结果可复现
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = np.zeros_like(t)
+    position = 0.0
+    while position < seconds:
+        length = rng.uniform(0.15, 0.4)          # 音节长度
+        pitch = rng.uniform(110, 260)            # 基频
+        mask = (t >= position) & (t < position + length)
+        local = t[mask] - position
+        envelope = np.sin(np.pi * local / length)
+        for harmonic in range(1, 6):
+            signal[mask] += envelope * np.sin(2 * np.pi * pitch * harmonic * local) / harmonic
+        position += length + rng.uniform(0.05, 0.3)  # 停顿
+    signal += 0.02 * rng.standard_normal(len(t))
+    return 0.3 * signal / max(np.abs(signal).max(), 1e-9)
+
+
+def make_video(ffmpeg: str, path: str, seconds: float, size: str) -> None:
+    """使用FFmpeg的testsrc和sine生成测试视频"""
+    subprocess.run([
+        ffmpeg, "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc=duration={seconds}:size={size}:rate=25",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest", "-fflags", "+bitexact",
+        path
+    ], check=True)
+
+
+def generate_inputs(work_dir: str, ffmpeg: Optional[str]) -> List[Dict[str, Any]]:
+    """生成所有测试输入，返回测试用例列表"""
+    os.makedirs(work_dir, exist_ok=True)
+    cases = []
+    for seconds in AUDIO_LENGTHS:
+        speech = synth_speech(seconds, 44100)
+        stereo_path = os.path.join(work_dir, f"speech_{seconds}s_44k.wav")
+        mono_path = os.path.join(work_dir, f"speech_{seconds}s_16k.wav")
+        write_wav(stereo_path, speech, 44100, channels=2)
+        write_wav(mono_path, synth_speech(seconds, 16000), 16000)
+        cases.append({"name": f"audio_{seconds}s", "kind": "audio", "seconds": seconds,
+                      "audio": stereo_path, "audio_16k": mono_path})
+
+    if ffmpeg is None:
+        print("未找到FFmpeg，跳过视频测试用例")
+        return cases
+
+    for seconds, size in VIDEO_CASES:
+        path = os.path.join(work_dir, f"video_{seconds}s_{size}.mp4")
+        if not os.path.exists(path):
+            make_video(ffmpeg, path, seconds, size)
+        speech_path = os.path.join(work_dir, f"speech_{seconds}s_44k.wav")
+        if not os.path.exists(speech_path):
+            write_wav(speech_path, synth_speech(seconds, 44100), 44100, channels=2)
+        cases.append({"name": f"video_{seconds}s_{size}", "kind": "video", "seconds": seconds,
+                      "video": path, "audio": speech_path})
+    return cases
+
+
+# ----------------------------------------------------------------------
+# 各阶段
+# ----------------------------------------------------------------------
+
+def _text_for(seconds: float) -> str:
+    """按语速约每秒8个字符生成识别文本"""
+    sentence = "これは日本語の音声サンプルです。"
+    return sentence * max(1, int(seconds * 8 / len(sentence)))
+
+
+def stage_voice_divide(case: Dict[str, Any], out: str) -> Callable[[], Any]:
+    from voicedivide.voicedivide import VoiceDivide
+    separator = VoiceDivide()
+    return lambda: separator.separate(case["audio"], out)
+
+
+def stage_speech_recognizer(case: Dict[str, Any], out: str) -> Callable[[], Any]:
+    from speechrecognizer.speechrecognizer import SpeechRecognizer
+    recognizer = SpeechRecognizer(model_path=os.environ.get("VOSK_MODEL_PATH"))
+    return lambda: recognizer.recognize(case["audio_16k"])
+
+
+def stage_text_translator(case: Dict[str, Any], out: str) -> Callable[[], Any]:
+    from texttranslator.texttranslator import TextTranslator
+    translator = TextTranslator(os.environ.get("BAIDU_APP_ID"), os.environ.get("BAIDU_APP_KEY"))
+    text = _text_for(case["seconds"])
+    return lambda: translator.translate(text)
+
+
+def stage_speech_synthesizer(case: Dict[str, Any], out: str) -> Callable[[], Any]:
+    from speechsynthesizer.speechsynthesizer import SpeechSynthesizer
+    synthesizer = SpeechSynthesizer(os.environ.get("XFYUN_APP_ID"), os.environ.get("XFYUN_API_KEY"))
+    text = "这是一段测试文本。" * max(1, int(case["seconds"]))
+    return lambda: synthesizer.synthesize(text, os.path.join(out, "speech.mp3"))
+
+
+def stage_lip_sync(case: Dict[str, Any], out: str) -> Callable[[], Any]:
+    from lipsync.lipsync import LipSync
+    lip_sync = LipSync(model_path=os.environ.get("WAV2LIP_CHECKPOINT"))
+    if os.environ.get("WAV2LIP_PATH"):
+        lip_sync.set_wav2lip_path(os.environ["WAV2LIP_PATH"])
+    return lambda: lip_sync.synchronize(case["video"], case["audio"], os.path.join(out, "synced.mp4"))
+
+
+def stage_video_composer(case: Dict[str, Any], out: str) -> Callable[[], Any]:
+    from videocomposer.videocomposer import VideoComposer
+    composer = VideoComposer(os.environ.get("FFMPEG_PATH"))
+    return lambda: composer.compose_final_video(case["video"], case["audio"], os.path.join(out, "final.mp4"))
+
+
+def stage_end_to_end(case: Dict[str, Any], out: str) -> Callable[[], Any]:
+    import main
+    # main.main 将结果写入当前目录下的 output/，工作进程以 out 为当前目录启动
+    return lambda: main.main(case["video"])
+
+
+STAGES = {
+    "VoiceDivide.separate": (stage_voice_divide, "audio"),
+    "SpeechRecognizer.recognize": (stage_speech_recognizer, "audio"),
+    "TextTranslator.translate": (stage_text_translator, "audio"),
+    "SpeechSynthesizer.synthesize": (stage_speech_synthesizer, "audio"),
+    "LipSync.synchronize": (stage_lip_sync, "video"),
+    "VideoComposer.compose_final_video": (stage_video_composer, "video"),
+    "main.main": (stage_end_to_end, "video"),
+}
+
+
+# ----------------------------------------------------------------------
+# 测量
+# ----------------------------------------------------------------------
+
+def _usage() -> Dict[str, float]:
+    """当前进程及已回收子进程的CPU时间，以及当前进程自身的峰值内存"""
+    if resource is None:
+        return {"cpu": time.process_time(), "rss_mb": 0.0}
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # Linux上ru_maxrss单位为KB，macOS上为字节
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "cpu": own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        "rss_mb": own.ru_maxrss / divisor,
+    }
+
+
+def run_worker(stage: str, case: Dict[str, Any], out: str) -> Dict[str, Any]:
+    """
+    在独立进程中执行一次阶段测量，保证峰值内存互不影响
+
+    阶段启动了子进程（FFmpeg、Wav2Lip等）时，峰值内存取各子进程中的最大值，
+    由追踪器通过 os.wait4 逐个记录，不含测量进程自身导入numpy等的开销；
+    没有子进程的阶段在测量进程内执行，只能取测量进程自身的峰值
+    """
+    from tracing.tracing import get_tracer
+    os.makedirs(out, exist_ok=True)
+    factory, _ = STAGES[stage]
+    call = factory(case, out)
+
+    tracer = get_tracer()
+    tracer.reset()
+    tracer.enable()
+    # 丢弃工具的打印输出，避免终端I/O影响计时
+    devnull = open(os.devnull, "w")
+    stdout, sys.stdout = sys.stdout, devnull
+    try:
+        before = _usage()
+        start = time.perf_counter()
+        call()
+        wall = time.perf_counter() - start
+        after = _usage()
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+        tracer.disable()
+
+    children = [event["args"]["child_max_rss_mb"] for event in tracer.events
+                if event["ph"] == "X" and "child_max_rss_mb" in event["args"]]
+    return {"wall_s": wall, "cpu_s": after["cpu"] - before["cpu"],
+            "peak_rss_mb": max(children) if children else after["rss_mb"],
+            "child_processes": len(children)}
+
+
+def measure(stage: str, case: Dict[str, Any], work_dir: str, repeat: int) -> Dict[str, Any]:
+    """重复执行阶段测量并取中位数"""
+    runs = []
+    for i in range(repeat):
+        out = os.path.join(work_dir, "runs", stage.replace(".", "_"), case["name"], str(i))
+        shutil.rmtree(out, ignore_errors=True)
+        os.makedirs(out)
+        # 工作进程以输出目录为当前目录，阶段写到相对路径的文件也留在本次运行的目录内
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.benchmark", "--worker", stage, json.dumps(case), out],
+            capture_output=True, text=True, cwd=out, env=env
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"{stage} / {case['name']} 失败: {result.stderr.strip()[-500:]}")
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    summary = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    summary["min_wall_s"] = min(run["wall_s"] for run in runs)
+    summary["rtf"] = summary["wall_s"] / case["seconds"]  # 实时率，小于1表示快于实时
+    return {"stage": stage, "case": case["name"], "media_seconds": case["seconds"],
+            "repeat": repeat, **{key: round(value, 4) for key, value in summary.items()}}
+
+
+def environment(ffmpeg: Optional[str]) -> Dict[str, Any]:
+    """记录测试环境，比较结果时用于判断是否可比"""
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "ffmpeg": None,
+        "git_commit": None,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if ffmpeg:
+        version = subprocess.run([ffmpeg, "-version"], capture_output=True, text=True)
+        info["ffmpeg"] = version.stdout.split("\n")[0]
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT)
+    if commit.returncode == 0:
+        info["git_commit"] = commit.stdout.strip()
+    return info
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    与基线结果比较
+
+    Args:
+        results: 本次结果
+        baseline: 基线结果
+        threshold: 允许的相对增幅，例如0.15表示慢15%以内不算回退
+
+    Returns:
+        回退列表
+    """
+    previous = {(item["stage"], item["case"]): item for item in baseline["results"]}
+    regressions = []
+    for item in results["results"]:
+        base = previous.get((item["stage"], item["case"]))
+        if base is None:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = base.get(metric), item.get(metric)
+            # 极小的数值受计时噪声影响大，不参与比较
+            if not old or new is None or old < 0.01:
+                continue
+            change = (new - old) / old
+            if change > threshold:
+                regressions.append({"stage": item["stage"], "case": item["case"], "metric": metric,
+                                    "baseline": old, "current": new, "change": round(change, 3)})
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Voice Embedding 离线性能基准测试")
+    parser.add_argument("--output", default="benchmarks/results.json", help="结果JSON路径")
+    parser.add_argument("--work-dir", default="benchmarks/.work", help="测试输入和中间文件目录")
+    parser.add_argument("--stage", action="append", choices=sorted(STAGES), help="只运行指定阶段，可重复")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例的重复次数")
+    parser.add_argument("--quick", action="store_true", help="只运行最短的音频和视频用例")
+    parser.add_argument("--compare", metavar="BASELINE", help="与基线结果比较，有回退时返回码为1")
+    parser.add_argument("--threshold", type=float, default=0.15, help="判定回退的相对增幅")
+    parser.add_argument("--worker", nargs=3, metavar=("STAGE", "CASE", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        stage, case, out = args.worker
+        print(json.dumps(run_worker(stage, json.loads(case), out)))
+        return 0
+
+    ffmpeg = os.environ.get("FFMPEG_PATH") or shutil.which("ffmpeg")
+    work_dir = os.path.abspath(args.work_dir)
+    cases = generate_inputs(work_dir, ffmpeg)
+    if args.quick:
+        cases = [case for case in cases if case["seconds"] == min(AUDIO_LENGTHS)]
+
+    results = {"environment": environment(ffmpeg), "results": []}
+    for stage in args.stage or list(STAGES):
+        kind = STAGES[stage][1]
+        for case in cases:
+            if case["kind"] != kind:
+                continue
+            item = measure(stage, case, work_dir, args.repeat)
+            results["results"].append(item)
+            print(f"{stage:36s} {case['name']:22s} wall={item['wall_s']:.3f}s cpu={item['cpu_s']:.3f}s "
+                  f"rss={item['peak_rss_mb']:.0f}MB rtf={item['rtf']:.3f}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"基准测试结果已保存: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for item in regressions:
+            print(f"性能回退: {item['stage']} / {item['case']} {item['metric']} "
+                  f"{item['baseline']} -> {item['current']} (+{item['change'] * 100:.1f}%)")
+        if regressions:
+            return 1
+        print("未发现性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,390 @@
+import io
+import os
+import sys
+import json
+import math
+import time
+import wave
+import array
+import base64
+import hashlib
+import hmac
+import random
+import asyncio
+import argparse
+import urllib.parse
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any, Tuple, Deque
+
+TRANSLATE_PATH = "/api/trans/vip/translate"
+TTS_PATH = "/v2/tts"
+
+# 与真实API一致的错误码
+BAIDU_ERRORS = {
+    "54000": "必填参数为空",
+    "52003": "UNAUTHORIZED USER",
+    "54001": "Invalid Sign",
+    "54003": "Invalid Access Limit",
+}
+XFYUN_QPS_EXCEEDED = 11202       # 秒级流控超限
+XFYUN_CLOCK_SKEW_SECONDS = 300   # Date头与服务器时间允许的最大偏差
+
+
+class LatencyModel:
+    """
+    响应延迟分布：对数正态分布，由中位数和形状参数决定
+
+    sigma为0时为固定延迟；sigma越大长尾越明显，0.5左右接近真实云API
+    """
+
+    def __init__(self, median_ms: float = 100.0, sigma: float = 0.5, seed: Optional[int] = None):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.random = random.Random(seed)
+
+    def sample(self) -> float:
+        """返回一次延迟（秒）"""
+        if self.median_ms <= 0:
+            return 0.0
+        if self.sigma <= 0:
+            return self.median_ms / 1000
+        return self.random.lognormvariate(math.log(self.median_ms), self.sigma) / 1000
+
+
+class RateLimiter:
+    """按应用ID统计最近1秒内的请求数，超过QPS上限时拒绝"""
+
+    def __init__(self, qps: float = 0):
+        self.qps = qps
+        self.windows: Dict[str, Deque[float]] = {}
+
+    def allow(self, key: str) -> bool:
+        if self.qps <= 0:
+            return True
+        now = time.monotonic()
+        window = self.windows.setdefault(key, deque())
+        while window and now - window[0] >= 1.0:
+            window.popleft()
+        if len(window) >= self.qps:
+            return False
+        window.append(now)
+        return True
+
+
+def tone_wav(seconds: float, sample_rate: int = 16000, frequency: float = 220.0) -> bytes:
+    """生成单声道16位PCM的正弦波WAV，作为模拟TTS的音频"""
+    step = 2 * math.pi * frequency / sample_rate
+    samples = array.array("h", (int(8000 * math.sin(step * i)) for i in range(int(seconds * sample_rate))))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+class FakeAPIServer:
+    """
+    本地模拟的百度翻译和科大讯飞TTS服务，用于离线测试并发和吞吐
+
+    与真实API保持一致的部分：请求签名校验（百度MD5签名、讯飞HMAC-SHA256鉴权）、
+    响应格式、QPS超限错误码，以及可配置的延迟分布和分块流式返回
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 baidu_app_id: str = "fake-appid", baidu_app_key: str = "fake-key",
+                 xfyun_app_id: str = "fake-appid", xfyun_api_key: str = "fake-key",
+                 translate_latency: Optional[LatencyModel] = None,
+                 tts_latency: Optional[LatencyModel] = None,
+                 translate_qps: float = 0, tts_qps: float = 0,
+                 stream: bool = True, chunk_size: int = 8192, chunk_interval_ms: float = 20.0):
+        """
+        初始化模拟服务
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示随机选择空闲端口
+            baidu_app_id: 百度翻译应用ID
+            baidu_app_key: 百度翻译密钥
+            xfyun_app_id: 讯飞应用ID
+            xfyun_api_key: 讯飞API密钥
+            translate_latency: 翻译接口的延迟分布
+            tts_latency: TTS接口的首包延迟分布
+            translate_qps: 翻译接口每个应用的QPS上限，0表示不限制
+            tts_qps: TTS接口每个应用的QPS上限，0表示不限制
+            stream: TTS响应是否以chunked方式分块返回
+            chunk_size: 分块大小（字节）
+            chunk_interval_ms: 分块之间的间隔，模拟边合成边返回
+        """
+        self.host = host
+        self.port = port
+        self.baidu_app_id = baidu_app_id
+        self.baidu_app_key = baidu_app_key
+        self.xfyun_app_id = xfyun_app_id
+        self.xfyun_api_key = xfyun_api_key
+        self.translate_latency = translate_latency or LatencyModel(120, 0.5)
+        self.tts_latency = tts_latency or LatencyModel(300, 0.5)
+        self.translate_limiter = RateLimiter(translate_qps)
+        self.tts_limiter = RateLimiter(tts_qps)
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.chunk_interval_ms = chunk_interval_ms
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.stats: Dict[str, int] = {}
+        self._audio_cache: Dict[int, str] = {}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def translate_url(self) -> str:
+        return self.base_url + TRANSLATE_PATH
+
+    @property
+    def tts_url(self) -> str:
+        return self.base_url + TTS_PATH
+
+    def env(self) -> Dict[str, str]:
+        """让工具类使用本模拟服务的环境变量"""
+        return {
+            "BAIDU_TRANSLATE_URL": self.translate_url,
+            "BAIDU_APP_ID": self.baidu_app_id,
+            "BAIDU_APP_KEY": self.baidu_app_key,
+            "XFYUN_TTS_URL": self.tts_url,
+            "XFYUN_APP_ID": self.xfyun_app_id,
+            "XFYUN_API_KEY": self.xfyun_api_key,
+        }
+
+    def _count(self, key: str) -> None:
+        self.stats[key] = self.stats.get(key, 0) + 1
+
+    # ------------------------------------------------------------------
+    # 百度翻译
+    # ------------------------------------------------------------------
+
+    def _translate(self, params: Dict[str, str]) -> Dict[str, Any]:
+        """校验签名并返回与百度翻译API相同格式的结果"""
+        required = ("q", "from", "to", "appid", "salt", "sign")
+        if any(not params.get(name) for name in required):
+            return self._baidu_error("54000")
+        if params["appid"] != self.baidu_app_id:
+            return self._baidu_error("52003")
+        expected = hashlib.md5(
+            (params["appid"] + params["q"] + params["salt"] + self.baidu_app_key).encode()
+        ).hexdigest()
+        if params["sign"] != expected:
+            return self._baidu_error("54001")
+        if not self.translate_limiter.allow(params["appid"]):
+            return self._baidu_error("54003")
+
+        self._count("translate.ok")
+        return {
+            "from": params["from"],
+            "to": params["to"],
+            "trans_result": [
+                {"src": line, "dst": f"[{params['to']}] {line}"}
+                for line in params["q"].split("\n")
+            ],
+        }
+
+    def _baidu_error(self, code: str) -> Dict[str, Any]:
+        self._count(f"translate.error.{code}")
+        return {"error_code": code, "error_msg": BAIDU_ERRORS[code]}
+
+    # ------------------------------------------------------------------
+    # 科大讯飞TTS
+    # ------------------------------------------------------------------
+
+    def _check_xfyun_auth(self, headers: Dict[str, str]) -> Optional[str]:
+        """校验讯飞HMAC鉴权，通过时返回None，否则返回错误信息"""
+        try:
+            authorization = base64.b64decode(headers.get("authorization", "")).decode()
+            fields = dict(
+                item.strip().split("=", 1) for item in authorization.split(",") if "=" in item
+            )
+            fields = {key: value.strip('"') for key, value in fields.items()}
+        except (ValueError, UnicodeDecodeError):
+            return "Unauthorized"
+        if fields.get("api_key") != self.xfyun_app_id:
+            return "Unauthorized"
+
+        date = headers.get("date", "")
+        try:
+            skew = abs(time.time() - parsedate_to_datetime(date).timestamp())
+        except (TypeError, ValueError):
+            return "Unauthorized"
+        if skew > XFYUN_CLOCK_SKEW_SECONDS:
+            return "HMAC signature cannot be verified, a valid date or x-date header is required"
+
+        origin = f"host: {headers.get('host', '')}\ndate: {date}\nGET {TTS_PATH} HTTP/1.1"
+        expected = base64.b64encode(
+            hmac.new(self.xfyun_api_key.encode(), origin.encode(), digestmod=hashlib.sha256).digest()
+        ).decode()
+        if not hmac.compare_digest(fields.get("signature", ""), expected):
+            return "HMAC signature does not match"
+        return None
+
+    def _synthesize(self, body: bytes) -> Dict[str, Any]:
+        """返回与讯飞TTS相同格式的结果，音频时长与文本长度成正比"""
+        try:
+            data = json.loads(body.decode())
+            app_id = data["common"]["app_id"]
+            text = base64.b64decode(data["data"]["text"]).decode()
+        except (ValueError, KeyError, TypeError):
+            self._count("tts.error.10163")
+            return {"code": 10163, "message": "参数校验失败", "sid": self._sid()}
+        if not self.tts_limiter.allow(app_id):
+            self._count(f"tts.error.{XFYUN_QPS_EXCEEDED}")
+            return {"code": XFYUN_QPS_EXCEEDED, "message": "licc limit", "sid": self._sid()}
+
+        self._count("tts.ok")
+        # 按每字约0.2秒估算时长，按0.5秒粒度缓存生成的音频
+        units = max(1, min(int(len(text) * 0.4), 120))
+        if units not in self._audio_cache:
+            self._audio_cache[units] = base64.b64encode(tone_wav(units * 0.5)).decode()
+        return {
+            "code": 0,
+            "message": "success",
+            "sid": self._sid(),
+            "data": {"audio": self._audio_cache[units], "status": 2, "ced": str(len(text))},
+        }
+
+    @staticmethod
+    def _sid() -> str:
+        return "tts" + hashlib.md5(os.urandom(8)).hexdigest()[:16]
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        """读取一个HTTP请求，返回 (方法, 路径, 请求头, 请求体)"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", "0")))
+        return method, target, headers, body
+
+    async def _send(self, writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any],
+                    stream: bool = False) -> None:
+        """发送JSON响应，stream为True时按chunked编码分块发送"""
+        reason = {200: "OK", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed"}[status]
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        head = f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=utf-8\r\nConnection: close\r\n"
+        if not stream:
+            writer.write(f"{head}Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            return
+
+        writer.write(f"{head}Transfer-Encoding: chunked\r\n\r\n".encode())
+        for offset in range(0, len(body), self.chunk_size):
+            chunk = body[offset:offset + self.chunk_size]
+            writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            await writer.drain()
+            if offset + self.chunk_size < len(body) and self.chunk_interval_ms > 0:
+                await asyncio.sleep(self.chunk_interval_ms / 1000)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            method, target, headers, body = request
+            parts = urllib.parse.urlsplit(target)
+
+            if parts.path == TRANSLATE_PATH:
+                params = dict(urllib.parse.parse_qsl(parts.query))
+                if headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+                    params.update(urllib.parse.parse_qsl(body.decode()))
+                await asyncio.sleep(self.translate_latency.sample())
+                await self._send(writer, 200, self._translate(params))
+            elif parts.path == TTS_PATH:
+                if method != "POST":
+                    await self._send(writer, 405, {"message": "Method Not Allowed"})
+                    return
+                error = self._check_xfyun_auth(headers)
+                if error:
+                    self._count("tts.error.401")
+                    await self._send(writer, 401, {"message": error})
+                    return
+                await asyncio.sleep(self.tts_latency.sample())
+                await self._send(writer, 200, self._synthesize(body), stream=self.stream)
+            else:
+                await self._send(writer, 404, {"message": "no Route matched with those values"})
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> "FakeAPIServer":
+        """启动服务，端口为0时启动后可从 port 属性读取实际端口"""
+        self.server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        print(f"模拟API服务已启动: {self.base_url}")
+        for name, value in self.env().items():
+            print(f"export {name}={value}")
+        async with self.server:
+            await self.server.serve_forever()
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """添加模拟服务的命令行参数，供本模块和负载生成器共用"""
+    parser.add_argument("--translate-latency-ms", type=float, default=120, help="翻译接口延迟中位数")
+    parser.add_argument("--tts-latency-ms", type=float, default=300, help="TTS接口首包延迟中位数")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="对数正态延迟分布的形状参数，0为固定延迟")
+    parser.add_argument("--translate-qps", type=float, default=0, help="翻译接口QPS上限，0为不限制")
+    parser.add_argument("--tts-qps", type=float, default=0, help="TTS接口QPS上限，0为不限制")
+    parser.add_argument("--no-stream", action="store_true", help="TTS响应一次性返回，不分块")
+    parser.add_argument("--chunk-interval-ms", type=float, default=20, help="TTS分块之间的间隔")
+    parser.add_argument("--seed", type=int, default=None, help="延迟分布的随机种子")
+
+
+def server_from_args(args: argparse.Namespace, host: str = "127.0.0.1", port: int = 0) -> FakeAPIServer:
+    """根据命令行参数创建模拟服务"""
+    return FakeAPIServer(
+        host=host,
+        port=port,
+        translate_latency=LatencyModel(args.translate_latency_ms, args.latency_sigma, args.seed),
+        tts_latency=LatencyModel(args.tts_latency_ms, args.latency_sigma, args.seed),
+        translate_qps=args.translate_qps,
+        tts_qps=args.tts_qps,
+        stream=not args.no_stream,
+        chunk_interval_ms=args.chunk_interval_ms,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="百度翻译和科大讯飞TTS的本地模拟服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8900, help="监听端口")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    try:
+        asyncio.run(server_from_args(args, args.host, args.port).serve_forever())
+    except KeyboardInterrupt:
+        pass
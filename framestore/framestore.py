@@ -0,0 +1,389 @@
+import os
+import re
+import sys
+import json
+import fcntl
+import hashlib
+import subprocess
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+
+from tracing.tracing import get_tracer
+from preflight.preflight import cache_dir, file_key
+from scheduler.scheduler import ffmpeg_threads
+
+MAGIC = b"VEFRAMES"
+HEADER_SIZE = 4096          # 文件头固定大小，帧数据从此处开始，保证按页对齐
+PIXEL_FORMAT = "bgr24"      # 与OpenCV/Wav2Lip一致的BGR顺序
+CHANNELS = 3
+# 子进程通过该环境变量获得帧文件路径
+FRAMES_ENV = "VOICE_EMBEDDING_FRAMES"
+BUDGET_ENV = "VOICE_EMBEDDING_FRAMESTORE_MB"
+
+
+def _write_header(f, header: Dict[str, Any]) -> None:
+    """写入文件头：魔数 + 4字节长度 + JSON索引，填充到 HEADER_SIZE"""
+    payload = json.dumps(header).encode()
+    if len(MAGIC) + 4 + len(payload) > HEADER_SIZE:
+        raise ValueError("帧文件头过大")
+    f.seek(0)
+    f.write(MAGIC + len(payload).to_bytes(4, "little") + payload)
+    f.write(b"\0" * (HEADER_SIZE - len(MAGIC) - 4 - len(payload)))
+
+
+def read_header(path: str) -> Dict[str, Any]:
+    """读取帧文件头"""
+    with open(path, "rb") as f:
+        return _parse_header(f.read(HEADER_SIZE), path)
+
+
+def _parse_header(head: bytes, path: str) -> Dict[str, Any]:
+    if not head.startswith(MAGIC):
+        raise ValueError(f"不是帧文件: {path}")
+    length = int.from_bytes(head[len(MAGIC):len(MAGIC) + 4], "little")
+    return json.loads(head[len(MAGIC) + 4:len(MAGIC) + 4 + length].decode())
+
+
+class Frames:
+    """
+    已解码的帧，以只读内存映射的方式访问
+
+    多个进程映射同一文件时共享页缓存，读取帧不发生复制；
+    打开期间持有文件的共享锁，作为跨进程的引用计数，清理时不会删除正在使用的文件
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_RDONLY)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+            # 打开和加锁之间文件可能已被清理删除，此时持有的是已删除的inode，按文件不存在处理
+            opened = os.fstat(self._fd)
+            current = os.stat(path)
+            if (opened.st_dev, opened.st_ino) != (current.st_dev, current.st_ino):
+                raise FileNotFoundError(path)
+            # 文件头和内存映射都通过已加锁的描述符读取，不再按路径重新打开
+            self.header = _parse_header(os.pread(self._fd, HEADER_SIZE, 0), path)
+            shape = (self.header["count"], self.header["height"], self.header["width"], CHANNELS)
+            with open(self._fd, "rb", closefd=False) as f:
+                self.array = np.memmap(f, dtype=np.uint8, mode="r", offset=HEADER_SIZE, shape=shape)
+        except BaseException:
+            os.close(self._fd)
+            self._fd = None
+            raise
+
+    @property
+    def fps(self) -> float:
+        return self.header["fps"]
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(宽, 高)"""
+        return self.header["width"], self.header["height"]
+
+    def __len__(self) -> int:
+        return self.header["count"]
+
+    def __getitem__(self, index):
+        """返回帧（或帧切片）的只读视图，形状为 (高, 宽, 3)"""
+        return self.array[index]
+
+    def close(self) -> None:
+        if getattr(self, "_fd", None) is not None:
+            self.array = None
+            os.close(self._fd)  # 关闭后共享锁随之释放
+            self._fd = None
+
+    def __enter__(self) -> "Frames":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.close()
+        return False
+
+    def __del__(self):
+        self.close()
+
+
+def open_frames(path: Optional[str] = None) -> Frames:
+    """
+    在工作进程中打开帧文件，默认读取环境变量 VOICE_EMBEDDING_FRAMES
+
+    用法（Wav2Lip等子进程中）:
+        frames = open_frames()
+        for frame in frames: ...
+    """
+    path = path or os.environ.get(FRAMES_ENV)
+    if not path:
+        raise ValueError(f"未指定帧文件，也未设置环境变量 {FRAMES_ENV}")
+    return Frames(path)
+
+
+class FrameStore:
+    """
+    已解码视频帧的磁盘存储
+
+    源视频按工作分辨率解码一次，保存为带索引文件头的uint8帧数组；键由源文件的真实路径、
+    修改时间、大小和分辨率组成，同一源视频重复渲染时直接复用。
+    总大小超过预算时按最近使用时间删除没有被任何进程打开的文件
+    """
+
+    def __init__(self, store_dir: Optional[str] = None, budget_mb: Optional[float] = None,
+                 ffmpeg_path: Optional[str] = None):
+        """
+        初始化帧存储
+
+        Args:
+            store_dir: 存储目录，应位于本地磁盘，默认 ~/.cache/voice-embedding/frames
+            budget_mb: 磁盘预算（MB），默认读取环境变量 VOICE_EMBEDDING_FRAMESTORE_MB，未设置时为8192
+            ffmpeg_path: FFmpeg可执行文件路径
+        """
+        self.store_dir = store_dir or os.path.join(cache_dir(), "frames")
+        if budget_mb is None:
+            budget_mb = float(os.environ.get(BUDGET_ENV, 8192))
+        self.budget_mb = budget_mb
+        self.ffmpeg_path = ffmpeg_path or os.environ.get("FFMPEG_PATH") or "ffmpeg"
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # 源视频信息
+    # ------------------------------------------------------------------
+
+    def _source_info(self, source: str) -> Tuple[int, int, float]:
+        """返回源视频的 (宽, 高, 帧率)，优先使用ffprobe缓存，否则解析 ffmpeg -i 的输出"""
+        from mediaprobe.mediaprobe import get_media_probe
+        info = get_media_probe().probe(source)
+        if info is not None and info.video is not None:
+            video = info.video
+            numerator, _, denominator = video.get("avg_frame_rate", "25/1").partition("/")
+            fps = float(numerator) / float(denominator or 1) if float(denominator or 1) else 25.0
+            return int(video["width"]), int(video["height"]), fps or 25.0
+
+        result = subprocess.run([self.ffmpeg_path, "-hide_banner", "-i", source], capture_output=True, text=True)
+        match = re.search(r"Video:.*?(\d{2,5})x(\d{2,5})", result.stderr)
+        if not match:
+            raise ValueError(f"无法获取视频信息: {source}")
+        fps_match = re.search(r"([\d.]+) fps", result.stderr)
+        return int(match.group(1)), int(match.group(2)), float(fps_match.group(1)) if fps_match else 25.0
+
+    @staticmethod
+    def _working_size(width: int, height: int, target_height: Optional[int]) -> Tuple[int, int]:
+        """按目标高度等比缩放，宽高取偶数"""
+        if not target_height or target_height >= height:
+            return width - width % 2, height - height % 2
+        scaled_width = int(round(width * target_height / height / 2)) * 2
+        return scaled_width, target_height - target_height % 2
+
+    def path_for(self, source: str, width: int, height: int) -> str:
+        """帧文件路径"""
+        key = f"{file_key(source)}:{width}x{height}:{PIXEL_FORMAT}"
+        return os.path.join(self.store_dir, hashlib.sha1(key.encode()).hexdigest() + ".frames")
+
+    # ------------------------------------------------------------------
+    # 解码
+    # ------------------------------------------------------------------
+
+    def ensure(self, source: str, height: Optional[int] = None) -> str:
+        """
+        确保源视频已按工作分辨率解码，返回帧文件路径
+
+        多个进程同时请求同一源视频时只有一个进程解码，其余进程等待后直接复用
+
+        Args:
+            source: 源视频路径
+            height: 工作分辨率的高度，None表示保持原分辨率
+
+        Returns:
+            帧文件路径
+        """
+        if file_key(source) is None:
+            raise FileNotFoundError(source)
+        source_width, source_height, fps = self._source_info(source)
+        width, height = self._working_size(source_width, source_height, height)
+        path = self.path_for(source, width, height)
+
+        if self._touch(path):
+            return path
+
+        with open(path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not self._touch(path):
+                    self._decode(source, path, width, height, fps, (source_width, source_height))
+                    self.cleanup(keep=path)
+            finally:
+                # 锁文件保留，删除后等待中的进程会锁到不同的inode
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return path
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        """记录最近使用时间，返回文件是否存在（判断和更新之间可能被清理，因此不单独判断存在）"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _decode(self, source: str, path: str, width: int, height: int, fps: float,
+                source_size: Tuple[int, int]) -> None:
+        """通过rawvideo管道解码到临时文件，完成后原子地重命名；source_size 为源视频的 (宽, 高)"""
+        frame_bytes = width * height * CHANNELS
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        cmd = [
+            self.ffmpeg_path, "-v", "error",
+            "-i", source,
+            "-map", "0:v:0",
+            "-vf", f"scale={width}:{height}",
+            "-vsync", "passthrough",
+            "-pix_fmt", PIXEL_FORMAT,
+            *ffmpeg_threads(),
+            "-f", "rawvideo", "-",
+        ]
+        with get_tracer().span("FrameStore.decode", "stage", source=source, size=f"{width}x{height}") as span:
+            count = 0
+            # 每次读取若干帧，减少系统调用次数
+            buffer = bytearray(frame_bytes * 8)
+            view = memoryview(buffer)
+            try:
+                with open(temp_path, "wb") as f, \
+                        subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+                    _write_header(f, {})
+                    pending = 0
+                    while True:
+                        read = process.stdout.readinto(view[pending:])
+                        if not read:
+                            break
+                        pending += read
+                        whole = pending - pending % frame_bytes
+                        f.write(view[:whole])
+                        count += whole // frame_bytes
+                        view[:pending - whole] = view[whole:pending]
+                        pending -= whole
+                    stderr = process.stderr.read().decode(errors="replace")
+                    if process.wait() != 0 or count == 0:
+                        raise RuntimeError(f"解码失败: {stderr.strip()[-500:]}")
+                    _write_header(f, {
+                        "version": 1,
+                        "source": os.path.realpath(source),
+                        "width": width,
+                        "height": height,
+                        "source_width": source_size[0],
+                        "source_height": source_size[1],
+                        "channels": CHANNELS,
+                        "pix_fmt": PIXEL_FORMAT,
+                        "fps": fps,
+                        "count": count,
+                        "frame_bytes": frame_bytes,
+                        "offset": HEADER_SIZE,
+                    })
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            span.set(frames=count, bytes_written=HEADER_SIZE + count * frame_bytes)
+        print(f"已解码 {count} 帧 ({width}x{height}) 到帧存储: {path}")
+
+    def get(self, source: str, height: Optional[int] = None) -> Frames:
+        """
+        解码（如有需要）并打开帧，使用完毕后应调用 close() 或使用 with 语句
+
+        ensure() 返回后、加锁之前，帧文件可能被其他进程的 cleanup() 删除，此时重新解码
+        """
+        for _ in range(3):
+            try:
+                return Frames(self.ensure(source, height))
+            except FileNotFoundError:
+                if file_key(source) is None:
+                    raise
+        raise RuntimeError(f"帧文件反复被清理，无法打开: {source}")
+
+    # ------------------------------------------------------------------
+    # 清理
+    # ------------------------------------------------------------------
+
+    def _files(self) -> List[Tuple[float, int, str]]:
+        """(最近使用时间, 大小, 路径) 列表，按最近使用时间升序"""
+        files = []
+        for name in os.listdir(self.store_dir):
+            if not name.endswith(".frames"):
+                continue
+            path = os.path.join(self.store_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return sorted(files)
+
+    def cleanup(self, budget_mb: Optional[float] = None, keep: Optional[str] = None) -> List[str]:
+        """
+        按最近使用时间删除帧文件，直到总大小不超过预算；被任何进程打开的文件不会被删除
+
+        Args:
+            budget_mb: 磁盘预算（MB），默认使用初始化时的预算
+            keep: 不删除的文件
+
+        Returns:
+            已删除的文件列表
+        """
+        budget = (self.budget_mb if budget_mb is None else budget_mb) * 1024 * 1024
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        removed = []
+        for _, size, path in files:
+            if total <= budget:
+                break
+            if path == keep:
+                continue
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                # 拿不到排他锁说明仍有进程持有共享锁（引用计数不为0）
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            try:
+                os.remove(path)
+                removed.append(path)
+                total -= size
+            finally:
+                os.close(fd)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        files = self._files()
+        return {
+            "store_dir": self.store_dir,
+            "files": len(files),
+            "total_mb": round(sum(size for _, size, _ in files) / (1024 * 1024), 1),
+            "budget_mb": self.budget_mb,
+        }
+
+
+_frame_store: Optional[FrameStore] = None
+
+
+def get_frame_store() -> FrameStore:
+    """获取进程内共享的FrameStore实例"""
+    global _frame_store
+    if _frame_store is None:
+        _frame_store = FrameStore()
+    return _frame_store
+
+
+if __name__ == "__main__":
+    # 使用示例
+    if len(sys.argv) < 2:
+        print("用法: python -m framestore.framestore <视频文件> [工作分辨率高度]")
+        sys.exit(1)
+    store = get_frame_store()
+    with store.get(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None) as frames:
+        print(f"帧数: {len(frames)}, 分辨率: {frames.size}, 帧率: {frames.fps}, 文件: {frames.path}")
+        print(f"第一帧均值: {frames[0].mean():.1f}")
+    print(store.stats())
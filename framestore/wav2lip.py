@@ -0,0 +1,119 @@
+import os
+import sys
+import runpy
+from typing import Optional, Dict, Any, List
+
+from framestore.framestore import FRAMES_ENV, Frames, open_frames
+
+# 仓库根目录，Wav2Lip在其自身目录下运行，需要通过PYTHONPATH找到本模块
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def adapter_command(script: str, args: List[str], python: str = "python") -> List[str]:
+    """构建经适配器运行Wav2Lip推理脚本的命令，参数与直接运行 inference.py 相同"""
+    return [python, "-m", "framestore.wav2lip", script, *args]
+
+
+def adapter_env(frames_path: Optional[str] = None) -> Dict[str, str]:
+    """适配器子进程的环境变量：仓库根目录加入PYTHONPATH，有帧文件时通过 VOICE_EMBEDDING_FRAMES 传入"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    if frames_path:
+        env[FRAMES_ENV] = frames_path
+    else:
+        env.pop(FRAMES_ENV, None)
+    return env
+
+
+class FrameCapture:
+    """
+    以 cv2.VideoCapture 的接口逐帧返回帧存储中的帧
+
+    返回的是内存映射的只读视图，不复制；Wav2Lip在写入前会先复制帧，
+    误写共享帧时会直接报错而不会改动其他进程看到的数据
+    """
+
+    def __init__(self, frames: Frames, cv2: Any):
+        self.frames = frames
+        self.position = 0
+        width, height = frames.size
+        self.properties = {
+            cv2.CAP_PROP_FPS: frames.fps,
+            cv2.CAP_PROP_FRAME_COUNT: len(frames),
+            cv2.CAP_PROP_FRAME_WIDTH: width,
+            cv2.CAP_PROP_FRAME_HEIGHT: height,
+        }
+
+    def isOpened(self) -> bool:
+        return True
+
+    def read(self):
+        if self.position >= len(self.frames):
+            return False, None
+        frame = self.frames[self.position]
+        self.position += 1
+        return True, frame
+
+    def get(self, prop: int) -> float:
+        return float(self.properties.get(prop, 0))
+
+    def release(self) -> None:
+        # 帧在进程退出前一直保持打开，共享锁防止运行期间被清理
+        pass
+
+
+def install(frames: Frames, cv2: Any) -> None:
+    """替换 cv2.VideoCapture：打开帧文件对应的源视频时读取帧存储，其他路径仍交给OpenCV"""
+    original = cv2.VideoCapture
+    source = frames.header.get("source")
+
+    def video_capture(path, *args, **kwargs):
+        if not args and not kwargs and isinstance(path, str) and os.path.realpath(path) == source:
+            return FrameCapture(frames, cv2)
+        return original(path, *args, **kwargs)
+
+    cv2.VideoCapture = video_capture
+
+
+def scale_box(args: List[str], header: Dict[str, Any]) -> List[str]:
+    """帧按缩小的工作分辨率解码时，将 --box 的像素坐标（上 下 左 右）从源分辨率换算到工作分辨率"""
+    if "--box" not in args:
+        return args
+    x_scale = header["width"] / header.get("source_width", header["width"])
+    y_scale = header["height"] / header.get("source_height", header["height"])
+    if x_scale == 1 and y_scale == 1:
+        return args
+    args = list(args)
+    start = args.index("--box") + 1
+    for offset, scale in enumerate((y_scale, y_scale, x_scale, x_scale)):
+        value = int(args[start + offset])
+        # Wav2Lip以 -1 表示未指定人脸框
+        args[start + offset] = str(value if value < 0 else int(round(value * scale)))
+    return args
+
+
+def main(argv: List[str]) -> None:
+    """运行Wav2Lip推理脚本，设置了 VOICE_EMBEDDING_FRAMES 时从帧存储读取源视频的帧"""
+    script, args = os.path.abspath(argv[0]), list(argv[1:])
+    frames = None
+    if os.environ.get(FRAMES_ENV):
+        try:
+            frames = open_frames()
+        except (OSError, ValueError) as e:
+            print(f"无法打开帧文件，由推理脚本自行解码: {str(e)}")
+    if frames is not None:
+        import cv2
+        install(frames, cv2)
+        args = scale_box(args, frames.header)
+
+    sys.argv = [script] + args
+    # 与直接运行脚本相同，脚本目录位于模块搜索路径的最前面
+    sys.path.insert(0, os.path.dirname(script))
+    runpy.run_path(script, run_name="__main__")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python -m framestore.wav2lip <Wav2Lip/inference.py> [inference.py 的参数...]")
+        sys.exit(1)
+    main(sys.argv[1:])
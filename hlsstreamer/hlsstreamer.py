@@ -0,0 +1,396 @@
+import os
+import re
+import math
+import time
+import struct
+import subprocess
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable
+
+from tracing.tracing import get_tracer, run
+from scheduler.scheduler import ffmpeg_threads
+
+
+# 需要递归解析子box的MP4容器box
+_CONTAINER_BOXES = {"moov", "trak", "mdia", "moof", "traf"}
+
+
+def _iter_boxes(data: bytes, start: int, end: int):
+    """遍历 [start, end) 范围内的MP4 box，产出 (偏移, 大小, 类型, 头部长度)"""
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[offset:offset + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[offset + 8:offset + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            break
+        yield offset, size, kind.decode("latin-1"), header
+        offset += size
+
+
+def _track_timescales(init_path: str) -> Dict[int, int]:
+    """从fMP4初始化分片中读取每个轨道的时间刻度 {track_id: timescale}"""
+    with open(init_path, "rb") as f:
+        data = f.read()
+    timescales = {}
+
+    def walk(start: int, end: int, track_id: Optional[int]) -> Optional[int]:
+        for offset, size, kind, header in _iter_boxes(data, start, end):
+            body = offset + header
+            if kind == "tkhd":
+                # version 1 使用64位的创建/修改时间
+                track_id = struct.unpack(">I", data[body + (20 if data[body] == 1 else 12):][:4])[0]
+            elif kind == "mdhd" and track_id is not None:
+                timescales[track_id] = struct.unpack(">I", data[body + (20 if data[body] == 1 else 12):][:4])[0]
+            elif kind in _CONTAINER_BOXES:
+                track_id = walk(body, offset + size, None if kind == "trak" else track_id)
+        return track_id
+
+    walk(0, len(data), None)
+    return timescales
+
+
+def _shift_fragment(segment_path: str, offset_seconds: float, timescales: Dict[int, int]) -> None:
+    """
+    平移fMP4分片的解码时间戳（tfdt和sidx），使各分块的时间轴首尾相接
+
+    每个分块由独立的FFmpeg进程编码，时间戳都从0开始；平移后所有分块可以共用
+    同一个初始化分片，播放器按连续的时间轴播放
+    """
+    with open(segment_path, "rb") as f:
+        data = bytearray(f.read())
+
+    def shift(position: int, wide: bool, timescale: int) -> None:
+        fmt = ">Q" if wide else ">I"
+        width = 8 if wide else 4
+        value = struct.unpack(fmt, data[position:position + width])[0]
+        data[position:position + width] = struct.pack(fmt, value + int(round(offset_seconds * timescale)))
+
+    for offset, size, kind, header in _iter_boxes(data, 0, len(data)):
+        body = offset + header
+        if kind == "sidx":
+            reference_id, timescale = struct.unpack(">II", data[body + 4:body + 12])
+            shift(body + 12, data[body] == 1, timescale)
+        elif kind == "moof":
+            for traf, traf_size, traf_kind, traf_header in _iter_boxes(data, body, offset + size):
+                if traf_kind != "traf":
+                    continue
+                track_id = None
+                for box, _, box_kind, box_header in _iter_boxes(data, traf + traf_header, traf + traf_size):
+                    box_body = box + box_header
+                    if box_kind == "tfhd":
+                        track_id = struct.unpack(">I", data[box_body + 4:box_body + 8])[0]
+                    elif box_kind == "tfdt" and track_id in timescales:
+                        shift(box_body + 4, data[box_body] == 1, timescales[track_id])
+
+    with open(segment_path, "wb") as f:
+        f.write(data)
+
+
+class ProgressiveHLS:
+    """渐进式HLS输出工具，按时间顺序分块处理视频，每块完成后立即写入fMP4分片并更新播放列表"""
+
+    def __init__(self, output_dir: str, chunk_seconds: float = 6.0, ffmpeg_path: Optional[str] = None,
+                 workers: int = 1, recognizer: Optional[Any] = None, translator: Optional[Any] = None,
+                 synthesizer: Optional[Any] = None, lip_sync: Optional[Any] = None):
+        self.output_dir = output_dir
+        self.chunk_seconds = chunk_seconds
+        self.ffmpeg_path = ffmpeg_path or "ffmpeg"
+        self.workers = max(1, workers)  # 同时处理的分块数，分片仍按时间顺序发布
+        self.recognizer = recognizer
+        self.translator = translator
+        self.synthesizer = synthesizer
+        self.lip_sync = lip_sync
+        self.playlist_path = os.path.join(output_dir, "playlist.m3u8")
+        # 目标时长必须在播放开始前确定，且不小于任何分片时长（四舍五入后）
+        self.target_duration = int(math.ceil(chunk_seconds + 0.5))
+        self.segments: List[Dict[str, Any]] = []
+
+    def _load_tools(self) -> None:
+        """按需创建默认的工具实例"""
+        if self.recognizer is None:
+            from speechrecognizer.speechrecognizer import SpeechRecognizer
+            self.recognizer = SpeechRecognizer(model_path=os.environ.get("VOSK_MODEL_PATH"))
+        if self.translator is None:
+            from texttranslator.texttranslator import TextTranslator
+            self.translator = TextTranslator(os.environ.get("BAIDU_APP_ID"), os.environ.get("BAIDU_APP_KEY"))
+        if self.synthesizer is None:
+            from speechsynthesizer.speechsynthesizer import SpeechSynthesizer
+            self.synthesizer = SpeechSynthesizer(os.environ.get("XFYUN_APP_ID"), os.environ.get("XFYUN_API_KEY"))
+        if self.lip_sync is None:
+            from lipsync.lipsync import LipSync
+            self.lip_sync = LipSync(model_path=os.environ.get("WAV2LIP_CHECKPOINT"))
+            if os.environ.get("WAV2LIP_PATH"):
+                self.lip_sync.set_wav2lip_path(os.environ["WAV2LIP_PATH"])
+
+    def _run(self, cmd: List[str]) -> subprocess.CompletedProcess:
+        """执行FFmpeg命令，失败时抛出 CalledProcessError"""
+        return run(cmd, check=True, capture_output=True, text=True)
+
+    def probe_duration(self, video_path: str) -> float:
+        """
+        获取视频时长（秒）
+
+        Args:
+            video_path: 输入视频文件路径
+
+        Returns:
+            视频时长，无法解析时返回0
+        """
+        from mediaprobe.mediaprobe import get_media_probe
+        info = get_media_probe().probe(video_path)
+        if info is not None and info.duration > 0:
+            return info.duration
+        # 没有ffprobe时从 ffmpeg -i 的输出中解析
+        result = subprocess.run([self.ffmpeg_path, "-hide_banner", "-i", video_path],
+                                capture_output=True, text=True)
+        match = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+        if not match:
+            return 0.0
+        hours, minutes, seconds = match.groups()
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    def make_test_source(self, output_path: str, duration: float = 20.0,
+                         size: str = "640x360", rate: int = 25) -> str:
+        """
+        使用FFmpeg的testsrc和sine生成本地测试视频
+
+        Args:
+            output_path: 输出视频文件路径
+            duration: 时长（秒）
+            size: 分辨率
+            rate: 帧率
+
+        Returns:
+            输出视频文件路径
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        self._run([
+            self.ffmpeg_path, "-y",
+            "-f", "lavfi", "-i", f"testsrc=duration={duration}:size={size}:rate={rate}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+            "-c:v", "libx264", "-pix_fmt", "yuv420p", "-preset", "veryfast",
+            "-c:a", "aac", "-shortest",
+            *ffmpeg_threads(),
+            output_path
+        ])
+        return output_path
+
+    def _cut_chunk(self, video_path: str, start: float, duration: float, chunk_dir: str) -> Dict[str, str]:
+        """截取一个分块的视频和音频，视频重新编码以保证切点精确"""
+        chunk_video = os.path.join(chunk_dir, "source.mp4")
+        chunk_audio = os.path.join(chunk_dir, "source.wav")
+        self._run([
+            self.ffmpeg_path, "-y",
+            "-ss", f"{start:.3f}", "-t", f"{duration:.3f}",
+            "-i", video_path,
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-c:a", "aac",
+            *ffmpeg_threads(),
+            chunk_video
+        ])
+        try:
+            self._run([
+                self.ffmpeg_path, "-y",
+                "-i", chunk_video,
+                "-vn", "-acodec", "pcm_s16le", "-ar", "16000", "-ac", "1",
+                chunk_audio
+            ])
+        except subprocess.CalledProcessError:
+            chunk_audio = ""  # 源视频没有音轨
+        return {"video": chunk_video, "audio": chunk_audio}
+
+    def _encode_segment(self, index: int, start: float, video_path: str,
+                        audio_path: Optional[str]) -> List[Dict[str, Any]]:
+        """将分块编码为fMP4分片，返回该分块包含的分片列表"""
+        init_name = f"init_{index:05d}.mp4"
+        segment_pattern = f"seg_{index:05d}_%03d.m4s"
+        chunk_playlist = os.path.join(self.output_dir, f".chunk_{index:05d}.m3u8")
+
+        cmd = [self.ffmpeg_path, "-y", "-i", video_path]
+        if audio_path:
+            cmd += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0"]
+        else:
+            cmd += ["-map", "0:v:0", "-map", "0:a:0?"]
+        cmd += [
+            "-t", f"{self.chunk_seconds:.3f}",
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-ar", "44100", "-ac", "2",
+            "-f", "hls",
+            "-hls_time", str(self.target_duration * 2),  # 每个分块只生成一个分片
+            "-hls_list_size", "0",
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", init_name,
+            "-hls_segment_filename", os.path.join(self.output_dir, segment_pattern),
+            *ffmpeg_threads(),
+            chunk_playlist
+        ]
+        self._run(cmd)
+
+        segments = []
+        duration = None
+        with open(chunk_playlist) as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("#EXTINF:"):
+                    duration = float(line[len("#EXTINF:"):].rstrip(",").split(",")[0])
+                elif line and not line.startswith("#") and duration is not None:
+                    segments.append({"init": init_name, "uri": os.path.basename(line), "duration": duration})
+                    duration = None
+        os.remove(chunk_playlist)
+
+        # 时间戳接续在前一分块之后，播放器可以无缝衔接
+        timescales = _track_timescales(os.path.join(self.output_dir, init_name))
+        for segment in segments:
+            _shift_fragment(os.path.join(self.output_dir, segment["uri"]), start, timescales)
+        return segments
+
+    def _process_chunk(self, video_path: str, index: int, start: float, duration: float) -> List[Dict[str, Any]]:
+        """对一个分块执行识别、翻译、语音合成、口型同步和分片编码"""
+        with get_tracer().span("ProgressiveHLS.chunk", index=index, start=start):
+            return self._process_chunk_stages(video_path, index, start, duration)
+
+    def _process_chunk_stages(self, video_path: str, index: int, start: float, duration: float) -> List[Dict[str, Any]]:
+        chunk_dir = os.path.join(self.output_dir, "work", f"chunk_{index:05d}")
+        os.makedirs(chunk_dir, exist_ok=True)
+        source = self._cut_chunk(video_path, start, duration, chunk_dir)
+
+        dubbed_audio = ""
+        if source["audio"]:
+            text = self.recognizer.recognize(source["audio"])
+            translated = self.translator.translate(text)
+            dubbed_audio = self.synthesizer.synthesize(translated, os.path.join(chunk_dir, "speech.wav"))
+
+        synced_video = ""
+        if dubbed_audio:
+            synced_video = self.lip_sync.synchronize(source["video"], dubbed_audio,
+                                                     os.path.join(chunk_dir, "synced.mp4"))
+
+        # 上游工具可能输出占位文件，编码失败时依次退回到原始画面和原始音轨
+        candidates = [
+            (synced_video or source["video"], dubbed_audio or None),
+            (source["video"], dubbed_audio or None),
+            (source["video"], None),
+        ]
+        # 口型同步或语音合成失败时候选项会重复，去重后同一失败的编码只执行一次
+        attempts = list(dict.fromkeys(candidates))
+        last_error = None
+        for attempt_video, attempt_audio in attempts:
+            try:
+                return self._encode_segment(index, start, attempt_video, attempt_audio)
+            except subprocess.CalledProcessError as e:
+                last_error = e
+        raise last_error
+
+    def _publish(self, segments: List[Dict[str, Any]]) -> None:
+        """
+        将一个分块的分片加入播放列表
+        各分块编码参数相同时初始化分片内容一致，复用上一个初始化分片，避免不必要的不连续标记
+        """
+        if self.segments and segments:
+            previous = os.path.join(self.output_dir, self.segments[-1]["init"])
+            current = os.path.join(self.output_dir, segments[0]["init"])
+            with open(previous, "rb") as f1, open(current, "rb") as f2:
+                same = f1.read() == f2.read()
+            if same:
+                os.remove(current)
+                for segment in segments:
+                    segment["init"] = self.segments[-1]["init"]
+        self.segments.extend(segments)
+
+    def _write_playlist(self, finished: bool = False) -> None:
+        """原子地重写播放列表，播放器总能读到完整的文件"""
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:7",
+            f"#EXT-X-TARGETDURATION:{self.target_duration}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+        ]
+        current_init = None
+        for segment in self.segments:
+            if segment["init"] != current_init:
+                # 编码参数发生变化时需要切换初始化分片并标记不连续
+                if current_init is not None:
+                    lines.append("#EXT-X-DISCONTINUITY")
+                lines.append(f'#EXT-X-MAP:URI="{segment["init"]}"')
+                current_init = segment["init"]
+            lines.append(f"#EXTINF:{segment['duration']:.3f},")
+            lines.append(segment["uri"])
+        if finished:
+            lines.append("#EXT-X-ENDLIST")
+
+        temp_path = self.playlist_path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, self.playlist_path)
+
+    def process(self, video_path: str,
+                on_segment: Optional[Callable[[int, str], None]] = None) -> str:
+        """
+        分块处理视频并渐进式输出HLS
+
+        Args:
+            video_path: 输入视频文件路径
+            on_segment: 每个分块发布后的回调，参数为 (分块序号, 播放列表路径)
+
+        Returns:
+            播放列表路径，失败时返回空字符串
+        """
+        total = self.probe_duration(video_path)
+        if total <= 0:
+            print(f"无法获取视频时长: {video_path}")
+            return ""
+
+        self._load_tools()
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.segments = []
+        self._write_playlist()
+
+        n_chunks = int(math.ceil(total / self.chunk_seconds))
+        print(f"渐进式输出: {total:.1f}秒, {n_chunks} 个分块, 每块 {self.chunk_seconds} 秒")
+        began = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = []
+            for index in range(n_chunks):
+                start = index * self.chunk_seconds
+                duration = min(self.chunk_seconds, total - start)
+                # 线程池不会传递contextvars，每个分块在调用方上下文的副本中执行，
+                # 分块内的FFmpeg和子进程沿用调用方的资源预留和追踪span
+                context = contextvars.copy_context()
+                futures.append(executor.submit(context.run, self._process_chunk, video_path, index, start, duration))
+
+            # 按时间顺序发布分片，后面的分块即使先完成也要等待前面的分块
+            for index, future in enumerate(futures):
+                try:
+                    self._publish(future.result())
+                except Exception as e:
+                    print(f"分块 {index} 处理失败: {str(e)}")
+                    for pending in futures[index + 1:]:
+                        pending.cancel()
+                    self._write_playlist(finished=True)
+                    return ""
+                self._write_playlist()
+                if index == 0:
+                    print(f"首个分片已可播放，耗时 {time.perf_counter() - began:.2f} 秒")
+                if on_segment is not None:
+                    on_segment(index, self.playlist_path)
+
+        self._write_playlist(finished=True)
+        print(f"渐进式输出完成: {self.playlist_path}")
+        return self.playlist_path
+
+
+if __name__ == "__main__":
+    # 使用示例：用FFmpeg生成测试视频并渐进式输出
+    streamer = ProgressiveHLS("output/hls", chunk_seconds=4.0)
+    source = streamer.make_test_source("output/test_source.mp4", duration=12.0)
+    playlist = streamer.process(source, on_segment=lambda i, path: print(f"分块 {i} 已发布: {path}"))
+    print(f"播放列表: {playlist}")
@@ -0,0 +1,71 @@
+import sys
+import time
+import types
+import threading
+import importlib
+import importlib.util
+from typing import Dict
+
+# 各模块真正导入的耗时（秒），用于启动性能分析
+import_seconds: Dict[str, float] = {}
+
+
+class LazyModule(types.ModuleType):
+    """
+    延迟导入的模块代理
+
+    首次访问属性时才真正导入，之后将模块属性复制到代理上，后续访问不再经过 __getattr__；
+    多个线程同时首次访问时只有一个线程导入，其余线程等待导入完成
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_loaded"] = False
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self) -> types.ModuleType:
+        name = self.__name__
+        with self.__dict__["_lazy_lock"]:
+            if self.__dict__["_lazy_loaded"]:
+                return sys.modules[name]
+            if name in sys.modules:
+                # 其他线程正在导入时 sys.modules 中是尚未初始化完的模块，
+                # 经由 import_module 获取，它会等待导入完成
+                module = importlib.import_module(name)
+            else:
+                from tracing.tracing import get_tracer
+                start = time.perf_counter()
+                with get_tracer().span(f"import:{name}", "import"):
+                    module = importlib.import_module(name)
+                import_seconds[name] = time.perf_counter() - start
+            self.__dict__.update(module.__dict__)
+            self.__dict__["_lazy_loaded"] = True
+        return module
+
+    def __getattr__(self, attr: str):
+        if self.__dict__["_lazy_loaded"]:
+            raise AttributeError(f"module '{self.__name__}' has no attribute '{attr}'")
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__["_lazy_loaded"] else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    返回延迟导入的模块，已导入时直接返回模块本身
+
+    用法: requests = lazy_import("requests")
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
+def is_available(name: str) -> bool:
+    """检查模块是否已安装，不会执行模块代码（例如不会初始化TensorFlow）"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
@@ -1,21 +1,154 @@
 import os
 import subprocess
 import time
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, Sequence
+
+from tracing.tracing import traced, add_bytes, file_size, run
+from lazyimport.lazyimport import lazy_import
+from scheduler.scheduler import ffmpeg_threads
+
+asyncio = lazy_import("asyncio")
 
 class LipSync:
     """口型同步工具，使用Wav2Lip进行口型合成"""
     
-    def __init__(self, model_path: Optional[str] = None, device: str = "cpu"):
+    def __init__(self, model_path: Optional[str] = None, device: str = "cpu",
+                 registry: Optional[Any] = None, frame_store: Optional[Any] = None,
+                 frame_height: Optional[int] = None):
         self.model_path = model_path
         self.device = device
         self.wav2lip_path = None  # Wav2Lip项目路径
+        self.registry = registry  # 可选的ModelRegistry，为Wav2Lip子进程预留内存
+        self.frame_store = frame_store  # 可选的FrameStore，同一源视频只解码一次
+        self.frame_height = frame_height  # 帧存储的工作分辨率高度，None表示保持原分辨率
     
     def set_wav2lip_path(self, wav2lip_path: str) -> None:
         """设置Wav2Lip项目路径"""
         self.wav2lip_path = wav2lip_path
     
-    def synchronize(self, video_path: str, audio_path: str, output_path: str) -> str:
+    def get_checkpoint_path(self) -> Optional[str]:
+        """返回Wav2Lip模型文件路径"""
+        if self.model_path:
+            return self.model_path
+        if self.wav2lip_path:
+            return os.path.join(self.wav2lip_path, "checkpoints", "wav2lip_gan.pth")
+        return None
+    
+    def _reserve_memory(self) -> Optional[str]:
+        """
+        在注册表中为Wav2Lip预留内存
+        Wav2Lip在子进程中加载模型，注册表据此先卸载进程内最久未使用的模型，
+        避免子进程与Spleeter、Vosk同时常驻导致内存不足
+
+        Returns:
+            预留使用的注册表键，未使用注册表时返回None
+        """
+        if self.registry is None:
+            return None
+        from modelregistry.modelregistry import path_size_mb
+        checkpoint = self.get_checkpoint_path()
+        key = f"wav2lip:{checkpoint}"
+        # 推理时除模型权重外还需加载人脸检测模型和PyTorch运行时
+        size_mb = max(path_size_mb(checkpoint) * 3, 1500)
+        self.registry.register(key, lambda: checkpoint, size_mb=size_mb)
+        # 子进程运行期间固定预留，其他工具加载模型时不会将其卸载
+        self.registry.acquire(key)
+        return key
+    
+    def _release_memory(self, key: Optional[str]) -> None:
+        """
+        子进程结束后解除固定；预留留在注册表中，需要空间时由LRU卸载，
+        因此连续的口型同步不会每次都计为一次加载和卸载
+        """
+        if key is None:
+            return
+        self.registry.unpin(key)
+    
+    @staticmethod
+    def _close_frames(frames_env: Tuple[Optional[Any], Optional[Dict[str, str]]]) -> None:
+        """关闭 _frames_env() 打开的帧"""
+        frames, _ = frames_env
+        if frames is not None:
+            frames.close()
+    
+    def get_frames(self, video_path: str) -> Any:
+        """
+        获取源视频按工作分辨率解码后的帧（只读内存映射），需要先设置frame_store
+        
+        Returns:
+            framestore.Frames，使用完毕后应调用 close()
+        """
+        if self.frame_store is None:
+            raise ValueError("未设置frame_store")
+        return self.frame_store.get(video_path, self.frame_height)
+    
+    def _frames_env(self, video_path: str) -> Tuple[Optional[Any], Optional[Dict[str, str]]]:
+        """
+        为Wav2Lip子进程准备帧存储
+        
+        返回打开的帧（子进程运行期间持有，防止被清理）和适配器子进程的环境变量；
+        设置frame_store时Wav2Lip经 framestore.wav2lip 适配器运行，直接读取已解码的帧
+        """
+        if self.frame_store is None:
+            return None, None
+        from framestore.wav2lip import adapter_env
+        try:
+            frames = self.get_frames(video_path)
+        except Exception as e:
+            print(f"帧存储不可用，由Wav2Lip自行解码: {str(e)}")
+            return None, adapter_env()
+        return frames, adapter_env(frames.path)
+    
+    def _build_command(self, video_path: str, audio_path: str, output_path: str,
+                       box: Optional[Sequence[int]] = None) -> List[str]:
+        """
+        构建Wav2Lip推理命令，指定box时只对该位置的人脸做口型同步
+        
+        设置frame_store时经适配器运行，推理脚本从帧存储读取源视频的帧而不再自行解码
+        """
+        model_path = self.get_checkpoint_path()
+        checkpoint_dir = os.path.dirname(model_path)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        
+        script = os.path.join(self.wav2lip_path, "inference.py")
+        args = [
+            "--checkpoint_path", model_path,
+            "--face", video_path,
+            "--audio", audio_path,
+            "--outfile", output_path
+        ]
+        
+        if self.device == "gpu":
+            args.append("--pads")
+            args.extend(["0", "0", "0", "0"])
+        else:
+            args.extend(["--nosmooth", "--resize_factor", "1"])
+        if box:
+            # Wav2Lip的固定人脸框，顺序为 上 下 左 右（像素）
+            args.extend(["--box"] + [str(int(v)) for v in box])
+        if self.frame_store is not None:
+            from framestore.wav2lip import adapter_command
+            return adapter_command(script, args)
+        return ["python", script] + args
+    
+    @staticmethod
+    def _build_mock_command(video_path: str, audio_path: str, output_path: str) -> List[str]:
+        """构建模拟口型同步使用的FFmpeg合并命令"""
+        return [
+            "ffmpeg", "-y",
+            "-i", video_path,
+            "-i", audio_path,
+            "-c:v", "copy",
+            "-map", "0:v:0",
+            "-map", "1:a:0",
+            "-shortest",
+            *ffmpeg_threads(),
+            output_path
+        ]
+    
+    @traced("LipSync.synchronize")
+    def synchronize(self, video_path: str, audio_path: str, output_path: str,
+                    box: Optional[Sequence[int]] = None) -> str:
         """
         将音频与视频进行口型同步
         
@@ -23,6 +156,7 @@ class LipSync:
             video_path: 输入视频文件路径
             audio_path: 输入音频文件路径
             output_path: 输出视频文件路径
+            box: 说话人的人脸框 [上, 下, 左, 右]，多人画面中按说话人分别同步时使用
             
         Returns:
             输出视频文件路径
@@ -32,41 +166,26 @@ class LipSync:
         
         if self.wav2lip_path and os.path.exists(self.wav2lip_path):
             try:
-                # 构建Wav2Lip命令
-                model_path = self.model_path or os.path.join(self.wav2lip_path, "checkpoints", "wav2lip_gan.pth")
-                checkpoint_dir = os.path.dirname(model_path)
-                os.makedirs(checkpoint_dir, exist_ok=True)
-                
-                cmd = [
-                    "python",
-                    os.path.join(self.wav2lip_path, "inference.py"),
-                    "--checkpoint_path", model_path,
-                    "--face", video_path,
-                    "--audio", audio_path,
-                    "--outfile", output_path
-                ]
-                
-                if self.device == "gpu":
-                    cmd.append("--pads")
-                    cmd.extend(["0", "0", "0", "0"])
-                else:
-                    cmd.extend(["--nosmooth", "--resize_factor", "1"])
+                cmd = self._build_command(video_path, audio_path, output_path, box)
                 
                 # 执行命令
                 print(f"执行口型同步命令: {' '.join(cmd)}")
-                process = subprocess.Popen(
-                    cmd, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                stdout, stderr = process.communicate()
+                reservation, frames = None, None
+                try:
+                    reservation = self._reserve_memory()
+                    frames, env = self._frames_env(video_path)
+                    process = run(cmd, capture_output=True, text=True, env=env)
+                finally:
+                    if frames is not None:
+                        frames.close()
+                    self._release_memory(reservation)
                 
                 if process.returncode != 0:
-                    print(f"口型同步失败，错误信息: {stderr}")
+                    print(f"口型同步失败，错误信息: {process.stderr}")
                     # 使用模拟处理
                 else:
                     print(f"口型同步成功: {output_path}")
+                    add_bytes(read=file_size(video_path) + file_size(audio_path), written=file_size(output_path))
                     return output_path
             except Exception as e:
                 print(f"执行口型同步时出错: {str(e)}")
@@ -79,19 +198,10 @@ class LipSync:
         try:
             # 使用FFmpeg简单合并视频和音频作为模拟
             if os.path.exists(video_path) and os.path.exists(audio_path):
-                cmd = [
-                    "ffmpeg", "-y",
-                    "-i", video_path,
-                    "-i", audio_path,
-                    "-c:v", "copy",
-                    "-map", "0:v:0",
-                    "-map", "1:a:0",
-                    "-shortest",
-                    output_path
-                ]
+                cmd = self._build_mock_command(video_path, audio_path, output_path)
                 
                 print(f"执行模拟合成命令: {' '.join(cmd)}")
-                subprocess.run(cmd, check=True, capture_output=True)
+                run(cmd, check=True, capture_output=True)
             else:
                 # 如果文件不存在，创建一个空文件
                 with open(output_path, "w") as f:
@@ -105,6 +215,74 @@ class LipSync:
             
         return output_path
     
+    @traced("LipSync.synchronize_async")
+    async def synchronize_async(self, video_path: str, audio_path: str, output_path: str,
+                                timeout: Optional[float] = None,
+                                box: Optional[Sequence[int]] = None) -> str:
+        """
+        异步将音频与视频进行口型同步
+        
+        Wav2Lip和FFmpeg以asyncio子进程运行，超时或任务取消时子进程会被终止
+        
+        Args:
+            video_path: 输入视频文件路径
+            audio_path: 输入音频文件路径
+            output_path: 输出视频文件路径
+            timeout: 超时时间（秒）
+            box: 说话人的人脸框 [上, 下, 左, 右]
+            
+        Returns:
+            输出视频文件路径
+        """
+        from aioutils.aioutils import run_command, to_thread_owned
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        
+        if self.wav2lip_path and os.path.exists(self.wav2lip_path):
+            try:
+                cmd = self._build_command(video_path, audio_path, output_path, box)
+                print(f"执行口型同步命令: {' '.join(cmd)}")
+                reservation, frames = None, None
+                try:
+                    # 预留内存和解码帧都可能耗时，在线程中执行以免阻塞事件循环；
+                    # 期间任务被取消时，线程完成后立即释放其获得的预留和帧
+                    reservation = await to_thread_owned(self._reserve_memory, self._release_memory)
+                    frames, env = await to_thread_owned(self._frames_env, self._close_frames, video_path)
+                    result = await run_command(cmd, timeout=timeout, env=env)
+                finally:
+                    if frames is not None:
+                        frames.close()
+                    self._release_memory(reservation)
+                
+                if result.returncode == 0:
+                    print(f"口型同步成功: {output_path}")
+                    add_bytes(read=file_size(video_path) + file_size(audio_path), written=file_size(output_path))
+                    return output_path
+                print(f"口型同步失败，错误信息: {result.stderr}")
+            except subprocess.TimeoutExpired:
+                # 超时说明Wav2Lip已经用完时间预算，不再用模拟结果冒充成功
+                print(f"口型同步超时: {timeout}秒")
+                return ""
+            except Exception as e:
+                # 与 synchronize() 相同：其他错误退回模拟处理
+                print(f"执行口型同步时出错: {str(e)}")
+        
+        print("使用模拟口型同步")
+        try:
+            if os.path.exists(video_path) and os.path.exists(audio_path):
+                cmd = self._build_mock_command(video_path, audio_path, output_path)
+                print(f"执行模拟合成命令: {' '.join(cmd)}")
+                await run_command(cmd, timeout=timeout, check=True)
+            else:
+                with open(output_path, "w") as f:
+                    f.write(f"模拟口型同步结果: 视频={video_path}, 音频={audio_path}")
+                await asyncio.sleep(2)  # 模拟处理时间
+            print(f"模拟口型同步完成: {output_path}")
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"模拟口型同步失败: {str(e)}")
+            return ""
+        
+        return output_path
+    
     def install_requirements(self) -> bool:
         """安装Wav2Lip依赖"""
         if not self.wav2lip_path:
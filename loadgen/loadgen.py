@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import argparse
+import contextlib
+import contextvars
+from typing import Optional, Dict, Any, List, Iterator
+
+import main
+from texttranslator.texttranslator import TextTranslator
+from speechsynthesizer.speechsynthesizer import SpeechSynthesizer
+from scheduler.scheduler import ResourceScheduler
+from fakeapis.fakeapis import add_server_arguments, server_from_args, tone_wav
+
+SAMPLE_TEXT = "これは日本語の音声サンプルです。音声認識テストです。"
+
+# 当前任务的结果记录；asyncio.to_thread 会复制上下文，线程中执行的阶段也能取到
+_current_job: contextvars.ContextVar = contextvars.ContextVar("loadgen_job", default=None)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """线性插值计算百分位数，p取0到100"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    """延迟统计（毫秒）"""
+    if not values:
+        return {}
+    return {
+        "p50": round(percentile(values, 50) * 1000, 1),
+        "p90": round(percentile(values, 90) * 1000, 1),
+        "p99": round(percentile(values, 99) * 1000, 1),
+        "mean": round(sum(values) / len(values) * 1000, 1),
+        "max": round(max(values) * 1000, 1),
+    }
+
+
+def error_key(provider: str, error: BaseException) -> str:
+    """
+    错误分类：API返回的错误按 提供方:错误码 归类（例如 baidu:54003、xfyun:11202、xfyun:401），
+    超时和其他异常按异常类型归类
+    """
+    if isinstance(error, (asyncio.TimeoutError, socket.timeout)):
+        return f"{provider}:timeout"
+    code = getattr(error, "code", None)
+    if code is not None:
+        return f"{provider}:{code}"
+    return f"{provider}:{type(error).__name__}"
+
+
+@contextlib.contextmanager
+def _patched(module: Any, replacements: Dict[str, Any]) -> Iterator[None]:
+    """临时替换模块中的函数，退出时恢复"""
+    originals = {name: getattr(module, name) for name in replacements}
+    for name, value in replacements.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(module, name, value)
+
+
+class LoadGenerator:
+    """
+    以固定并发数驱动 main.run_jobs_async 流水线，统计吞吐量、延迟分布和按API错误码分类的错误
+
+    人声分离、说话人聚类、语音识别、口型同步和视频合成替换为立即完成的模拟阶段，
+    翻译和语音合成经由流水线原有的调用方式（线程中的同步调用）访问真实或模拟的API
+    """
+
+    def __init__(self, jobs: int = 100, concurrency: int = 10, output_dir: str = "output/loadgen",
+                 translator: Optional[TextTranslator] = None,
+                 synthesizer: Optional[SpeechSynthesizer] = None,
+                 text: str = SAMPLE_TEXT, scheduler: Optional[ResourceScheduler] = None,
+                 stage_timeout: Optional[float] = None):
+        """
+        初始化负载生成器
+
+        Args:
+            jobs: 任务总数
+            concurrency: 同时进行的任务数
+            output_dir: 各任务输出目录的上级目录
+            translator: 翻译工具，默认按环境变量以严格模式创建
+            synthesizer: 语音合成工具，默认按环境变量以严格模式创建
+            text: 每个任务识别出的文本
+            scheduler: 传给流水线的资源调度器，None表示不做资源预留
+            stage_timeout: 传给流水线的阶段超时时间（秒）
+        """
+        self.jobs = jobs
+        self.concurrency = concurrency
+        self.output_dir = output_dir
+        # 严格模式：API调用失败时抛出异常而不是返回模拟结果，否则测到的是模拟处理的耗时
+        self.translator = translator or TextTranslator(os.environ.get("BAIDU_APP_ID"), os.environ.get("BAIDU_APP_KEY"),
+                                                       strict=True)
+        self.synthesizer = synthesizer or SpeechSynthesizer(os.environ.get("XFYUN_APP_ID"), os.environ.get("XFYUN_API_KEY"),
+                                                            strict=True)
+        self.text = text
+        self.scheduler = scheduler
+        self.stage_timeout = stage_timeout
+        self.results: List[Dict[str, Any]] = []
+
+    # ------------------------------------------------------------------
+    # 替换 main 中各阶段的实现，签名与 main 中的函数一致
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> str:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    async def _separate_audio(self, video_path: str, output_dir: str = "output",
+                              timeout: Optional[float] = None) -> str:
+        return self._write(os.path.join(output_dir, "vocals.wav"), tone_wav(1.0))
+
+    @staticmethod
+    def _diarize_speakers(audio_path: str) -> List[Dict[str, Any]]:
+        return [{"start": 0.0, "end": 1.0, "speaker": 0}]
+
+    def _recognize_speech(self, audio_path: str) -> str:
+        return self.text
+
+    def _call_api(self, stage: str, provider: str, call: Any) -> Any:
+        """执行一次API调用，将耗时和错误记录到当前任务，失败时返回None（流水线视为该阶段失败）"""
+        job = _current_job.get()
+        start = time.perf_counter()
+        try:
+            return call()
+        except Exception as e:
+            job["error"] = error_key(provider, e)
+            return None
+        finally:
+            job[stage] = time.perf_counter() - start
+
+    def _translate_text(self, text: str, target_language: str = "zh") -> Optional[str]:
+        return self._call_api("translate", "baidu", lambda: self.translator.translate(text, "jp", target_language))
+
+    def _synthesize_speech(self, text: str, output_audio_path: str = "output/translated_speech.wav",
+                           voice: str = main.TTS_VOICES[0]) -> Optional[str]:
+        return self._call_api("synthesize", "xfyun",
+                              lambda: self.synthesizer.synthesize(text, output_audio_path, voice) or None)
+
+    async def _lip_sync(self, original_video_path: str, translated_audio_path: str,
+                        output_video_path: str = "output/synced_video.mp4",
+                        timeout: Optional[float] = None, box: Optional[List[int]] = None) -> str:
+        return self._write(output_video_path, b"synced")
+
+    async def _combine_video_audio(self, synced_video_path: str, translated_audio_path: str,
+                                   final_output_path: str = "output/final_video.mp4",
+                                   timeout: Optional[float] = None) -> str:
+        return self._write(final_output_path, b"final")
+
+    def _pipeline(self, semaphore: asyncio.Semaphore) -> contextlib.AbstractContextManager:
+        """在 main 中装入模拟的媒体阶段，并为每个任务限制并发、记录结果"""
+        main_async = main.main_async
+
+        async def job(input_video: str, output_dir: str, *args: Any, **kwargs: Any) -> Optional[str]:
+            async with semaphore:
+                result: Dict[str, Any] = {"job": os.path.basename(output_dir), "ok": False}
+                _current_job.set(result)
+                start = time.perf_counter()
+                try:
+                    final = await main_async(input_video, output_dir, *args, **kwargs)
+                except Exception as e:
+                    result["error"] = result.get("error") or f"pipeline:{type(e).__name__}"
+                    final = None
+                result["total"] = time.perf_counter() - start
+                result["ok"] = final is not None
+                if not result["ok"]:
+                    result.setdefault("error", "pipeline:failed")
+                self.results.append(result)
+                return final
+
+        return _patched(main, {
+            "main_async": job,
+            "separate_audio_async": self._separate_audio,
+            "diarize_speakers": self._diarize_speakers,
+            "recognize_speech": self._recognize_speech,
+            "translate_text": self._translate_text,
+            "synthesize_speech": self._synthesize_speech,
+            "lip_sync_async": self._lip_sync,
+            "combine_video_audio_async": self._combine_video_audio,
+        })
+
+    async def run(self, quiet: bool = True) -> Dict[str, Any]:
+        """
+        运行全部任务并返回报告
+
+        Args:
+            quiet: 是否屏蔽工具类的逐条打印
+
+        Returns:
+            报告字典
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # 输入视频只作为路径传递，模拟的人声分离阶段不会读取
+        videos = [os.path.join(self.output_dir, f"input_{i:05d}.mp4") for i in range(self.jobs)]
+
+        self.results = []
+        redirect = contextlib.redirect_stdout(open(os.devnull, "w")) if quiet else contextlib.nullcontext()
+        start = time.perf_counter()
+        with redirect as stream, self._pipeline(semaphore):
+            await main.run_jobs_async(videos, self.output_dir, self.stage_timeout, self.scheduler)
+            if quiet:
+                stream.close()
+        duration = time.perf_counter() - start
+        return self.report(duration)
+
+    def report(self, duration: float) -> Dict[str, Any]:
+        """汇总吞吐量、延迟百分位数和错误分布"""
+        succeeded = [item for item in self.results if item["ok"]]
+        errors: Dict[str, int] = {}
+        for item in self.results:
+            if not item["ok"]:
+                errors[item["error"]] = errors.get(item["error"], 0) + 1
+        return {
+            "jobs": len(self.results),
+            "concurrency": self.concurrency,
+            "succeeded": len(succeeded),
+            "errors": errors,
+            "duration_s": round(duration, 3),
+            "throughput_jobs_per_s": round(len(succeeded) / duration, 2) if duration > 0 else 0.0,
+            "latency_ms": {
+                "total": latency_summary([item["total"] for item in succeeded]),
+                "translate": latency_summary([item["translate"] for item in self.results if "translate" in item]),
+                "synthesize": latency_summary([item["synthesize"] for item in self.results if "synthesize" in item]),
+            },
+        }
+
+
+async def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    """按命令行参数运行负载测试，默认在进程内启动模拟服务"""
+    server = None
+    if not args.external:
+        server = await server_from_args(args).start()
+        os.environ.update(server.env())
+        print(f"模拟API服务: {server.base_url}")
+
+    scheduler = ResourceScheduler() if args.scheduler else None
+    generator = LoadGenerator(args.jobs, args.concurrency, args.output_dir,
+                              scheduler=scheduler, stage_timeout=args.stage_timeout)
+    try:
+        report = await generator.run(quiet=not args.verbose)
+    finally:
+        if server is not None:
+            await server.stop()
+    if server is not None:
+        report["server"] = server.stats
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"任务数: {report['jobs']}，并发: {report['concurrency']}，成功: {report['succeeded']}，"
+          f"耗时: {report['duration_s']}s，吞吐量: {report['throughput_jobs_per_s']} 任务/秒")
+    for stage, stats in report["latency_ms"].items():
+        if stats:
+            print(f"  {stage:10s} p50={stats['p50']}ms p90={stats['p90']}ms p99={stats['p99']}ms max={stats['max']}ms")
+    if report["errors"]:
+        print(f"  错误: {report['errors']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以模拟媒体阶段驱动完整流水线的并发负载测试")
+    parser.add_argument("--jobs", type=int, default=200, help="任务总数")
+    parser.add_argument("--concurrency", type=int, default=20, help="同时进行的任务数")
+    parser.add_argument("--output-dir", default="output/loadgen", help="各任务输出目录的上级目录")
+    parser.add_argument("--scheduler", action="store_true", help="流水线各阶段经由资源调度器预留CPU和内存")
+    parser.add_argument("--stage-timeout", type=float, default=None, help="流水线的阶段超时时间（秒）")
+    parser.add_argument("--external", action="store_true",
+                        help="不启动模拟服务，使用环境变量中配置的接口地址和凭证")
+    parser.add_argument("--json", metavar="PATH", help="将报告写入JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="保留工具类的逐条打印")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
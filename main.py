@@ -1,19 +1,47 @@
 \
 import os
+import contextlib
 import subprocess
 
+from tracing.tracing import traced, run
+from lazyimport.lazyimport import lazy_import
+from scheduler.scheduler import ffmpeg_threads
+
+# Imported on first use so `--help` and the sync pipeline don't pay for it
+asyncio = lazy_import("asyncio")
+
 # Placeholder paths - replace with actual tool paths or installation methods
 SPLEETER_CMD = "spleeter"  # Assuming spleeter is in PATH
 VOSK_MODEL_PATH = "path/to/vosk/model" # Replace with your Vosk model path
 WAV2LIP_PATH = "path/to/Wav2Lip" # Replace with your Wav2Lip directory path
 FFMPEG_CMD = "ffmpeg" # Assuming ffmpeg is in PATH
+# Decode the source video once into the frame store and run Wav2Lip through framestore.wav2lip,
+# which serves it the decoded frames; every speaker's lip sync of the same video reuses them
+USE_FRAME_STORE = True
+FRAME_HEIGHT = None # Working height of the decoded frames; None keeps the source resolution
 
 # API Keys and Endpoints (Replace with your actual keys/endpoints if using APIs)
 TRANSLATION_API_KEY = "YOUR_TRANSLATION_API_KEY"
 TRANSLATION_ENDPOINT = "TRANSLATION_API_ENDPOINT"
 TTS_API_KEY = "YOUR_TTS_API_KEY"
 TTS_ENDPOINT = "TTS_API_ENDPOINT"
+# Xunfei TTS voices, handed out to the diarized speakers by talk time (longest first)
+TTS_VOICES = ["xiaoyan", "aisjiuxu", "aisxping", "aisjinger"]
 
+def _find_separated_audio(video_path, output_dir):
+    """
+    Finds the audio file generated by Spleeter (usually vocals.wav or accompaniment.wav).
+    """
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    audio_path = os.path.join(output_dir, base_name, "vocals.wav") # Adjust if needed
+    if not os.path.exists(audio_path):
+         audio_path = os.path.join(output_dir, base_name, "accompaniment.wav") # Fallback
+         if not os.path.exists(audio_path):
+             raise FileNotFoundError("Could not find separated audio file.")
+    return audio_path
+
+
+@traced("main.separate_audio")
 def separate_audio(video_path, output_dir="output"):
     """
     Separates audio from video using Spleeter.
@@ -23,14 +51,8 @@ def separate_audio(video_path, output_dir="output"):
     # Example: spleeter separate -p spleeter:2stems -o output input_video.mp4
     cmd = [SPLEETER_CMD, "separate", "-p", "spleeter:2stems", "-o", output_dir, video_path]
     try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
-        # Find the generated audio file (usually vocals.wav or accompaniment.wav)
-        base_name = os.path.splitext(os.path.basename(video_path))[0]
-        audio_path = os.path.join(output_dir, base_name, "vocals.wav") # Adjust if needed
-        if not os.path.exists(audio_path):
-             audio_path = os.path.join(output_dir, base_name, "accompaniment.wav") # Fallback
-             if not os.path.exists(audio_path):
-                 raise FileNotFoundError("Could not find separated audio file.")
+        run(cmd, check=True, capture_output=True, text=True)
+        audio_path = _find_separated_audio(video_path, output_dir)
         print(f"Audio separated successfully: {audio_path}")
         return audio_path
     except subprocess.CalledProcessError as e:
@@ -42,6 +64,156 @@ def separate_audio(video_path, output_dir="output"):
          return None
 
 
+@traced("main.diarize_speakers")
+def diarize_speakers(audio_path):
+    """
+    Clusters the separated vocals into speakers and merges each speaker's adjacent
+    segments into turns: [{'start', 'end', 'speaker'}, ...], empty when no speech is found.
+    """
+    from speakercluster.speakercluster import SpeakerCluster
+    turns = SpeakerCluster.turns(SpeakerCluster().diarize(audio_path))
+    print(f"Speaker turns: {len(turns)}, speakers: {len({turn['speaker'] for turn in turns})}")
+    return turns
+
+
+def _cut_wav(audio_path, start, end, output_path):
+    """Copies the [start, end) seconds of a WAV file to output_path"""
+    import wave
+    with wave.open(audio_path, "rb") as src:
+        rate = src.getframerate()
+        src.setpos(min(int(start * rate), src.getnframes()))
+        frames = src.readframes(int((end - start) * rate))
+        params = src.getparams()
+    with wave.open(output_path, "wb") as dst:
+        dst.setparams(params)
+        dst.writeframes(frames)
+    return output_path
+
+
+def _cut_turns(audio_path, turns, output_dir):
+    """Cuts each speaker turn out of the vocals so it can be recognized on its own"""
+    turn_dir = os.path.join(output_dir, "turns")
+    os.makedirs(turn_dir, exist_ok=True)
+    return [
+        _cut_wav(audio_path, turn["start"], turn["end"], os.path.join(turn_dir, f"{i:04d}_source.wav"))
+        for i, turn in enumerate(turns)
+    ]
+
+
+def _turn_audio_path(output_dir, index, turn):
+    return os.path.join(output_dir, "turns", f"{index:04d}_speaker{turn['speaker']}.wav")
+
+
+def _speaker_clips(turns, audio_paths):
+    """Pairs each turn with its synthesized audio, dropping the turns that produced none"""
+    return [
+        {"start": turn["start"], "end": turn["end"], "speaker": turn["speaker"], "audio": audio}
+        for turn, audio in zip(turns, audio_paths) if audio
+    ]
+
+
+@traced("main.dub_speakers")
+def dub_speakers(audio_path, turns, output_dir="output", voices=TTS_VOICES):
+    """
+    Recognizes, translates and synthesizes every speaker turn on its own, in the voice
+    assigned to the turn's speaker. Returns one clip per dubbed turn:
+    [{'start', 'end', 'speaker', 'audio'}, ...]
+    """
+    from speakercluster.speakercluster import SpeakerCluster
+    voice_of = SpeakerCluster.map_speakers(turns, voices)
+    sources = _cut_turns(audio_path, turns, output_dir)
+    texts = [recognize_speech(source) for source in sources]
+    translations = [translate_text(text, target_language="zh") if text else None for text in texts]
+    audio_paths = [
+        synthesize_speech(text, _turn_audio_path(output_dir, i, turn), voice_of[turn["speaker"]]) if text else None
+        for i, (turn, text) in enumerate(zip(turns, translations))
+    ]
+    return _speaker_clips(turns, audio_paths)
+
+
+def _media_duration(path):
+    """Duration in seconds from ffprobe, or None when it can't be probed"""
+    from mediaprobe.mediaprobe import get_media_probe
+    info = get_media_probe().probe(path)
+    return info.duration if info is not None and info.duration > 0 else None
+
+
+def _mix_command(clips, output_path, duration=None):
+    """
+    Builds the FFmpeg command that places each clip at its turn's start time on a
+    single track, padded with silence (or cut) to `duration` seconds when given.
+    """
+    cmd = [FFMPEG_CMD, "-y"]
+    filters = []
+    for i, clip in enumerate(clips):
+        cmd += ["-i", clip["audio"]]
+        filters.append(f"[{i}:a]adelay={int(round(clip['start'] * 1000))}:all=1[a{i}]")
+    mix = "".join(f"[a{i}]" for i in range(len(clips))) + f"amix=inputs={len(clips)}:duration=longest:normalize=0"
+    if duration:
+        mix += f",apad=whole_dur={duration:.3f}"
+    filters.append(mix + "[a]")
+    cmd += ["-filter_complex", ";".join(filters), "-map", "[a]"]
+    if duration:
+        cmd += ["-t", f"{duration:.3f}"]
+    return cmd + ffmpeg_threads() + [output_path]
+
+
+@traced("main.mix_speaker_audio")
+def mix_speaker_audio(clips, output_path, duration=None):
+    """
+    Mixes the dubbed turns back into one track at their original times.
+    Returns output_path, or None when there is nothing to mix or FFmpeg fails.
+    """
+    if not clips:
+        print("No dubbed speaker turns to mix.")
+        return None
+    try:
+        run(_mix_command(clips, output_path, duration), check=True, capture_output=True, text=True)
+        return output_path
+    except subprocess.CalledProcessError as e:
+        print(f"Error mixing speaker audio: {e}")
+        print(f"Stderr: {e.stderr}")
+        return None
+    except FileNotFoundError:
+        print(f"FFmpeg command not found. Make sure FFmpeg is installed and in your PATH.")
+        return None
+
+
+def _speaker_passes(turns, clips, face_boxes, output_dir):
+    """
+    Plans one Wav2Lip pass per speaker that has a face box: (speaker audio track, box, output).
+    Boxes are handed out like the voices, by talk time, and never shared between speakers.
+    """
+    from speakercluster.speakercluster import SpeakerCluster
+    passes = []
+    for speaker, box in SpeakerCluster.map_speakers(turns, face_boxes, repeat=False).items():
+        own = [clip for clip in clips if clip["speaker"] == speaker]
+        if own:
+            passes.append((own, box,
+                           os.path.join(output_dir, f"speaker{speaker}.wav"),
+                           os.path.join(output_dir, f"synced_speaker{speaker}.mp4")))
+    return passes
+
+
+@traced("main.lip_sync_speakers")
+def lip_sync_speakers(original_video_path, turns, clips, face_boxes, output_dir="output", duration=None):
+    """
+    Lip-syncs every speaker's face to that speaker's own turns. Wav2Lip animates one
+    face per run, so it runs once per speaker with the speaker's face box and a track
+    holding only that speaker's turns (silence elsewhere keeps the mouth closed);
+    each run starts from the previous run's output.
+    """
+    video = original_video_path
+    for own, box, track, output in _speaker_passes(turns, clips, face_boxes, output_dir):
+        if not mix_speaker_audio(own, track, duration):
+            return None
+        video = lip_sync(video, track, output, box=box)
+        if not video:
+            return None
+    return video
+
+
+@traced("main.recognize_speech")
 def recognize_speech(audio_path):
     """
     Performs speech recognition using Vosk (Offline).
@@ -78,6 +250,7 @@ def recognize_speech(audio_path):
     print(f"Recognized text: {recognized_text}")
     return recognized_text
 
+@traced("main.translate_text")
 def translate_text(text, target_language="zh"):
     """
     Translates text using a translation API (e.g., Baidu, Youdao).
@@ -97,18 +270,19 @@ def translate_text(text, target_language="zh"):
     print(f"Translated text: {translated_text}")
     return translated_text
 
-def synthesize_speech(text, output_audio_path="output/translated_speech.wav"):
+@traced("main.synthesize_speech")
+def synthesize_speech(text, output_audio_path="output/translated_speech.wav", voice=TTS_VOICES[0]):
     """
     Synthesizes speech from text using a TTS API (e.g., Xunfei).
     """
-    print(f"Synthesizing speech for: {text}")
+    print(f"Synthesizing speech ({voice}) for: {text}")
     # Placeholder for TTS API call
     # This will highly depend on the specific TTS API provider (Xunfei, etc.)
     # Typically involves sending the text and receiving an audio file (wav, mp3)
     # Example (conceptual):
     # import requests
     # headers = {"Authorization": f"Bearer {TTS_API_KEY}"}
-    # data = {"text": text, "format": "wav"}
+    # data = {"text": text, "voice": voice, "format": "wav"}
     # response = requests.post(TTS_ENDPOINT, headers=headers, json=data)
     # if response.status_code == 200:
     #     with open(output_audio_path, 'wb') as f:
@@ -127,43 +301,91 @@ def synthesize_speech(text, output_audio_path="output/translated_speech.wav"):
     return output_audio_path
 
 
-def lip_sync(original_video_path, translated_audio_path, output_video_path="output/synced_video.mp4"):
+def _wav2lip_command(original_video_path, translated_audio_path, output_video_path, box=None):
     """
-    Performs lip synchronization using Wav2Lip.
-    Requires Wav2Lip project setup.
+    Builds the Wav2Lip inference command, or returns None if Wav2Lip isn't set up.
+    With a face box (top, bottom, left, right) only that face is lip-synced.
     """
-    print(f"Performing lip sync...")
-    # Placeholder for Wav2Lip execution
-    # Assumes Wav2Lip is cloned and set up in WAV2LIP_PATH
-    # Example command structure (adjust paths and model checkpoint):
-    # python inference.py --checkpoint_path path/to/wav2lip_gan.pth --face <original_video_path> --audio <translated_audio_path> --outfile <output_video_path>
     wav2lip_script = os.path.join(WAV2LIP_PATH, "inference.py")
     checkpoint_path = os.path.join(WAV2LIP_PATH, "checkpoints", "wav2lip_gan.pth") # Adjust checkpoint name if needed
 
     if not os.path.exists(wav2lip_script) or not os.path.exists(checkpoint_path):
         print(f"Wav2Lip script or checkpoint not found in {WAV2LIP_PATH}. Skipping lip sync.")
-        # As a fallback, copy original video to output path if Wav2Lip isn't setup
-        # This allows the final combine step to proceed, albeit without lip sync.
-        try:
-            import shutil
-            shutil.copy(original_video_path, output_video_path)
-            print(f"Copied original video to {output_video_path} as fallback.")
-            return output_video_path
-        except Exception as e:
-            print(f"Error copying video: {e}")
-            return None
-
+        return None
 
-    cmd = [
-        "python", wav2lip_script,
+    args = [
         "--checkpoint_path", checkpoint_path,
         "--face", original_video_path,
         "--audio", translated_audio_path,
         "--outfile", output_video_path
     ]
+    if box:
+        args += ["--box"] + [str(int(v)) for v in box]
+    if USE_FRAME_STORE:
+        from framestore.wav2lip import adapter_command
+        return adapter_command(wav2lip_script, args)
+    return ["python", wav2lip_script] + args
+
+
+def _wav2lip_frames(original_video_path):
+    """
+    Decodes the source video into the frame store (once per source) for the Wav2Lip adapter.
+    Returns (frames, env): keep the frames open while Wav2Lip runs so cleanup can't remove
+    them, and run Wav2Lip with env. Both are None when the frame store is off.
+    """
+    if not USE_FRAME_STORE:
+        return None, None
+    from framestore.wav2lip import adapter_env
+    try:
+        from framestore.framestore import get_frame_store
+        frames = get_frame_store().get(original_video_path, FRAME_HEIGHT)
+    except Exception as e:
+        print(f"Frame store unavailable, Wav2Lip will decode the video itself: {e}")
+        return None, adapter_env()
+    return frames, adapter_env(frames.path)
+
+
+def _close_frames(frames_env):
+    """Closes the frames opened by _wav2lip_frames()."""
+    frames, _ = frames_env
+    if frames is not None:
+        frames.close()
+
+
+def _copy_without_lip_sync(original_video_path, output_video_path):
+    """
+    As a fallback, copy original video to output path if Wav2Lip isn't setup.
+    This allows the final combine step to proceed, albeit without lip sync.
+    """
+    try:
+        import shutil
+        shutil.copy(original_video_path, output_video_path)
+        print(f"Copied original video to {output_video_path} as fallback.")
+        return output_video_path
+    except Exception as e:
+        print(f"Error copying video: {e}")
+        return None
+
+
+@traced("main.lip_sync")
+def lip_sync(original_video_path, translated_audio_path, output_video_path="output/synced_video.mp4", box=None):
+    """
+    Performs lip synchronization using Wav2Lip.
+    Requires Wav2Lip project setup.
+    """
+    print(f"Performing lip sync...")
+    # Placeholder for Wav2Lip execution
+    # Assumes Wav2Lip is cloned and set up in WAV2LIP_PATH
+    # Example command structure (adjust paths and model checkpoint):
+    # python inference.py --checkpoint_path path/to/wav2lip_gan.pth --face <original_video_path> --audio <translated_audio_path> --outfile <output_video_path>
+    cmd = _wav2lip_command(original_video_path, translated_audio_path, output_video_path, box)
+    if cmd is None:
+        return _copy_without_lip_sync(original_video_path, output_video_path)
+
+    frames, env = _wav2lip_frames(original_video_path)
     try:
         # Wav2Lip might require running from its directory
-        subprocess.run(cmd, check=True, cwd=WAV2LIP_PATH, capture_output=True, text=True)
+        run(cmd, check=True, cwd=WAV2LIP_PATH, env=env, capture_output=True, text=True)
         print(f"Lip sync video saved to {output_video_path}")
         return output_video_path
     except subprocess.CalledProcessError as e:
@@ -173,26 +395,50 @@ def lip_sync(original_video_path, translated_audio_path, output_video_path="outp
     except FileNotFoundError:
          print(f"Python or Wav2Lip inference script not found. Make sure Python is in PATH and Wav2Lip path is correct.")
          return None
+    finally:
+        _close_frames((frames, env))
+
+
+def _combine_command(synced_video_path, translated_audio_path, final_output_path):
+    """
+    Builds the FFmpeg command that muxes the synced video with the translated audio.
+    Streams whose codec already fits the output container are copied; only the
+    others are transcoded. Without ffprobe, falls back to copying video and encoding AAC.
+    """
+    from mediaprobe.mediaprobe import get_media_probe, stream_args, plan_mode
+    media_probe = get_media_probe()
+    video_info = media_probe.probe(synced_video_path)
+    audio_info = media_probe.probe(translated_audio_path)
+    if video_info is None or audio_info is None:
+        # ffmpeg -i synced_video.mp4 -i translated_audio.wav -c:v copy -c:a aac -strict experimental final_output.mp4
+        codec_args = [
+            "-c:v", "copy",       # Copy video stream without re-encoding
+            "-c:a", "aac",        # Encode audio to AAC (common format)
+            "-strict", "experimental", # Needed for AAC sometimes
+        ]
+    else:
+        codec_args = (stream_args(video_info.video, "video", final_output_path)
+                      + stream_args(audio_info.audio, "audio", final_output_path))
+        print(f"Combine mode: {plan_mode(codec_args, synced_video_path, final_output_path)} ({' '.join(codec_args)})")
+    return [
+        FFMPEG_CMD, "-y", # Overwrite output without asking
+        "-i", synced_video_path,
+        "-i", translated_audio_path,
+        "-map", "0:v:0",      # Video from the synced video, even if it carries an audio track
+        "-map", "1:a:0",      # Audio from the translated speech
+    ] + codec_args + ffmpeg_threads() + [final_output_path]  # -threads N inside a scheduler reservation
 
 
+@traced("main.combine_video_audio")
 def combine_video_audio(synced_video_path, translated_audio_path, final_output_path="output/final_video.mp4"):
     """
     Combines the lip-synced video (without audio) with the translated audio using FFmpeg.
     Wav2Lip output often doesn't contain audio, so we merge it here.
     """
     print(f"Combining video and audio...")
-    # ffmpeg -i synced_video.mp4 -i translated_audio.wav -c:v copy -c:a aac -strict experimental final_output.mp4
-    cmd = [
-        FFMPEG_CMD, "-y", # Overwrite output without asking
-        "-i", synced_video_path,
-        "-i", translated_audio_path,
-        "-c:v", "copy",       # Copy video stream without re-encoding
-        "-c:a", "aac",        # Encode audio to AAC (common format)
-        "-strict", "experimental", # Needed for AAC sometimes
-        final_output_path
-    ]
+    cmd = _combine_command(synced_video_path, translated_audio_path, final_output_path)
     try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        run(cmd, check=True, capture_output=True, text=True)
         print(f"Final video saved to {final_output_path}")
         return final_output_path
     except subprocess.CalledProcessError as e:
@@ -204,9 +450,12 @@ def combine_video_audio(synced_video_path, translated_audio_path, final_output_p
         return None
 
 
-def main(input_video):
+@traced("main.pipeline", "pipeline")
+def main(input_video, voices=TTS_VOICES, face_boxes=None):
     """
     Main function to orchestrate the video translation pipeline.
+    When the vocals hold several speakers, each speaker's turns are dubbed in their own
+    voice, and with face_boxes each speaker's face is lip-synced to their own turns.
     """
     output_dir = "output"
     os.makedirs(output_dir, exist_ok=True)
@@ -217,32 +466,49 @@ def main(input_video):
         print("Failed to separate audio. Exiting.")
         return
 
-    # 2. Recognize Speech
-    source_text = recognize_speech(original_audio)
-    if not source_text:
-        print("Failed to recognize speech. Exiting.")
-        return
+    # 2. Diarize, so several characters don't all end up with one voice
+    turns = diarize_speakers(original_audio)
+    translated_path = os.path.join(output_dir, "translated_speech.wav")
+    if len({turn["speaker"] for turn in turns}) > 1:
+        # 3-5. Recognize, translate and synthesize each turn in its speaker's voice
+        clips = dub_speakers(original_audio, turns, output_dir, voices)
+        duration = _media_duration(input_video)
+        translated_audio = mix_speaker_audio(clips, translated_path, duration)
+        if not translated_audio:
+            print("Failed to synthesize speech. Exiting.")
+            return
+    else:
+        clips = None
 
-    # 3. Translate Text
-    translated_text = translate_text(source_text, target_language="zh") # Target Chinese
-    if not translated_text:
-        print("Failed to translate text. Exiting.")
-        return
+        # 3. Recognize Speech
+        source_text = recognize_speech(original_audio)
+        if not source_text:
+            print("Failed to recognize speech. Exiting.")
+            return
 
-    # 4. Synthesize Speech
-    translated_audio = synthesize_speech(translated_text, os.path.join(output_dir, "translated_speech.wav"))
-    if not translated_audio:
-        print("Failed to synthesize speech. Exiting.")
-        return
+        # 4. Translate Text
+        translated_text = translate_text(source_text, target_language="zh") # Target Chinese
+        if not translated_text:
+            print("Failed to translate text. Exiting.")
+            return
+
+        # 5. Synthesize Speech
+        translated_audio = synthesize_speech(translated_text, translated_path, voices[0])
+        if not translated_audio:
+            print("Failed to synthesize speech. Exiting.")
+            return
 
-    # 5. Lip Sync
+    # 6. Lip Sync
     # Note: Wav2Lip typically needs the *original* video frames for lip syncing
-    synced_video = lip_sync(input_video, translated_audio, os.path.join(output_dir, "synced_video.mp4"))
+    if clips and face_boxes:
+        synced_video = lip_sync_speakers(input_video, turns, clips, face_boxes, output_dir, duration)
+    else:
+        synced_video = lip_sync(input_video, translated_audio, os.path.join(output_dir, "synced_video.mp4"))
     if not synced_video:
         print("Failed to perform lip sync. Exiting.")
         return
 
-    # 6. Combine Video and Audio
+    # 7. Combine Video and Audio
     final_video = combine_video_audio(synced_video, translated_audio, os.path.join(output_dir, "final_video.mp4"))
     if not final_video:
         print("Failed to combine final video and audio. Exiting.")
@@ -251,11 +517,273 @@ def main(input_video):
     print(f"Video translation complete! Final video: {final_video}")
 
 
+@traced("main.pipeline_progressive", "pipeline")
+def main_progressive(input_video, output_dir="output/hls", chunk_seconds=6.0, workers=1):
+    """
+    Progressive variant of main(). The video is processed in time-ordered chunks and each
+    chunk is published as an HLS/fMP4 segment as soon as it is done, so playback of
+    output_dir/playlist.m3u8 can start after the first chunk instead of the whole video.
+    """
+    from hlsstreamer.hlsstreamer import ProgressiveHLS
+    streamer = ProgressiveHLS(output_dir, chunk_seconds=chunk_seconds, ffmpeg_path=FFMPEG_CMD, workers=workers)
+    playlist = streamer.process(input_video)
+    if not playlist:
+        print("Failed to produce progressive output. Exiting.")
+        return None
+    print(f"Progressive output complete! Playlist: {playlist}")
+    return playlist
+
+
+@traced("main.separate_audio_async")
+async def separate_audio_async(video_path, output_dir="output", timeout=None):
+    """
+    Async variant of separate_audio(). Spleeter is killed on timeout or cancellation.
+    """
+    from aioutils.aioutils import run_command
+    print(f"Separating audio from {video_path}...")
+    os.makedirs(output_dir, exist_ok=True)
+    cmd = [SPLEETER_CMD, "separate", "-p", "spleeter:2stems", "-o", output_dir, video_path]
+    try:
+        await run_command(cmd, timeout=timeout, check=True)
+        audio_path = _find_separated_audio(video_path, output_dir)
+        print(f"Audio separated successfully: {audio_path}")
+        return audio_path
+    except subprocess.CalledProcessError as e:
+        print(f"Error running Spleeter: {e}")
+        print(f"Stderr: {e.stderr}")
+        return None
+    except subprocess.TimeoutExpired:
+        print(f"Spleeter timed out after {timeout}s")
+        return None
+    except FileNotFoundError as e:
+         print(f"Spleeter error: {e}")
+         return None
+
+
+@traced("main.lip_sync_async")
+async def lip_sync_async(original_video_path, translated_audio_path, output_video_path="output/synced_video.mp4", timeout=None, box=None):
+    """
+    Async variant of lip_sync(). Wav2Lip is killed on timeout or cancellation.
+    """
+    from aioutils.aioutils import run_command, to_thread_owned
+    print(f"Performing lip sync...")
+    cmd = _wav2lip_command(original_video_path, translated_audio_path, output_video_path, box)
+    if cmd is None:
+        return await asyncio.to_thread(_copy_without_lip_sync, original_video_path, output_video_path)
+
+    # Decoding can take a while; if the task is cancelled meanwhile the frames are closed once it finishes
+    frames, env = await to_thread_owned(_wav2lip_frames, _close_frames, original_video_path)
+    try:
+        await run_command(cmd, timeout=timeout, check=True, cwd=WAV2LIP_PATH, env=env)
+        print(f"Lip sync video saved to {output_video_path}")
+        return output_video_path
+    except subprocess.CalledProcessError as e:
+        print(f"Error running Wav2Lip: {e}")
+        print(f"Stderr: {e.stderr}")
+        return None
+    except subprocess.TimeoutExpired:
+        print(f"Wav2Lip timed out after {timeout}s")
+        return None
+    except FileNotFoundError:
+         print(f"Python or Wav2Lip inference script not found. Make sure Python is in PATH and Wav2Lip path is correct.")
+         return None
+    finally:
+        _close_frames((frames, env))
+
+
+@traced("main.combine_video_audio_async")
+async def combine_video_audio_async(synced_video_path, translated_audio_path, final_output_path="output/final_video.mp4", timeout=None):
+    """
+    Async variant of combine_video_audio(). FFmpeg is killed on timeout or cancellation.
+    """
+    from aioutils.aioutils import run_command
+    print(f"Combining video and audio...")
+    cmd = _combine_command(synced_video_path, translated_audio_path, final_output_path)
+    try:
+        await run_command(cmd, timeout=timeout, check=True)
+        print(f"Final video saved to {final_output_path}")
+        return final_output_path
+    except subprocess.CalledProcessError as e:
+        print(f"Error running FFmpeg: {e}")
+        print(f"Stderr: {e.stderr}")
+        return None
+    except subprocess.TimeoutExpired:
+        print(f"FFmpeg timed out after {timeout}s")
+        return None
+    except FileNotFoundError:
+        print(f"FFmpeg command not found. Make sure FFmpeg is installed and in your PATH.")
+        return None
+
+
+def _reserve(scheduler, stage):
+    """Reserve the stage's CPU/memory on the scheduler, or do nothing without one"""
+    return scheduler.reserve(stage) if scheduler else contextlib.nullcontext()
+
+
+@traced("main.dub_speakers_async")
+async def dub_speakers_async(audio_path, turns, output_dir="output", voices=TTS_VOICES, scheduler=None):
+    """
+    Async variant of dub_speakers(). Each stage runs over all turns under its own reservation.
+    """
+    from speakercluster.speakercluster import SpeakerCluster
+    voice_of = SpeakerCluster.map_speakers(turns, voices)
+    sources = await asyncio.to_thread(_cut_turns, audio_path, turns, output_dir)
+    async with _reserve(scheduler, "speech_recognizer"):
+        texts = [await asyncio.to_thread(recognize_speech, source) for source in sources]
+    async with _reserve(scheduler, "text_translator"):
+        translations = [await asyncio.to_thread(translate_text, text, "zh") if text else None for text in texts]
+    async with _reserve(scheduler, "speech_synthesizer"):
+        audio_paths = [
+            await asyncio.to_thread(synthesize_speech, text, _turn_audio_path(output_dir, i, turn), voice_of[turn["speaker"]])
+            if text else None
+            for i, (turn, text) in enumerate(zip(turns, translations))
+        ]
+    return _speaker_clips(turns, audio_paths)
+
+
+@traced("main.lip_sync_speakers_async")
+async def lip_sync_speakers_async(original_video_path, turns, clips, face_boxes, output_dir="output", duration=None, timeout=None):
+    """
+    Async variant of lip_sync_speakers().
+    """
+    video = original_video_path
+    for own, box, track, output in _speaker_passes(turns, clips, face_boxes, output_dir):
+        if not await asyncio.to_thread(mix_speaker_audio, own, track, duration):
+            return None
+        video = await lip_sync_async(video, track, output, timeout, box)
+        if not video:
+            return None
+    return video
+
+
+@traced("main.pipeline_async", "pipeline")
+async def main_async(input_video, output_dir="output", stage_timeout=None, scheduler=None,
+                     voices=TTS_VOICES, face_boxes=None):
+    """
+    Asyncio variant of main(). External tools run as asyncio subprocesses, so one
+    event loop can drive many jobs at once; cancelling the task kills the running child.
+    Each concurrent job should use its own output_dir.
+    With a scheduler (scheduler.ResourceScheduler), each stage waits for its CPU and
+    memory reservation and its child processes are limited to the reserved threads.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    # 1. Separate Audio
+    async with _reserve(scheduler, "voice_divide"):
+        original_audio = await separate_audio_async(input_video, output_dir, stage_timeout)
+    if not original_audio:
+        print("Failed to separate audio. Exiting.")
+        return None
+
+    # 2. Diarize
+    async with _reserve(scheduler, "speaker_cluster"):
+        turns = await asyncio.to_thread(diarize_speakers, original_audio)
+    translated_path = os.path.join(output_dir, "translated_speech.wav")
+    if len({turn["speaker"] for turn in turns}) > 1:
+        # 3-5. Dub each turn in its speaker's voice
+        clips = await dub_speakers_async(original_audio, turns, output_dir, voices, scheduler)
+        duration = await asyncio.to_thread(_media_duration, input_video)
+        async with _reserve(scheduler, "video_composer"):
+            translated_audio = await asyncio.to_thread(mix_speaker_audio, clips, translated_path, duration)
+        if not translated_audio:
+            print("Failed to synthesize speech. Exiting.")
+            return None
+    else:
+        clips = None
+
+        # 3-5. Recognize, translate and synthesize are in-process placeholders; keep them off the loop
+        async with _reserve(scheduler, "speech_recognizer"):
+            source_text = await asyncio.to_thread(recognize_speech, original_audio)
+        if not source_text:
+            print("Failed to recognize speech. Exiting.")
+            return None
+
+        async with _reserve(scheduler, "text_translator"):
+            translated_text = await asyncio.to_thread(translate_text, source_text, "zh")
+        if not translated_text:
+            print("Failed to translate text. Exiting.")
+            return None
+
+        async with _reserve(scheduler, "speech_synthesizer"):
+            translated_audio = await asyncio.to_thread(synthesize_speech, translated_text, translated_path, voices[0])
+        if not translated_audio:
+            print("Failed to synthesize speech. Exiting.")
+            return None
+
+    # 6. Lip Sync
+    async with _reserve(scheduler, "lip_sync"):
+        if clips and face_boxes:
+            synced_video = await lip_sync_speakers_async(input_video, turns, clips, face_boxes, output_dir, duration, stage_timeout)
+        else:
+            synced_video = await lip_sync_async(input_video, translated_audio, os.path.join(output_dir, "synced_video.mp4"), stage_timeout)
+    if not synced_video:
+        print("Failed to perform lip sync. Exiting.")
+        return None
+
+    # 7. Combine Video and Audio
+    async with _reserve(scheduler, "video_composer"):
+        final_video = await combine_video_audio_async(synced_video, translated_audio, os.path.join(output_dir, "final_video.mp4"), stage_timeout)
+    if not final_video:
+        print("Failed to combine final video and audio. Exiting.")
+        return None
+
+    print(f"Video translation complete! Final video: {final_video}")
+    return final_video
+
+
+async def run_jobs_async(input_videos, output_root="output", stage_timeout=None, scheduler=None):
+    """
+    Runs the pipeline for several videos concurrently on one event loop.
+    Returns the final video path (or None) for each input, in order.
+    Pass a shared scheduler to keep the concurrent stages within CPU and memory capacity.
+    """
+    jobs = [
+        main_async(video, os.path.join(output_root, f"job_{i:03d}"), stage_timeout, scheduler)
+        for i, video in enumerate(input_videos)
+    ]
+    return await asyncio.gather(*jobs)
+
+
 if __name__ == "__main__":
-    # Replace with the actual path to your input video
-    input_video_path = "path/to/your/input_video.mp4"
-    if not os.path.exists(input_video_path):
-         print(f"Error: Input video not found at {input_video_path}")
-         print("Please update the 'input_video_path' variable in the script.")
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Translate the speech in a video and lip-sync it to the new audio.")
+    parser.add_argument("input_video", nargs="?", help="Path to the input video")
+    parser.add_argument("--preflight", action="store_true",
+                        help="Check external tools (ffmpeg, ffprobe, Spleeter, Wav2Lip) and exit; results are cached on disk")
+    parser.add_argument("--refresh", action="store_true", help="Re-probe external tools instead of using the preflight cache")
+    parser.add_argument("--import-times", action="store_true", help="Measure the import time of each module and exit")
+    parser.add_argument("--voices", default=",".join(TTS_VOICES),
+                        help="Comma-separated TTS voices, given to the diarized speakers by talk time (longest first)")
+    parser.add_argument("--face-box", action="append", default=None, metavar="TOP,BOTTOM,LEFT,RIGHT",
+                        help="Face box of a speaker, in the same talk-time order as --voices; "
+                             "repeat once per speaker to lip-sync each speaker's face separately")
+    args = parser.parse_args()
+
+    if args.preflight or args.import_times:
+        import json
+        from preflight.preflight import get_preflight, measure_import_times
+        if args.preflight:
+            report = get_preflight().report(
+                FFMPEG_CMD,
+                wav2lip_checkpoint=os.path.join(WAV2LIP_PATH, "checkpoints", "wav2lip_gan.pth"),
+                refresh=args.refresh,
+            )
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        if args.import_times:
+            for module, ms in measure_import_times().items():
+                print(f"{module:40s} {ms:8.1f} ms")
+    elif not args.input_video:
+        parser.error("input_video is required")
+    elif not os.path.exists(args.input_video):
+        print(f"Error: Input video not found at {args.input_video}")
     else:
-        main(input_video_path)
+        face_boxes = None
+        if args.face_box:
+            try:
+                face_boxes = [[int(v) for v in box.split(",")] for box in args.face_box]
+            except ValueError:
+                face_boxes = []
+            if not all(len(box) == 4 for box in face_boxes) or not face_boxes:
+                parser.error("--face-box expects four integers: TOP,BOTTOM,LEFT,RIGHT")
+        main(args.input_video, args.voices.split(","), face_boxes)
@@ -0,0 +1,598 @@
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import threading
+import contextlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable
+
+
+PROTOCOL_VERSION = "2024-11-05"
+
+# 各工具默认并发上限：重计算工具串行执行，网络请求类工具允许大量并发
+DEFAULT_CONCURRENCY = {
+    "voice_divide": 1,
+    "speaker_cluster": 2,
+    "speech_recognizer": 2,
+    "text_translator": 16,
+    "speech_synthesizer": 8,
+    "lip_sync": 1,
+    "video_composer": 4,
+}
+
+
+class RPCError(Exception):
+    """带JSON-RPC错误码的请求错误"""
+    code = -32603
+
+
+class MethodNotFound(RPCError):
+    """请求了网关不支持的方法"""
+    code = -32601
+
+
+class InvalidParams(RPCError):
+    """请求参数缺失或无效（如未知工具、未知任务）"""
+    code = -32602
+
+
+class Job:
+    """网关中的一个异步任务"""
+
+    def __init__(self, tool: str, arguments: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.tool = tool
+        self.arguments = arguments
+        self.status = "queued"  # queued / running / succeeded / failed / cancelled
+        self.message = ""
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+        self.subscribers: List[asyncio.Queue] = []
+        self.task: Optional[asyncio.Task] = None  # 执行中的异步工具调用，可被取消
+        self.cancel_requested = False
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可JSON序列化的任务状态"""
+        return {
+            "jobId": self.id,
+            "tool": self.tool,
+            "status": self.status,
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+        }
+
+    def update(self, status: Optional[str] = None, message: Optional[str] = None) -> None:
+        """更新任务状态并通知所有订阅者"""
+        if status is not None:
+            self.status = status
+        if message is not None:
+            self.message = message
+        snapshot = self.to_dict()
+        for queue in self.subscribers:
+            queue.put_nowait(snapshot)
+        if self.finished:
+            self.done.set()
+
+
+class ToolSpec:
+    """
+    网关对外暴露的工具描述
+
+    handler 为协程函数时在事件循环中执行，执行中的任务可以取消（外部子进程随之终止）；
+    普通函数在线程池中执行，开始后无法中途停止
+    """
+
+    def __init__(self, name: str, description: str, input_schema: Dict[str, Any],
+                 handler: Callable[..., Any], concurrency: int = 1):
+        self.name = name
+        self.description = description
+        self.input_schema = input_schema
+        self.handler = handler
+        self.concurrency = concurrency
+        self.cancellable = asyncio.iscoroutinefunction(handler)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "inputSchema": self.input_schema,
+        }
+
+
+def _schema(required: List[str], **properties: str) -> Dict[str, Any]:
+    """根据属性名和类型构建简单的JSON Schema"""
+    return {
+        "type": "object",
+        "properties": {name: {"type": kind} for name, kind in properties.items()},
+        "required": required,
+    }
+
+
+class MCPGateway:
+    """MCP网关，将六个工具以异步任务队列的方式对外提供服务"""
+
+    def __init__(self, concurrency: Optional[Dict[str, int]] = None, max_jobs: int = 1000,
+                 registry: Optional[Any] = None, scheduler: Optional[Any] = None):
+        from modelregistry.modelregistry import get_default_registry
+        self.registry = registry or get_default_registry()  # 所有工具共享的模型注册表
+        self.scheduler = scheduler  # 可选的资源调度器，设置后任务按CPU和内存预留执行
+        self.concurrency = dict(DEFAULT_CONCURRENCY)
+        self.concurrency.update(concurrency or {})
+        self.max_jobs = max_jobs
+        self.jobs: Dict[str, Job] = {}
+        self.instances: Dict[str, Any] = {}  # 常驻的工具实例，模型在多次调用间保持加载
+        self.instances_lock = threading.Lock()
+        self.tools = self._build_tools()
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.workers: List[asyncio.Task] = []
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, sum(spec.concurrency for spec in self.tools.values() if not spec.cancellable)),
+            thread_name_prefix="mcp-tool"
+        )
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    # ------------------------------------------------------------------
+    # 工具实例与处理函数
+    # ------------------------------------------------------------------
+
+    def _instance(self, key: str, factory: Callable[[], Any]) -> Any:
+        """获取常驻工具实例，首次使用时创建；并发的任务共享同一个实例"""
+        with self.instances_lock:
+            if key not in self.instances:
+                self.instances[key] = factory()
+            return self.instances[key]
+
+    async def _voice_divide(self, args: Dict[str, Any]) -> Dict[str, str]:
+        from voicedivide.voicedivide import VoiceDivide
+        separator = self._instance("voice_divide", lambda: VoiceDivide(registry=self.registry))
+        return await separator.separate_async(args["audio_path"], args.get("output_dir", "output"))
+
+    def _speaker_cluster(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        from speakercluster.speakercluster import SpeakerCluster
+        diarizer = self._instance("speaker_cluster", SpeakerCluster)
+        segments = diarizer.diarize(args["audio_path"])
+        if args.get("voices"):
+            # 按说话时长为每个说话人分配发音人，客户端据此逐段调用 speech_synthesizer
+            voices = SpeakerCluster.map_speakers(segments, args["voices"])
+            for seg in segments:
+                seg["voice"] = voices[seg["speaker"]]
+        return segments
+
+    def _speech_recognizer(self, args: Dict[str, Any]) -> str:
+        from speechrecognizer.speechrecognizer import SpeechRecognizer
+        language = args.get("language", "ja")
+        recognizer = self._instance(
+            f"speech_recognizer:{language}",
+            lambda: SpeechRecognizer(model_path=os.environ.get("VOSK_MODEL_PATH"), language=language,
+                                     registry=self.registry)
+        )
+        return recognizer.recognize(args["audio_path"])
+
+    async def _text_translator(self, args: Dict[str, Any]) -> str:
+        from texttranslator.texttranslator import TextTranslator
+        translator = self._instance(
+            "text_translator",
+            lambda: TextTranslator(os.environ.get("BAIDU_APP_ID"), os.environ.get("BAIDU_APP_KEY"))
+        )
+        return await translator.translate_async(args["text"], args.get("from_lang", "jp"), args.get("to_lang", "zh"))
+
+    async def _speech_synthesizer(self, args: Dict[str, Any]) -> str:
+        from speechsynthesizer.speechsynthesizer import SpeechSynthesizer
+        synthesizer = self._instance(
+            "speech_synthesizer",
+            lambda: SpeechSynthesizer(os.environ.get("XFYUN_APP_ID"), os.environ.get("XFYUN_API_KEY"))
+        )
+        return await synthesizer.synthesize_async(args["text"], args["output_path"], args.get("voice", "xiaoyan"))
+
+    async def _lip_sync(self, args: Dict[str, Any]) -> str:
+        from lipsync.lipsync import LipSync
+
+        def factory() -> Any:
+            lip_sync = LipSync(model_path=os.environ.get("WAV2LIP_CHECKPOINT"), registry=self.registry)
+            if os.environ.get("WAV2LIP_PATH"):
+                lip_sync.set_wav2lip_path(os.environ["WAV2LIP_PATH"])
+            return lip_sync
+
+        lip_sync = self._instance("lip_sync", factory)
+        return await lip_sync.synchronize_async(args["video_path"], args["audio_path"], args["output_path"],
+                                                box=args.get("box"))
+
+    async def _video_composer(self, args: Dict[str, Any]) -> str:
+        from videocomposer.videocomposer import VideoComposer
+        composer = self._instance(
+            "video_composer",
+            lambda: VideoComposer(os.environ.get("FFMPEG_PATH"))
+        )
+        return await composer.compose_final_video_async(
+            args["video_path"], args.get("background_audio_path"), args.get("output_path")
+        )
+
+    def _build_tools(self) -> Dict[str, ToolSpec]:
+        """注册所有对外提供的工具"""
+        specs = [
+            ToolSpec("voice_divide", "使用Spleeter分离人声和背景音乐",
+                     _schema(["audio_path"], audio_path="string", output_dir="string"),
+                     self._voice_divide),
+            ToolSpec("speaker_cluster", "对分离后的人声进行说话人聚类",
+                     _schema(["audio_path"], audio_path="string", voices="array"),
+                     self._speaker_cluster),
+            ToolSpec("speech_recognizer", "使用Vosk识别语音",
+                     _schema(["audio_path"], audio_path="string", language="string"),
+                     self._speech_recognizer),
+            ToolSpec("text_translator", "使用百度翻译API翻译文本",
+                     _schema(["text"], text="string", from_lang="string", to_lang="string"),
+                     self._text_translator),
+            ToolSpec("speech_synthesizer", "使用科大讯飞TTS API合成语音",
+                     _schema(["text", "output_path"], text="string", output_path="string", voice="string"),
+                     self._speech_synthesizer),
+            ToolSpec("lip_sync", "使用Wav2Lip进行口型同步",
+                     _schema(["video_path", "audio_path", "output_path"],
+                             video_path="string", audio_path="string", output_path="string", box="array"),
+                     self._lip_sync),
+            ToolSpec("video_composer", "使用FFmpeg合成最终视频",
+                     _schema(["video_path"], video_path="string",
+                             background_audio_path="string", output_path="string"),
+                     self._video_composer),
+        ]
+        for spec in specs:
+            spec.concurrency = max(1, int(self.concurrency.get(spec.name, 1)))
+        return {spec.name: spec for spec in specs}
+
+    def preload(self, tools: List[str]) -> None:
+        """启动时预加载指定工具的模型"""
+        for tool in tools:
+            if tool == "voice_divide":
+                from voicedivide.voicedivide import VoiceDivide
+                self._instance("voice_divide", lambda: VoiceDivide(registry=self.registry)).load_model()
+            elif tool == "speech_recognizer":
+                from speechrecognizer.speechrecognizer import SpeechRecognizer
+                self._instance(
+                    "speech_recognizer:ja",
+                    lambda: SpeechRecognizer(model_path=os.environ.get("VOSK_MODEL_PATH"), language="ja",
+                                             registry=self.registry)
+                ).load_model()
+            else:
+                print(f"工具无需预加载模型: {tool}")
+
+    # ------------------------------------------------------------------
+    # 任务队列
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """为每个工具启动与其并发上限相同数量的工作协程"""
+        for name, spec in self.tools.items():
+            self.queues[name] = asyncio.Queue()
+            for _ in range(spec.concurrency):
+                self.workers.append(asyncio.create_task(self._worker(spec)))
+
+    async def stop(self) -> None:
+        """停止服务器和所有工作协程"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers.clear()
+        self.executor.shutdown(wait=False)
+
+    async def _worker(self, spec: ToolSpec) -> None:
+        """从工具队列中取出任务执行：异步工具在独立任务中运行，阻塞的工具在线程池中运行"""
+        loop = asyncio.get_running_loop()
+        queue = self.queues[spec.name]
+        while True:
+            job = await queue.get()
+            try:
+                if job.status == "cancelled":
+                    continue
+                reservation = self.scheduler.reserve(spec.name) if self.scheduler else contextlib.nullcontext()
+                try:
+                    async with reservation:
+                        if job.status == "cancelled":
+                            continue
+                        job.started_at = time.time()
+                        job.update("running", "任务开始执行")
+                        if spec.cancellable:
+                            # 独立任务继承当前上下文（资源预留），jobs/cancel 取消它时子进程随之终止
+                            job.task = asyncio.ensure_future(spec.handler(job.arguments))
+                            job.result = await job.task
+                        else:
+                            # 复制上下文，使线程池中启动的子进程能读取到当前的资源预留
+                            context = contextvars.copy_context()
+                            job.result = await loop.run_in_executor(
+                                self.executor, context.run, spec.handler, job.arguments
+                            )
+                    job.finished_at = time.time()
+                    job.update("succeeded", "任务完成")
+                except asyncio.CancelledError:
+                    if not job.cancel_requested:
+                        raise  # 网关正在停止
+                    job.finished_at = time.time()
+                    job.update("cancelled", "任务已取消")
+                except Exception as e:
+                    job.error = str(e)
+                    job.finished_at = time.time()
+                    job.update("failed", f"任务失败: {str(e)}")
+            finally:
+                job.task = None
+                queue.task_done()
+
+    def submit(self, tool: str, arguments: Dict[str, Any]) -> Job:
+        """提交任务到对应工具的队列"""
+        spec = self.tools.get(tool)
+        if spec is None:
+            raise InvalidParams(f"未知工具: {tool}")
+        missing = [key for key in spec.input_schema["required"] if key not in arguments]
+        if missing:
+            raise InvalidParams(f"缺少参数: {', '.join(missing)}")
+
+        self._prune_jobs()
+        job = Job(tool, arguments)
+        self.jobs[job.id] = job
+        self.queues[tool].put_nowait(job)
+        job.update(message=f"排队中，前方任务数: {self.queues[tool].qsize() - 1}")
+        return job
+
+    def job(self, job_id: str) -> Job:
+        """按编号查找任务"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise InvalidParams(f"未知任务: {job_id}")
+        return job
+
+    def cancel(self, job_id: str) -> Job:
+        """
+        取消任务：排队中的任务立即取消；执行中的异步工具任务被取消，其子进程随之终止，
+        任务结束后状态变为cancelled。在线程池中运行的进程内工具（speaker_cluster、
+        speech_recognizer）开始后无法停止，此时抛出InvalidParams
+        """
+        job = self.job(job_id)
+        if job.status == "queued":
+            job.finished_at = time.time()
+            job.update("cancelled", "任务已取消")
+        elif job.status == "running":
+            if job.task is None:
+                raise InvalidParams(f"工具 {job.tool} 在进程内运行，无法取消执行中的任务")
+            job.cancel_requested = True
+            job.task.cancel()
+            job.update(message="正在取消")
+        return job
+
+    def _prune_jobs(self) -> None:
+        """任务数量超过上限时删除最早完成的任务"""
+        if len(self.jobs) < self.max_jobs:
+            return
+        finished = sorted(
+            (job for job in self.jobs.values() if job.finished),
+            key=lambda job: job.finished_at or 0
+        )
+        for job in finished[:len(self.jobs) - self.max_jobs + 1]:
+            del self.jobs[job.id]
+
+    # ------------------------------------------------------------------
+    # JSON-RPC 协议
+    # ------------------------------------------------------------------
+
+    async def handle_request(self, request: Dict[str, Any], send: Callable,
+                             wait: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        处理一条JSON-RPC请求，返回结果对象；通知消息返回None
+
+        wait 为 tools/call 未传入 "wait" 时的默认行为：标准MCP客户端（stdio）期望直接得到工具结果
+        """
+        method = request.get("method")
+        params = request.get("params") or {}
+
+        if isinstance(method, str) and method.startswith("notifications/"):
+            return None
+        if method in ("tools/call", "jobs/get", "jobs/cancel", "jobs/subscribe"):
+            key = "name" if method == "tools/call" else "jobId"
+            if key not in params:
+                raise InvalidParams(f"缺少参数: {key}")
+
+        if method == "initialize":
+            return {
+                "protocolVersion": PROTOCOL_VERSION,
+                "serverInfo": {"name": "voice-embedding-gateway", "version": "0.1.0"},
+                "capabilities": {"tools": {}},
+            }
+        if method == "tools/list":
+            return {"tools": [spec.to_dict() for spec in self.tools.values()]}
+        if method == "tools/call":
+            job = self.submit(params["name"], params.get("arguments") or {})
+            if params.get("wait", wait):
+                await job.done.wait()
+                return self._call_result(job)
+            return {"content": [{"type": "text", "text": json.dumps({"jobId": job.id})}],
+                    "jobId": job.id}
+        if method == "jobs/get":
+            return self.job(params["jobId"]).to_dict()
+        if method == "jobs/list":
+            return {"jobs": [job.to_dict() for job in self.jobs.values()]}
+        if method == "jobs/cancel":
+            return self.cancel(params["jobId"]).to_dict()
+        if method == "jobs/subscribe":
+            job = self.job(params["jobId"])
+            asyncio.create_task(self._stream_job(job, send))
+            return job.to_dict()
+        if method == "models/stats":
+            return self.registry.stats()
+        if method == "scheduler/stats":
+            return self.scheduler.report() if self.scheduler else {"enabled": False}
+        if method == "ping":
+            return {}
+        raise MethodNotFound(f"未知方法: {method}")
+
+    @staticmethod
+    def _call_result(job: Job) -> Dict[str, Any]:
+        """将完成的任务转换为MCP tools/call 结果"""
+        text = job.error if job.status == "failed" else json.dumps(job.result, ensure_ascii=False)
+        return {
+            "content": [{"type": "text", "text": text}],
+            "isError": job.status != "succeeded",
+            "jobId": job.id,
+        }
+
+    async def _stream_job(self, job: Job, send: Callable) -> None:
+        """以通知消息的形式持续推送任务进度，直到任务结束"""
+        queue: asyncio.Queue = asyncio.Queue()
+        job.subscribers.append(queue)
+        try:
+            if job.finished:
+                queue.put_nowait(job.to_dict())
+            while True:
+                snapshot = await queue.get()
+                await send({"jsonrpc": "2.0", "method": "notifications/progress", "params": snapshot})
+                if snapshot["status"] in ("succeeded", "failed", "cancelled"):
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            job.subscribers.remove(queue)
+
+    async def _serve_lines(self, reader: asyncio.StreamReader, send: Callable, wait: bool = False) -> None:
+        """逐行读取JSON-RPC消息并处理，直到输入结束"""
+
+        async def respond(request: Dict[str, Any]) -> None:
+            try:
+                result = await self.handle_request(request, send, wait)
+                response = {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+            except RPCError as e:
+                response = {"jsonrpc": "2.0", "id": request.get("id"),
+                            "error": {"code": e.code, "message": str(e)}}
+            except Exception as e:
+                response = {"jsonrpc": "2.0", "id": request.get("id"),
+                            "error": {"code": -32603, "message": str(e)}}
+            if "id" in request:
+                await send(response)
+
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    await send({"jsonrpc": "2.0", "id": None,
+                                "error": {"code": -32700, "message": "JSON解析失败"}})
+                    continue
+                if not isinstance(request, dict):
+                    await send({"jsonrpc": "2.0", "id": None,
+                                "error": {"code": -32600, "message": "无效请求"}})
+                    continue
+                # 每个请求独立处理，长时间等待的请求不会阻塞同一连接上的其他请求
+                task = asyncio.create_task(respond(request))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except ConnectionError:
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """处理一个TCP客户端连接，消息格式为逐行分隔的JSON-RPC"""
+        lock = asyncio.Lock()
+
+        async def send(message: Dict[str, Any]) -> None:
+            async with lock:
+                writer.write((json.dumps(message, ensure_ascii=False) + "\n").encode())
+                await writer.drain()
+
+        try:
+            await self._serve_lines(reader, send)
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        """启动网关并持续运行"""
+        await self.start()
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        print(f"MCP网关已启动: {host}:{port}")
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def serve_stdio(self) -> None:
+        """
+        以MCP stdio传输方式运行：从标准输入读取、向标准输出写入逐行分隔的JSON-RPC消息
+
+        工具和子进程的打印输出被重定向到标准错误，避免破坏协议消息；
+        tools/call 默认等待任务完成并返回结果
+        """
+        loop = asyncio.get_running_loop()
+        protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), "wb", buffering=0)
+        sys.stdout.flush()
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        sys.stdout = sys.stderr
+
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        lock = asyncio.Lock()
+
+        async def send(message: Dict[str, Any]) -> None:
+            async with lock:
+                protocol_out.write((json.dumps(message, ensure_ascii=False) + "\n").encode())
+
+        await self.start()
+        print("MCP网关已启动: stdio", file=sys.stderr)
+        try:
+            await self._serve_lines(reader, send, wait=True)
+        finally:
+            await self.stop()
+            protocol_out.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Voice Embedding MCP网关")
+    parser.add_argument("--stdio", action="store_true", help="使用MCP stdio传输，供标准MCP客户端启动")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", action="append", default=[],
+                        metavar="TOOL=N", help="设置工具并发上限，例如 text_translator=32")
+    parser.add_argument("--model-budget-mb", type=float, default=None, help="常驻模型的内存预算（MB）")
+    parser.add_argument("--preload", default="", help="启动时预加载模型的工具，逗号分隔")
+    parser.add_argument("--scheduler", action="store_true", help="按CPU和内存容量调度任务")
+    parser.add_argument("--cpus", type=int, default=None, help="调度器的CPU容量，默认为可用CPU数")
+    parser.add_argument("--memory-mb", type=float, default=None, help="调度器的内存容量（MB），默认为可用内存扣除余量")
+    cli_args = parser.parse_args()
+
+    limits = {}
+    for item in cli_args.concurrency:
+        name, _, value = item.partition("=")
+        limits[name] = int(value)
+
+    from modelregistry.modelregistry import ModelRegistry
+    scheduler = None
+    if cli_args.scheduler:
+        from scheduler.scheduler import ResourceScheduler
+        scheduler = ResourceScheduler(cli_args.cpus, cli_args.memory_mb)
+    gateway = MCPGateway(concurrency=limits, registry=ModelRegistry(cli_args.model_budget_mb), scheduler=scheduler)
+    gateway.preload([name for name in cli_args.preload.split(",") if name])
+    try:
+        asyncio.run(gateway.serve_stdio() if cli_args.stdio else gateway.serve(cli_args.host, cli_args.port))
+    except KeyboardInterrupt:
+        print("MCP网关已停止")
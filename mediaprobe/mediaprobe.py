@@ -0,0 +1,346 @@
+import os
+import sys
+import json
+import bisect
+import hashlib
+import threading
+import contextlib
+import subprocess
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple, Iterator
+
+from tracing.tracing import get_tracer
+from preflight.preflight import cache_dir, file_key, get_preflight
+
+CACHE_VERSION = 1
+MEMORY_ENTRIES = 256  # 内存中最多缓存的文件数
+
+# 输出扩展名对应的容器
+CONTAINERS = {
+    ".mp4": "mp4", ".m4v": "mp4", ".mov": "mp4", ".m4a": "mp4",
+    ".mkv": "matroska", ".mka": "matroska",
+    ".webm": "webm",
+    ".ts": "mpegts",
+    ".wav": "wav",
+    ".mp3": "mp3",
+}
+# 各容器可以直接复制的编码，None表示不限制
+COMPATIBLE_CODECS = {
+    "mp4": {"video": {"h264", "hevc", "mpeg4", "av1", "vp9"},
+            "audio": {"aac", "mp3", "alac", "ac3", "eac3", "opus", "flac"}},
+    "matroska": {"video": None, "audio": None},
+    "webm": {"video": {"vp8", "vp9", "av1"}, "audio": {"opus", "vorbis"}},
+    "mpegts": {"video": {"h264", "hevc", "mpeg2video"}, "audio": {"aac", "mp3", "ac3", "eac3", "mp2"}},
+    "wav": {"video": set(), "audio": {"pcm_s16le", "pcm_s24le", "pcm_s32le", "pcm_f32le", "pcm_u8"}},
+    "mp3": {"video": set(), "audio": {"mp3"}},
+}
+# 需要转码时各容器使用的编码器
+DEFAULT_ENCODERS = {
+    "mp4": {"video": "libx264", "audio": "aac"},
+    "matroska": {"video": "libx264", "audio": "aac"},
+    "webm": {"video": "libvpx-vp9", "audio": "libopus"},
+    "mpegts": {"video": "libx264", "audio": "aac"},
+    "wav": {"audio": "pcm_s16le"},
+    "mp3": {"audio": "libmp3lame"},
+}
+# 缓存中保留的流字段，其余字段（disposition、tags等）不影响编码决策
+STREAM_FIELDS = [
+    "index", "codec_type", "codec_name", "profile", "pix_fmt", "width", "height",
+    "avg_frame_rate", "sample_rate", "channels", "channel_layout", "sample_fmt",
+    "duration", "bit_rate",
+]
+
+
+class MediaInfo:
+    """ffprobe得到的媒体文件信息"""
+
+    def __init__(self, path: str, data: Dict[str, Any]):
+        self.path = path
+        self.format: Dict[str, Any] = data.get("format", {})
+        self.streams: List[Dict[str, Any]] = data.get("streams", [])
+
+    @property
+    def container(self) -> str:
+        """容器格式，例如 "mov,mp4,m4a,3gp,3g2,mj2" """
+        return self.format.get("format_name", "")
+
+    @property
+    def duration(self) -> float:
+        """时长（秒），未知时返回0"""
+        try:
+            return float(self.format.get("duration", 0))
+        except (TypeError, ValueError):
+            return 0.0
+
+    def stream(self, codec_type: str) -> Optional[Dict[str, Any]]:
+        """返回第一个指定类型（"video" 或 "audio"）的流"""
+        for stream in self.streams:
+            if stream.get("codec_type") == codec_type:
+                return stream
+        return None
+
+    @property
+    def video(self) -> Optional[Dict[str, Any]]:
+        return self.stream("video")
+
+    @property
+    def audio(self) -> Optional[Dict[str, Any]]:
+        return self.stream("audio")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"format": self.format, "streams": self.streams}
+
+
+class MediaProbe:
+    """
+    基于ffprobe的媒体信息层
+
+    每个文件只运行一次ffprobe，结果按文件的真实路径、修改时间和大小缓存在内存和磁盘上；
+    关键帧索引较耗时，首次被请求时才生成并写入同一缓存条目
+    """
+
+    def __init__(self, ffprobe_path: Optional[str] = None, cache_path: Optional[str] = None):
+        """
+        初始化媒体信息层
+
+        Args:
+            ffprobe_path: ffprobe可执行文件路径，默认读取环境变量 FFPROBE_PATH 或使用PATH中的ffprobe
+            cache_path: 磁盘缓存目录
+        """
+        self.ffprobe_path = ffprobe_path or os.environ.get("FFPROBE_PATH") or "ffprobe"
+        self.cache_path = cache_path or os.path.join(cache_dir(), "probe")
+        self.lock = threading.Lock()  # 只保护内存缓存，不在持有期间运行ffprobe
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.key_locks: Dict[str, Tuple[threading.Lock, int]] = {}  # 缓存键 -> (锁, 使用者数)
+
+    def available(self) -> bool:
+        """ffprobe是否可用（结果由preflight缓存）"""
+        return get_preflight().ffprobe(self.ffprobe_path) is not None
+
+    @contextlib.contextmanager
+    def _locked(self, key: str) -> Iterator[Dict[str, Any]]:
+        """
+        按缓存键加锁并返回缓存条目
+
+        同一文件的并发请求只运行一次ffprobe，不同文件的ffprobe互不等待
+        """
+        with self.lock:
+            lock, users = self.key_locks.get(key, (None, 0))
+            lock = lock or threading.Lock()
+            self.key_locks[key] = (lock, users + 1)
+        try:
+            with lock:
+                with self.lock:
+                    entry = self._entry(key)
+                yield entry
+        finally:
+            with self.lock:
+                lock, users = self.key_locks[key]
+                if users == 1:
+                    del self.key_locks[key]
+                else:
+                    self.key_locks[key] = (lock, users - 1)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_path, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def _entry(self, key: str) -> Dict[str, Any]:
+        """返回缓存条目，依次查找内存和磁盘，都没有时返回空条目"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry
+        entry = {"key": key}
+        try:
+            with open(self._disk_path(key)) as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION and data.get("key") == key:
+                entry = data
+        except (OSError, ValueError):
+            pass
+        self.entries[key] = entry
+        while len(self.entries) > MEMORY_ENTRIES:
+            self.entries.popitem(last=False)
+        return entry
+
+    def _store(self, entry: Dict[str, Any]) -> None:
+        """原子地写入磁盘缓存，失败时只保留内存缓存"""
+        entry["version"] = CACHE_VERSION
+        try:
+            os.makedirs(self.cache_path, exist_ok=True)
+            path = self._disk_path(entry["key"])
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(temp_path, path)
+        except OSError:
+            pass
+
+    def _ffprobe(self, args: List[str]) -> Optional[str]:
+        """运行ffprobe并返回标准输出，失败时返回None"""
+        try:
+            with get_tracer().span("exec:ffprobe", "subprocess", argv=" ".join(args)):
+                result = subprocess.run([self.ffprobe_path, "-v", "error"] + args,
+                                        capture_output=True, text=True, timeout=120)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return result.stdout if result.returncode == 0 else None
+
+    def probe(self, path: str) -> Optional[MediaInfo]:
+        """
+        获取媒体文件的容器和流信息
+
+        Args:
+            path: 媒体文件路径
+
+        Returns:
+            MediaInfo，文件不存在、无法解析或ffprobe不可用时返回None
+        """
+        key = file_key(path)
+        if key is None:
+            return None
+        with self._locked(key) as entry:
+            if "info" not in entry:
+                if not self.available():
+                    return None
+                output = self._ffprobe(["-show_format", "-show_streams", "-of", "json", path])
+                entry["info"] = self._compact(json.loads(output)) if output else None
+                self._store(entry)
+            info = entry["info"]
+        return MediaInfo(path, info) if info is not None else None
+
+    @staticmethod
+    def _compact(data: Dict[str, Any]) -> Dict[str, Any]:
+        """只保留影响编码决策的字段，并将数值字段转换为数字"""
+        streams = []
+        for stream in data.get("streams", []):
+            item = {name: stream[name] for name in STREAM_FIELDS if name in stream}
+            if "sample_rate" in item:
+                item["sample_rate"] = int(item["sample_rate"])
+            streams.append(item)
+        format_info = data.get("format", {})
+        return {
+            "format": {name: format_info[name] for name in ("format_name", "duration", "bit_rate", "size")
+                       if name in format_info},
+            "streams": streams,
+        }
+
+    def keyframes(self, path: str) -> List[float]:
+        """
+        获取第一个视频流的关键帧时间戳（秒，升序）
+
+        只读取数据包的标记而不解码，首次调用后缓存
+
+        Args:
+            path: 视频文件路径
+
+        Returns:
+            关键帧时间戳列表，无法获取时返回空列表
+        """
+        key = file_key(path)
+        if key is None:
+            return []
+        with self._locked(key) as entry:
+            if "keyframes" not in entry:
+                if not self.available():
+                    return []
+                output = self._ffprobe(["-select_streams", "v:0", "-show_entries", "packet=pts_time,flags",
+                                        "-of", "csv=p=0", path])
+                times = []
+                for line in (output or "").splitlines():
+                    pts_time, _, flags = line.partition(",")
+                    if "K" in flags and pts_time not in ("", "N/A"):
+                        times.append(float(pts_time))
+                entry["keyframes"] = sorted(times)
+                self._store(entry)
+            return list(entry["keyframes"])
+
+    def keyframe_before(self, path: str, time_seconds: float) -> Optional[float]:
+        """返回不晚于指定时间的最后一个关键帧，可用于按关键帧无损切割"""
+        keyframes = self.keyframes(path)
+        position = bisect.bisect_right(keyframes, time_seconds + 1e-6)
+        return keyframes[position - 1] if position else None
+
+
+_media_probe: Optional[MediaProbe] = None
+
+
+def get_media_probe() -> MediaProbe:
+    """获取进程内共享的MediaProbe实例"""
+    global _media_probe
+    if _media_probe is None:
+        _media_probe = MediaProbe()
+    return _media_probe
+
+
+def container_for(path: str) -> str:
+    """根据扩展名判断输出容器，未知扩展名按matroska处理（几乎接受所有编码）"""
+    return CONTAINERS.get(os.path.splitext(path)[1].lower(), "matroska")
+
+
+def can_copy(stream: Optional[Dict[str, Any]], output_path: str) -> bool:
+    """流能否不经转码直接写入输出容器"""
+    if stream is None:
+        return False
+    allowed = COMPATIBLE_CODECS[container_for(output_path)].get(stream.get("codec_type"), set())
+    return allowed is None or stream.get("codec_name") in allowed
+
+
+def stream_args(stream: Optional[Dict[str, Any]], kind: str, output_path: str,
+                sample_rate: Optional[int] = None, channels: Optional[int] = None,
+                filtered: bool = False) -> List[str]:
+    """
+    为一个输出流选择编码参数：能复制时复制，否则以最少的转换转码
+
+    Args:
+        stream: 输入流信息，未知时为None
+        kind: "video" 或 "audio"
+        output_path: 输出文件路径，用于判断容器
+        sample_rate: 要求的采样率，None表示保持不变
+        channels: 要求的声道数，None表示保持不变
+        filtered: 该流是否经过滤镜（经过滤镜的流无法复制）
+
+    Returns:
+        FFmpeg参数，例如 ["-c:a", "copy"] 或 ["-c:a", "aac", "-ar", "44100"]
+    """
+    flag = "-c:v" if kind == "video" else "-c:a"
+    rate_matches = sample_rate is None or (stream is not None and stream.get("sample_rate") == sample_rate)
+    channels_match = channels is None or (stream is not None and stream.get("channels") == channels)
+    if not filtered and rate_matches and channels_match and can_copy(stream, output_path):
+        return [flag, "copy"]
+
+    encoder = DEFAULT_ENCODERS[container_for(output_path)].get(kind, "libx264" if kind == "video" else "aac")
+    args = [flag, encoder]
+    if kind == "video" and encoder == "libx264":
+        args += ["-pix_fmt", "yuv420p"]
+    if kind == "audio":
+        if not rate_matches:
+            args += ["-ar", str(sample_rate)]
+        if not channels_match:
+            args += ["-ac", str(channels)]
+    return args
+
+
+def plan_mode(args: List[str], input_path: str, output_path: str) -> str:
+    """根据编码参数判断处理方式：copy（同容器复制）、remux（换容器复制）或 transcode"""
+    codecs = [args[i + 1] for i, arg in enumerate(args[:-1]) if arg.startswith("-c:") or arg == "-c"]
+    if any(codec != "copy" for codec in codecs):
+        return "transcode"
+    return "copy" if container_for(input_path) == container_for(output_path) else "remux"
+
+
+if __name__ == "__main__":
+    # 使用示例
+    if len(sys.argv) < 2:
+        print("用法: python -m mediaprobe.mediaprobe <媒体文件> [输出文件]")
+        sys.exit(1)
+    media_probe = get_media_probe()
+    info = media_probe.probe(sys.argv[1])
+    if info is None:
+        print("无法获取媒体信息（文件不存在或ffprobe不可用）")
+        sys.exit(1)
+    print(json.dumps(info.to_dict(), ensure_ascii=False, indent=2))
+    print(f"关键帧: {media_probe.keyframes(sys.argv[1])[:20]}")
+    if len(sys.argv) > 2:
+        args = stream_args(info.video, "video", sys.argv[2]) + stream_args(info.audio, "audio", sys.argv[2])
+        print(f"{plan_mode(args, sys.argv[1], sys.argv[2])}: {' '.join(args)}")
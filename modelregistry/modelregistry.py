@@ -0,0 +1,295 @@
+import os
+import time
+import inspect
+import weakref
+import threading
+import contextlib
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, List, Iterable, Iterator
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_mb() -> float:
+    """读取当前进程的常驻内存（MB），不支持的平台返回0"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def path_size_mb(path: Optional[str]) -> float:
+    """计算文件或目录的磁盘大小（MB），路径不存在时返回0"""
+    if not path or not os.path.exists(path):
+        return 0.0
+    if os.path.isfile(path):
+        return os.path.getsize(path) / (1024 * 1024)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total / (1024 * 1024)
+
+
+def _callback_ref(callback: Callable[[], None]) -> Callable[[], Optional[Callable[[], None]]]:
+    """绑定方法以弱引用保存，工具实例被回收后回调随之失效，不会因注册表而一直存活"""
+    if inspect.ismethod(callback):
+        return weakref.WeakMethod(callback)
+    return lambda: callback
+
+
+class ModelEntry:
+    """注册表中的一个模型"""
+
+    def __init__(self, name: str, loader: Callable[[], Any], size_mb: Optional[float] = None):
+        self.name = name
+        self.loader = loader
+        self.size_mb = size_mb          # 预估内存占用，加载后以实测值修正
+        self.on_evict: List[Callable[[], Optional[Callable[[], None]]]] = []  # 回调的引用，见 _callback_ref
+        self.load_lock = threading.Lock()  # 同一模型只加载一次，其他调用方等待加载完成
+        self.model: Any = None
+        self.loaded = False
+        self.pins = 0                   # 正在使用该模型的调用数，大于0时不会被卸载
+        self.footprint_mb = 0.0
+        self.last_used = 0.0
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+
+class ModelRegistry:
+    """模型常驻管理器，按内存预算加载模型，空间不足时按LRU卸载"""
+
+    def __init__(self, budget_mb: Optional[float] = None):
+        if budget_mb is None:
+            budget_mb = float(os.environ.get("VOICE_EMBEDDING_MODEL_BUDGET_MB", 4096))
+        self.budget_mb = budget_mb
+        self.entries: Dict[str, ModelEntry] = {}
+        self.resident: "OrderedDict[str, ModelEntry]" = OrderedDict()  # 按最近使用顺序排列
+        self.lock = threading.RLock()
+        self.evictions = 0
+
+    def register(self, name: str, loader: Callable[[], Any], size_mb: Optional[float] = None,
+                 on_evict: Optional[Callable[[], None]] = None) -> None:
+        """
+        注册模型加载函数
+
+        Args:
+            name: 模型名称，多个工具实例使用同一名称时共享模型
+            loader: 加载模型的函数，返回模型对象
+            size_mb: 预估内存占用（MB）
+            on_evict: 模型被卸载时的回调，用于清除工具实例持有的引用；重复注册同一回调只保留一个
+        """
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                entry = self.entries[name] = ModelEntry(name, loader, size_mb)
+            elif size_mb is not None:
+                entry.size_mb = size_mb
+            # 清理已被回收的工具实例的回调
+            entry.on_evict = [ref for ref in entry.on_evict if ref() is not None]
+            if on_evict is not None and all(ref() != on_evict for ref in entry.on_evict):
+                entry.on_evict.append(_callback_ref(on_evict))
+
+    @property
+    def used_mb(self) -> float:
+        """当前常驻模型的总内存占用"""
+        return sum(entry.footprint_mb for entry in self.resident.values())
+
+    def get(self, name: str) -> Any:
+        """
+        获取模型，未加载时按需加载并在超出预算时卸载最久未使用的模型
+
+        返回的模型可能在之后被卸载，使用期间需要保持常驻时应使用 use()
+
+        Args:
+            name: 已注册的模型名称
+
+        Returns:
+            模型对象
+        """
+        return self._get(name, pin=False)
+
+    def acquire(self, name: str) -> Any:
+        """获取模型并固定，直到调用 unpin() 前不会被卸载"""
+        return self._get(name, pin=True)
+
+    def unpin(self, name: str) -> None:
+        """解除 acquire() 的固定，并卸载固定期间超出预算的模型"""
+        with self.lock:
+            entry = self.entries[name]
+            entry.pins = max(0, entry.pins - 1)
+            self._make_room(0.0)
+
+    @contextlib.contextmanager
+    def use(self, name: str) -> Iterator[Any]:
+        """
+        在使用期间固定模型，用法:
+
+            with registry.use("spleeter:2stems:cpu") as model:
+                model.separate_to_file(...)
+        """
+        model = self.acquire(name)
+        try:
+            yield model
+        finally:
+            self.unpin(name)
+
+    def _get(self, name: str, pin: bool) -> Any:
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                raise KeyError(f"模型未注册: {name}")
+            entry.last_used = time.time()
+            if pin:
+                entry.pins += 1
+            if entry.loaded:
+                entry.hits += 1
+                self.resident.move_to_end(name)
+                return entry.model
+
+        try:
+            return self._load(entry)
+        except BaseException:
+            if pin:
+                with self.lock:
+                    entry.pins -= 1
+            raise
+
+    def _load(self, entry: ModelEntry) -> Any:
+        """
+        加载模型；加载函数在注册表锁之外执行，耗时数秒的加载不会阻塞其他模型的获取
+        """
+        with entry.load_lock:
+            with self.lock:
+                if entry.loaded:
+                    # 等待期间已由其他调用方加载
+                    entry.hits += 1
+                    self.resident.move_to_end(entry.name)
+                    return entry.model
+                self._make_room(entry.size_mb or 0.0, exclude=entry.name)
+
+            rss_before = current_rss_mb()
+            start = time.perf_counter()
+            model = entry.loader()
+            elapsed = time.perf_counter() - start
+            measured = max(0.0, current_rss_mb() - rss_before)
+
+            with self.lock:
+                entry.model = model
+                entry.loaded = True
+                entry.loads += 1
+                entry.load_seconds += elapsed
+                entry.footprint_mb = max(measured, entry.size_mb or 0.0)
+                self.resident[entry.name] = entry
+                print(f"模型已加载: {entry.name} (约 {entry.footprint_mb:.0f} MB, "
+                      f"已用 {self.used_mb:.0f}/{self.budget_mb:.0f} MB)")
+
+                # 实测占用可能超过预估，加载后再检查一次预算
+                self._make_room(0.0, exclude=entry.name)
+            return model
+
+    def _make_room(self, needed_mb: float, exclude: Optional[str] = None) -> None:
+        """
+        卸载最久未使用的模型，直到能容纳needed_mb
+
+        正在使用的模型不会被卸载，此时允许暂时超出预算，解除固定后再卸载
+        """
+        for name, entry in list(self.resident.items()):
+            if self.used_mb + needed_mb <= self.budget_mb:
+                break
+            if name != exclude and entry.pins == 0:
+                self.evict(name)
+
+    def evict(self, name: str) -> bool:
+        """卸载指定模型，返回是否确实卸载；正在使用的模型不会被卸载"""
+        with self.lock:
+            entry = self.resident.get(name)
+            if entry is None or entry.pins > 0:
+                return False
+            del self.resident[name]
+            entry.model = None
+            entry.loaded = False
+            entry.footprint_mb = 0.0
+            entry.evictions += 1
+            self.evictions += 1
+            for ref in entry.on_evict:
+                callback = ref()
+                if callback is None:
+                    continue
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"模型卸载回调失败: {str(e)}")
+            print(f"模型已卸载: {name}")
+            return True
+
+    def release(self, name: str) -> None:
+        """主动释放模型（等同于卸载，但调用方明确不再需要；仍在使用时保留）"""
+        self.evict(name)
+
+    def clear(self) -> None:
+        """卸载所有模型"""
+        with self.lock:
+            for name in list(self.resident):
+                self.evict(name)
+
+    def preload(self, names: Optional[Iterable[str]] = None) -> None:
+        """预加载模型，未指定时加载全部已注册模型（受内存预算限制）"""
+        for name in list(names if names is not None else self.entries):
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"预加载失败: {name}: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """返回加载、命中和卸载计数"""
+        with self.lock:
+            return {
+                "budget_mb": self.budget_mb,
+                "used_mb": round(self.used_mb, 1),
+                "loads": sum(entry.loads for entry in self.entries.values()),
+                "hits": sum(entry.hits for entry in self.entries.values()),
+                "evictions": self.evictions,
+                "models": {
+                    name: {
+                        "loaded": entry.loaded,
+                        "in_use": entry.pins,
+                        "footprint_mb": round(entry.footprint_mb, 1),
+                        "loads": entry.loads,
+                        "hits": entry.hits,
+                        "evictions": entry.evictions,
+                        "load_seconds": round(entry.load_seconds, 3),
+                    }
+                    for name, entry in self.entries.items()
+                },
+            }
+
+
+_default_registry: Optional[ModelRegistry] = None
+_default_lock = threading.Lock()
+
+
+def get_default_registry() -> ModelRegistry:
+    """获取进程内共享的默认模型注册表"""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = ModelRegistry()
+        return _default_registry
+
+
+if __name__ == "__main__":
+    # 使用示例
+    registry = ModelRegistry(budget_mb=1000)
+    registry.register("small", lambda: bytearray(10), size_mb=400)
+    registry.register("large", lambda: bytearray(10), size_mb=700)
+    registry.get("small")
+    registry.get("small")
+    registry.get("large")  # 超出预算，卸载small
+    print(registry.stats())
@@ -0,0 +1,246 @@
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import subprocess
+import threading
+from typing import Optional, Dict, Any, List
+
+from lazyimport.lazyimport import is_available
+
+CACHE_VERSION = 1
+# 运行流水线时依赖的Python包，只检查是否安装，不导入
+PYTHON_PACKAGES = ["spleeter", "tensorflow", "vosk", "torch", "requests", "numpy"]
+# 记录导入耗时的工具模块
+TOOL_MODULES = [
+    "main",
+    "voicedivide.voicedivide",
+    "speechrecognizer.speechrecognizer",
+    "texttranslator.texttranslator",
+    "speechsynthesizer.speechsynthesizer",
+    "lipsync.lipsync",
+    "videocomposer.videocomposer",
+    "mcpgateway.mcpgateway",
+]
+
+
+def cache_dir() -> str:
+    """本项目的缓存目录，遵循 XDG_CACHE_HOME"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "voice-embedding")
+
+
+def default_cache_path() -> str:
+    """缓存文件路径"""
+    return os.path.join(cache_dir(), "preflight.json")
+
+
+def file_key(path: Optional[str]) -> Optional[str]:
+    """由路径、修改时间和大小组成的缓存键，文件被替换或升级后自动失效"""
+    if not path:
+        return None
+    try:
+        real = os.path.realpath(path)
+        stat = os.stat(real)
+    except OSError:
+        return None
+    return f"{real}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def _resolve(binary: str) -> Optional[str]:
+    """将命令名解析为可执行文件的绝对路径"""
+    if os.path.sep in binary:
+        return binary if os.access(binary, os.X_OK) else None
+    return shutil.which(binary)
+
+
+def _list_names(output: str) -> List[str]:
+    """
+    解析 ffmpeg -encoders / -filters 的输出
+
+    每行格式为"标记 名称 描述"，跳过开头的标题行、"标记 = 说明"形式的图例和分隔线
+    """
+    names = []
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) < 2 or not line.startswith(" ") or parts[1] == "=":
+            continue
+        names.append(parts[1])
+    return names
+
+
+def probe_ffmpeg(path: str) -> Dict[str, Any]:
+    """探测FFmpeg版本、编码器和滤镜"""
+    def query(flag: str) -> str:
+        return subprocess.run([path, "-hide_banner", flag], capture_output=True, text=True, timeout=30).stdout
+
+    version_line = query("-version").split("\n")[0]
+    match = re.search(r"version (\S+)", version_line)
+    return {
+        "path": path,
+        "version": match.group(1) if match else version_line,
+        "version_line": version_line,
+        "encoders": _list_names(query("-encoders")),
+        "filters": _list_names(query("-filters")),
+    }
+
+
+def probe_version(path: str) -> Dict[str, Any]:
+    """探测一般命令行工具（如ffprobe）的版本"""
+    result = subprocess.run([path, "-version"], capture_output=True, text=True, timeout=30)
+    return {"path": path, "version_line": result.stdout.split("\n")[0]}
+
+
+class Preflight:
+    """
+    启动前检查外部工具的路径、版本和能力，结果缓存到磁盘
+
+    缓存按工具分条保存，键由可执行文件（或模型文件）的真实路径、修改时间和大小组成，
+    工具升级或替换后对应条目自动重新探测；同一进程内的重复查询直接返回内存中的结果
+    """
+
+    def __init__(self, cache_path: Optional[str] = None):
+        self.cache_path = cache_path or default_cache_path()
+        self.lock = threading.Lock()
+        self._entries: Optional[Dict[str, Any]] = None
+
+    def _load(self) -> Dict[str, Any]:
+        if self._entries is None:
+            try:
+                with open(self.cache_path) as f:
+                    data = json.load(f)
+                self._entries = data["entries"] if data.get("version") == CACHE_VERSION else {}
+            except (OSError, ValueError, KeyError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self) -> None:
+        """原子地写入缓存文件，写入失败（如只读目录）时只保留内存缓存"""
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"version": CACHE_VERSION, "entries": self._entries}, f, indent=2)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            pass
+
+    def _cached(self, name: str, key: Optional[str], probe, refresh: bool = False) -> Optional[Dict[str, Any]]:
+        """返回缓存条目，键不匹配时调用probe重新探测"""
+        with self.lock:
+            entries = self._load()
+            entry = entries.get(name)
+            if not refresh and entry is not None and entry.get("key") == key:
+                return entry["info"]
+            try:
+                info = probe() if key is not None else None
+            except (OSError, subprocess.SubprocessError):
+                info = None
+            entries[name] = {"key": key, "info": info}
+            self._save()
+            return info
+
+    def ffmpeg(self, binary: str = "ffmpeg", refresh: bool = False) -> Optional[Dict[str, Any]]:
+        """FFmpeg的版本、编码器和滤镜，不可用时返回None"""
+        path = _resolve(binary)
+        return self._cached(f"ffmpeg:{binary}", file_key(path), lambda: probe_ffmpeg(path), refresh)
+
+    def ffprobe(self, binary: str = "ffprobe", refresh: bool = False) -> Optional[Dict[str, Any]]:
+        """ffprobe的路径和版本，不可用时返回None"""
+        path = _resolve(binary)
+        return self._cached(f"ffprobe:{binary}", file_key(path), lambda: probe_version(path), refresh)
+
+    def binary(self, binary: str, refresh: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        只检查命令是否存在，不执行
+
+        spleeter等命令启动时会初始化TensorFlow，执行 --version 需要数秒
+        """
+        path = _resolve(binary)
+        return self._cached(f"bin:{binary}", file_key(path), lambda: {"path": path}, refresh)
+
+    def model_file(self, path: Optional[str], refresh: bool = False) -> Optional[Dict[str, Any]]:
+        """模型文件（如Wav2Lip checkpoint）是否存在及其大小"""
+        return self._cached(f"file:{path}", file_key(path),
+                            lambda: {"path": path, "size_mb": round(os.path.getsize(path) / 2 ** 20, 1)}, refresh)
+
+    def has_encoder(self, name: str, binary: str = "ffmpeg") -> bool:
+        info = self.ffmpeg(binary)
+        return info is not None and name in info["encoders"]
+
+    def has_filter(self, name: str, binary: str = "ffmpeg") -> bool:
+        info = self.ffmpeg(binary)
+        return info is not None and name in info["filters"]
+
+    def report(self, ffmpeg_path: str = "ffmpeg", ffprobe_path: str = "ffprobe", spleeter_path: str = "spleeter",
+               wav2lip_checkpoint: Optional[str] = None, refresh: bool = False) -> Dict[str, Any]:
+        """汇总所有外部依赖的检查结果"""
+        ffmpeg = self.ffmpeg(ffmpeg_path, refresh)
+        return {
+            "ffmpeg": ffmpeg and {
+                "path": ffmpeg["path"],
+                "version": ffmpeg["version"],
+                "encoders": len(ffmpeg["encoders"]),
+                "filters": len(ffmpeg["filters"]),
+                "libx264": "libx264" in ffmpeg["encoders"],
+                "aac": "aac" in ffmpeg["encoders"],
+                "amix": "amix" in ffmpeg["filters"],
+            },
+            "ffprobe": self.ffprobe(ffprobe_path, refresh),
+            "spleeter": self.binary(spleeter_path, refresh),
+            "wav2lip_checkpoint": self.model_file(wav2lip_checkpoint, refresh) if wav2lip_checkpoint else None,
+            "python_packages": {name: is_available(name) for name in PYTHON_PACKAGES},
+            "cache": self.cache_path,
+        }
+
+
+_preflight: Optional[Preflight] = None
+
+
+def get_preflight() -> Preflight:
+    """获取进程内共享的Preflight实例"""
+    global _preflight
+    if _preflight is None:
+        _preflight = Preflight()
+    return _preflight
+
+
+def measure_import_times(modules: Optional[List[str]] = None) -> Dict[str, float]:
+    """
+    在独立的解释器中逐个导入模块，测量各模块的导入耗时（毫秒）
+
+    使用 python -X importtime，结果不受当前进程已导入模块的影响
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = {}
+    for module in modules or TOOL_MODULES:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, cwd=root
+        )
+        cumulative = None
+        for line in result.stderr.splitlines():
+            # 格式: import time: self [us] | cumulative | imported package
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].strip() == module:
+                cumulative = int(parts[1].strip()) / 1000
+        times[module] = round(cumulative, 1) if cumulative is not None else float("nan")
+    return times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检查外部工具并测量模块导入耗时")
+    parser.add_argument("--refresh", action="store_true", help="忽略缓存重新探测")
+    parser.add_argument("--import-times", action="store_true", help="测量各模块导入耗时")
+    args = parser.parse_args()
+
+    print(json.dumps(get_preflight().report(
+        os.environ.get("FFMPEG_PATH", "ffmpeg"),
+        wav2lip_checkpoint=os.environ.get("WAV2LIP_CHECKPOINT"),
+        refresh=args.refresh,
+    ), ensure_ascii=False, indent=2))
+    if args.import_times:
+        for module, ms in measure_import_times().items():
+            print(f"{module:40s} {ms:8.1f} ms")
@@ -0,0 +1,376 @@
+import os
+import time
+import contextvars
+from collections import deque
+from typing import Optional, Dict, Any, List, Tuple, Deque
+
+from tracing.tracing import get_tracer
+from lazyimport.lazyimport import lazy_import
+
+# 工具模块导入本模块只为读取当前预留，asyncio在创建调度器时才需要
+asyncio = lazy_import("asyncio")
+
+# 控制子进程（以及之后才导入的数值库）线程数的环境变量
+THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+]
+# 内存余量：测得的可用内存中留给系统和页缓存的部分
+HEADROOM_FRACTION = 0.1
+MIN_HEADROOM_MB = 512
+
+
+class StageProfile:
+    """阶段的资源需求"""
+
+    def __init__(self, name: str, threads: int = 1, memory_mb: float = 256, io_bound: bool = False):
+        """
+        Args:
+            name: 阶段名称
+            threads: 占用的CPU线程数，io_bound的阶段不占用CPU配额
+            memory_mb: 峰值内存（MB）
+            io_bound: 是否主要在等待网络或磁盘
+        """
+        self.name = name
+        self.threads = threads
+        self.memory_mb = memory_mb
+        self.io_bound = io_bound
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"threads": self.threads, "memory_mb": self.memory_mb, "io_bound": self.io_bound}
+
+
+# 各阶段的默认资源需求，名称与MCP网关的工具名一致
+DEFAULT_PROFILES = {
+    "voice_divide": StageProfile("voice_divide", threads=4, memory_mb=1500),        # Spleeter/TensorFlow
+    "speaker_cluster": StageProfile("speaker_cluster", threads=1, memory_mb=300),
+    "speech_recognizer": StageProfile("speech_recognizer", threads=1, memory_mb=800),  # Vosk
+    "text_translator": StageProfile("text_translator", memory_mb=50, io_bound=True),
+    "speech_synthesizer": StageProfile("speech_synthesizer", memory_mb=50, io_bound=True),
+    "lip_sync": StageProfile("lip_sync", threads=4, memory_mb=2500),                 # Wav2Lip/PyTorch
+    "video_composer": StageProfile("video_composer", threads=2, memory_mb=300),      # FFmpeg
+}
+
+
+def read_meminfo() -> Dict[str, float]:
+    """读取 /proc/meminfo（MB），不支持的平台返回空字典"""
+    values = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                values[name] = int(rest.split()[0]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return values
+
+
+def _cgroup_memory_limit_mb() -> Optional[float]:
+    """容器内的cgroup内存上限（MB），没有限制时返回None"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value) / (1024 * 1024)
+    return None
+
+
+def measure_capacity() -> Tuple[int, float]:
+    """
+    测量本机可用的CPU数和内存
+
+    Returns:
+        (CPU数, 可分配内存MB)，内存为可用内存扣除余量后的值
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    meminfo = read_meminfo()
+    available = meminfo.get("MemAvailable", 4096.0)
+    limit = _cgroup_memory_limit_mb()
+    if limit is not None:
+        available = min(available, limit)
+    headroom = max(available * HEADROOM_FRACTION, MIN_HEADROOM_MB)
+    return cpus, max(available - headroom, 256.0)
+
+
+class Grant:
+    """一次资源预留"""
+
+    def __init__(self, stage: str, threads: int, memory_mb: float, io_bound: bool):
+        self.stage = stage
+        self.threads = threads
+        self.memory_mb = memory_mb
+        self.io_bound = io_bound
+        self.queued_at = time.perf_counter()
+        self.started_at = 0.0
+
+    @property
+    def env(self) -> Dict[str, str]:
+        """子进程的线程数环境变量"""
+        env = {name: str(self.threads) for name in THREAD_ENV_VARS}
+        env["TF_NUM_INTEROP_THREADS"] = "1" if self.threads < 4 else "2"
+        return env
+
+    def ffmpeg_args(self) -> List[str]:
+        return ["-threads", str(self.threads)]
+
+
+# 当前任务所持有的预留，供子进程启动时读取线程数
+_current_grant: contextvars.ContextVar = contextvars.ContextVar("current_grant", default=None)
+
+
+def current_grant() -> Optional[Grant]:
+    return _current_grant.get()
+
+
+def child_env(env: Optional[Dict[str, str]] = None) -> Optional[Dict[str, str]]:
+    """
+    按当前任务的预留设置子进程的线程数环境变量
+
+    不在预留内（或预留为I/O密集阶段）时原样返回；调用方已显式设置的值优先
+    """
+    grant = _current_grant.get()
+    if grant is None or grant.io_bound:
+        return env
+    if env is None:
+        return dict(os.environ, **grant.env)
+    return dict(grant.env, **env)
+
+
+def ffmpeg_threads() -> List[str]:
+    """
+    当前预留对应的FFmpeg线程数选项，不在预留内时返回空列表
+
+    由构建FFmpeg命令的地方作为输出选项放在输出路径之前
+    """
+    grant = _current_grant.get()
+    if grant is None or grant.io_bound:
+        return []
+    return grant.ffmpeg_args()
+
+
+class _StageStats:
+    def __init__(self):
+        self.count = 0
+        self.running = 0
+        self.queued = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "running": self.running,
+            "queued": self.queued,
+            "wait_mean_s": round(self.wait_total / self.count, 3) if self.count else 0.0,
+            "wait_max_s": round(self.wait_max, 3),
+            "wait_total_s": round(self.wait_total, 3),
+            "run_mean_s": round(self.run_total / self.count, 3) if self.count else 0.0,
+            "run_max_s": round(self.run_max, 3),
+            "run_total_s": round(self.run_total, 3),
+        }
+
+
+class ResourceScheduler:
+    """
+    按CPU和内存容量调度流水线阶段
+
+    每个阶段按其资源需求预留CPU线程和内存，容量不足时排队；I/O密集的阶段只占用I/O槽位，
+    可以与计算阶段并行，从而在不超出内存的前提下让CPU保持忙碌。
+    排队时按先来先服务，队首放不下时允许后面较小的任务先运行（回填），
+    队首等待超过 starvation_seconds 后停止回填，等待资源释放给队首
+    """
+
+    def __init__(self, cpus: Optional[int] = None, memory_mb: Optional[float] = None,
+                 profiles: Optional[Dict[str, StageProfile]] = None, io_slots: int = 64,
+                 starvation_seconds: float = 30.0):
+        """
+        初始化调度器
+
+        Args:
+            cpus: CPU容量，默认为本进程可用的CPU数
+            memory_mb: 内存容量（MB），默认为测得的可用内存扣除余量
+            profiles: 各阶段的资源需求，覆盖默认值
+            io_slots: I/O密集阶段的最大并发数
+            starvation_seconds: 队首等待多久后停止回填
+        """
+        measured_cpus, measured_memory = measure_capacity()
+        self.cpus = cpus or measured_cpus
+        self.memory_mb = memory_mb or measured_memory
+        self.profiles = dict(DEFAULT_PROFILES)
+        self.profiles.update(profiles or {})
+        self.io_slots = io_slots
+        self.starvation_seconds = starvation_seconds
+        self.free_cpus = self.cpus
+        self.free_memory_mb = self.memory_mb
+        self.free_io_slots = io_slots
+        self.waiters: Deque[Tuple[Grant, asyncio.Future]] = deque()
+        self.stats: Dict[str, _StageStats] = {}
+        self.started = time.perf_counter()
+        self.busy_cpu_seconds = 0.0
+
+    def profile(self, stage: str) -> StageProfile:
+        """返回阶段的资源需求，未知阶段按单线程处理"""
+        return self.profiles.get(stage) or StageProfile(stage)
+
+    def _request(self, stage: str) -> Grant:
+        """创建预留请求，超出总容量的需求截断到总容量，使其能够单独运行"""
+        profile = self.profile(stage)
+        threads = min(max(profile.threads, 1), self.cpus)
+        return Grant(stage, threads, min(profile.memory_mb, self.memory_mb), profile.io_bound)
+
+    def _fits(self, grant: Grant) -> bool:
+        if grant.memory_mb > self.free_memory_mb:
+            return False
+        if grant.io_bound:
+            return self.free_io_slots > 0
+        if grant.threads > self.free_cpus:
+            return False
+        if self.free_memory_mb < self.memory_mb:
+            # 已有任务在运行时再检查实际可用内存，避免预估偏低或其他进程占用内存导致换页；
+            # 没有任务运行时总是放行，保证不会因外部占用而永远等待
+            available = read_meminfo().get("MemAvailable")
+            if available is not None and available < grant.memory_mb + MIN_HEADROOM_MB:
+                return False
+        return True
+
+    def _acquire(self, grant: Grant) -> None:
+        self.free_memory_mb -= grant.memory_mb
+        if grant.io_bound:
+            self.free_io_slots -= 1
+        else:
+            self.free_cpus -= grant.threads
+        grant.started_at = time.perf_counter()
+        stats = self.stats.setdefault(grant.stage, _StageStats())
+        stats.queued -= 1
+        stats.running += 1
+        wait = grant.started_at - grant.queued_at
+        stats.wait_total += wait
+        stats.wait_max = max(stats.wait_max, wait)
+
+    def _release(self, grant: Grant) -> None:
+        self.free_memory_mb += grant.memory_mb
+        if grant.io_bound:
+            self.free_io_slots += 1
+        else:
+            self.free_cpus += grant.threads
+        elapsed = time.perf_counter() - grant.started_at
+        if not grant.io_bound:
+            self.busy_cpu_seconds += elapsed * grant.threads
+        stats = self.stats[grant.stage]
+        stats.running -= 1
+        stats.count += 1
+        stats.run_total += elapsed
+        stats.run_max = max(stats.run_max, elapsed)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """按顺序唤醒能放下的等待者"""
+        now = time.perf_counter()
+        for grant, future in list(self.waiters):
+            if future.done():
+                self.waiters.remove((grant, future))
+                continue
+            if self._fits(grant):
+                self.waiters.remove((grant, future))
+                self._acquire(grant)
+                future.set_result(None)
+            elif now - grant.queued_at > self.starvation_seconds:
+                break  # 队首等待过久，停止回填
+
+    async def acquire(self, stage: str) -> Grant:
+        """等待资源并返回预留，使用完毕后必须调用 release()"""
+        grant = self._request(stage)
+        self.stats.setdefault(stage, _StageStats()).queued += 1
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((grant, future))
+        self._dispatch()
+        if future.done():
+            return grant  # 无需等待
+        try:
+            with get_tracer().span(f"queue:{stage}", "queue"):
+                await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(grant)  # 已获得资源但任务被取消
+            else:
+                self.stats[stage].queued -= 1
+                if (grant, future) in self.waiters:
+                    self.waiters.remove((grant, future))
+            raise
+        return grant
+
+    def release(self, grant: Grant) -> None:
+        self._release(grant)
+
+    def reserve(self, stage: str) -> "_Reservation":
+        """
+        预留阶段所需资源，用法:
+
+            async with scheduler.reserve("lip_sync") as grant:
+                await lip_sync.synchronize_async(...)
+
+        在预留内通过 tracing.run、aioutils.run_command 启动的子进程会获得线程数环境变量，
+        FFmpeg命令通过 ffmpeg_threads() 显式加上 -threads
+        """
+        return _Reservation(self, stage)
+
+    def report(self) -> Dict[str, Any]:
+        """各阶段的排队时间与运行时间，以及CPU利用率"""
+        elapsed = time.perf_counter() - self.started
+        return {
+            "capacity": {"cpus": self.cpus, "memory_mb": round(self.memory_mb), "io_slots": self.io_slots},
+            "free": {"cpus": self.free_cpus, "memory_mb": round(self.free_memory_mb), "io_slots": self.free_io_slots},
+            "waiting": len(self.waiters),
+            "cpu_utilization": round(self.busy_cpu_seconds / (elapsed * self.cpus), 3) if elapsed > 0 else 0.0,
+            "stages": {name: stats.to_dict() for name, stats in self.stats.items()},
+        }
+
+
+class _Reservation:
+    """reserve() 返回的异步上下文管理器"""
+
+    def __init__(self, scheduler: ResourceScheduler, stage: str):
+        self.scheduler = scheduler
+        self.stage = stage
+        self.grant: Optional[Grant] = None
+        self.token = None
+
+    async def __aenter__(self) -> Grant:
+        self.grant = await self.scheduler.acquire(self.stage)
+        self.token = _current_grant.set(self.grant)
+        return self.grant
+
+    async def __aexit__(self, *exc) -> bool:
+        _current_grant.reset(self.token)
+        self.scheduler.release(self.grant)
+        return False
+
+
+if __name__ == "__main__":
+    # 使用示例：模拟多个视频同时运行时的调度
+    async def demo() -> None:
+        scheduler = ResourceScheduler()
+        durations = {"voice_divide": 0.3, "speech_recognizer": 0.2, "text_translator": 0.1,
+                     "speech_synthesizer": 0.2, "lip_sync": 0.5, "video_composer": 0.1}
+
+        async def job() -> None:
+            for stage, seconds in durations.items():
+                async with scheduler.reserve(stage):
+                    await asyncio.sleep(seconds)
+
+        await asyncio.gather(*(job() for _ in range(8)))
+        import json
+        print(json.dumps(scheduler.report(), ensure_ascii=False, indent=2))
+
+    asyncio.run(demo())
@@ -0,0 +1,362 @@
+import os
+import wave
+import numpy as np
+from typing import List, Dict, Optional, Any, Sequence
+
+class SpeakerCluster:
+    """说话人聚类工具，对分离后的人声分段提取声纹特征并聚类为不同说话人"""
+
+    def __init__(self, threshold: float = 0.75, max_speakers: int = 8,
+                 segment_seconds: float = 1.5, exact_limit: int = 400,
+                 batch_size: int = 256, silence_db: float = -50.0, dynamic_range_db: float = 35.0):
+        self.threshold = threshold          # 余弦相似度阈值，高于该值视为同一说话人
+        self.max_speakers = max_speakers    # 说话人数量上限
+        self.segment_seconds = segment_seconds  # 每个分段的最大时长（秒）
+        self.exact_limit = exact_limit      # 分段数不超过该值时使用完整相似度矩阵
+        self.batch_size = batch_size        # 增量聚类的批大小
+        self.silence_db = silence_db        # 帧电平低于该值（dBFS）视为静音
+        self.dynamic_range_db = dynamic_range_db  # 帧电平低于最响部分该值以上视为静音
+        self.frame_ms = 25                  # 分帧窗长（毫秒）
+        self.hop_ms = 10                    # 帧移（毫秒）
+        self.n_bands = 32                   # 频带数量
+
+    def load_audio(self, audio_path: str) -> Optional[Dict[str, Any]]:
+        """
+        读取WAV音频并转换为单声道浮点数组
+
+        Args:
+            audio_path: 输入音频文件路径（VoiceDivide输出的vocals.wav）
+
+        Returns:
+            {'samples': 数组, 'sample_rate': 采样率}，读取失败时返回None
+        """
+        try:
+            with wave.open(audio_path, "rb") as wf:
+                channels = wf.getnchannels()
+                sample_width = wf.getsampwidth()
+                sample_rate = wf.getframerate()
+                raw = wf.readframes(wf.getnframes())
+        except Exception as e:
+            print(f"读取音频失败: {str(e)}")
+            return None
+
+        dtype = {1: np.uint8, 2: np.int16, 4: np.int32}.get(sample_width)
+        if dtype is None:
+            print(f"不支持的采样位宽: {sample_width}")
+            return None
+
+        samples = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+        if sample_width == 1:
+            samples = (samples - 128.0) / 128.0
+        else:
+            samples /= float(2 ** (8 * sample_width - 1))
+        if channels > 1:
+            samples = samples.reshape(-1, channels).mean(axis=1)
+
+        return {"samples": samples, "sample_rate": sample_rate}
+
+    def _frames(self, samples: np.ndarray, sample_rate: int) -> np.ndarray:
+        """分帧，返回形状为 (帧数, 帧长) 的数组"""
+        frame_len = int(sample_rate * self.frame_ms / 1000)
+        hop = int(sample_rate * self.hop_ms / 1000)
+        if len(samples) < frame_len:
+            return np.zeros((0, frame_len), dtype=np.float32)
+
+        # 使用步幅视图分帧，避免逐帧拷贝
+        n_frames = 1 + (len(samples) - frame_len) // hop
+        return np.lib.stride_tricks.as_strided(
+            samples,
+            shape=(n_frames, frame_len),
+            strides=(samples.strides[0] * hop, samples.strides[0])
+        )
+
+    @staticmethod
+    def _frame_levels(frames: np.ndarray) -> np.ndarray:
+        """计算逐帧电平（dBFS）"""
+        rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+        return 20 * np.log10(np.maximum(rms, 1e-10))
+
+    def _frame_features(self, frames: np.ndarray) -> np.ndarray:
+        """
+        计算逐帧对数频带能量，返回形状为 (帧数, 频带数) 的数组
+
+        每个频带取每个频点的平均能量，白噪声在各频带上的值相同，以此作为固定的背景参考；
+        再减去每帧在各频带上的均值，只保留与音量无关的频谱形状
+        """
+        if len(frames) == 0:
+            return np.zeros((0, self.n_bands), dtype=np.float32)
+        frame_len = frames.shape[1]
+        spectrum = np.abs(np.fft.rfft(frames * np.hanning(frame_len), axis=1)) ** 2
+
+        # 按对数间隔划分频带（近似梅尔刻度）
+        n_bins = spectrum.shape[1]
+        edges = np.unique(np.geomspace(1, n_bins, self.n_bands + 1).astype(int))[:-1]
+        widths = np.diff(np.append(edges, n_bins))
+        band_energy = np.add.reduceat(spectrum, edges, axis=1) / widths
+        features = np.log(band_energy + 1e-10)
+        features -= features.mean(axis=1, keepdims=True)
+        if features.shape[1] < self.n_bands:
+            # 频点不足时补零，补出的频带对所有分段相同，不影响相似度
+            features = np.pad(features, ((0, 0), (0, self.n_bands - features.shape[1])))
+        return features.astype(np.float32)
+
+    def extract_segments(self, audio_path: str) -> List[Dict[str, Any]]:
+        """
+        按能量检测语音区域，切分为短分段并提取每段的声纹向量
+
+        Args:
+            audio_path: 输入音频文件路径
+
+        Returns:
+            分段列表 [{'start': 秒, 'end': 秒, 'embedding': 向量}, ...]
+        """
+        audio = self.load_audio(audio_path)
+        if audio is None:
+            return []
+
+        frames = self._frames(audio["samples"], audio["sample_rate"])
+        if len(frames) == 0:
+            return []
+        features = self._frame_features(frames)
+
+        # 基于帧电平的简单语音活动检测：高于绝对静音电平，且与最响部分的差距在动态范围内
+        levels = self._frame_levels(frames)
+        threshold = max(self.silence_db, np.percentile(levels, 95) - self.dynamic_range_db)
+        speech = levels > threshold
+
+        # 找出连续语音区域的起止帧
+        padded = np.concatenate(([False], speech, [False]))
+        changes = np.flatnonzero(padded[1:] != padded[:-1])
+        regions = changes.reshape(-1, 2)
+
+        hop_s = self.hop_ms / 1000.0
+        max_frames = max(1, int(self.segment_seconds / hop_s))
+        min_frames = max(1, int(0.3 / hop_s))
+
+        segments = []
+        for region_start, region_end in regions:
+            for start in range(region_start, region_end, max_frames):
+                end = min(start + max_frames, region_end)
+                if end - start < min_frames:
+                    continue
+                block = features[start:end]
+                embedding = np.concatenate((block.mean(axis=0), block.std(axis=0)))
+                segments.append({
+                    "start": round(float(start * hop_s), 3),
+                    "end": round(float(end * hop_s), 3),
+                    "embedding": embedding
+                })
+
+        if segments:
+            # L2归一化，使余弦相似度等于点积；不减去整个文件的均值，否则只有一个说话人时
+            # 说话人本身的特征被减掉，剩下的噪声会被聚成多个说话人
+            matrix = self._normalize(np.stack([seg["embedding"] for seg in segments]))
+            for seg, row in zip(segments, matrix):
+                seg["embedding"] = row
+
+        return segments
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        """对每一行做L2归一化"""
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-10)
+
+    def _cluster_exact(self, embeddings: np.ndarray) -> np.ndarray:
+        """短音频：基于完整余弦相似度矩阵的贪心聚类，O(n²)但完全向量化"""
+        n = len(embeddings)
+        labels = np.full(n, -1, dtype=np.int64)
+        similarity = embeddings @ embeddings.T
+        adjacency = similarity >= self.threshold
+
+        n_clusters = 0
+        while (labels < 0).any():
+            unassigned = labels < 0
+            # 选择在未分配分段中邻居最多的分段作为新簇中心，已分配的分段不参与选择，
+            # 即使所有未分配分段都没有邻居（如全零或完全相同的向量），每轮也至少分配中心自身
+            degree = np.where(unassigned, adjacency[:, unassigned].sum(axis=1), -1)
+            center = int(np.argmax(degree))
+            members = unassigned & adjacency[center]
+            members[center] = True
+            labels[members] = n_clusters
+            n_clusters += 1
+
+        centroids = self._centroids(embeddings, labels, n_clusters)
+        centroids = self._limit_speakers(centroids, np.bincount(labels, minlength=n_clusters))
+        return self._assign(embeddings, centroids)
+
+    def _cluster_incremental(self, embeddings: np.ndarray) -> np.ndarray:
+        """长音频：小批量增量聚类，每批只与当前簇中心比较，复杂度为 O(n·k)"""
+        centroids = np.zeros((0, embeddings.shape[1]), dtype=embeddings.dtype)
+        counts = np.zeros(0, dtype=np.int64)
+
+        for offset in range(0, len(embeddings), self.batch_size):
+            batch = embeddings[offset:offset + self.batch_size]
+
+            if len(centroids):
+                similarity = batch @ centroids.T
+                best = similarity.argmax(axis=1)
+                matched = similarity[np.arange(len(batch)), best] >= self.threshold
+            else:
+                best = np.zeros(len(batch), dtype=np.int64)
+                matched = np.zeros(len(batch), dtype=bool)
+
+            # 已匹配的分段以累计均值更新对应簇中心
+            if matched.any():
+                k = len(centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, best[matched], batch[matched])
+                batch_counts = np.bincount(best[matched], minlength=k)
+                total = counts + batch_counts
+                updated = total > 0
+                centroids[updated] = (
+                    centroids[updated] * counts[updated, None] + sums[updated]
+                ) / total[updated, None]
+                counts = total
+
+            # 未匹配的分段在批内做精确聚类，生成新的簇中心
+            if (~matched).any():
+                leftovers = batch[~matched]
+                labels = self._cluster_exact(leftovers)
+                n_new = int(labels.max()) + 1
+                centroids = np.vstack((centroids, self._centroids(leftovers, labels, n_new)))
+                counts = np.concatenate((counts, np.bincount(labels, minlength=n_new)))
+
+            centroids = self._normalize(centroids)
+            if len(centroids) > self.max_speakers:
+                centroids, counts = self._merge_closest(centroids, counts, self.max_speakers)
+
+        return self._assign(embeddings, centroids)
+
+    def _centroids(self, embeddings: np.ndarray, labels: np.ndarray, n_clusters: int) -> np.ndarray:
+        """计算每个簇的归一化中心向量"""
+        sums = np.zeros((n_clusters, embeddings.shape[1]), dtype=embeddings.dtype)
+        np.add.at(sums, labels, embeddings)
+        return self._normalize(sums)
+
+    def _limit_speakers(self, centroids: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """簇数量超过上限时合并最相近的簇"""
+        if len(centroids) > self.max_speakers:
+            centroids, _ = self._merge_closest(centroids, counts, self.max_speakers)
+        return centroids
+
+    def _merge_closest(self, centroids: np.ndarray, counts: np.ndarray, limit: int):
+        """反复合并相似度最高的两个簇，直到簇数量不超过limit"""
+        centroids = centroids.copy()
+        counts = counts.astype(np.float64)
+        while len(centroids) > limit:
+            similarity = centroids @ centroids.T
+            np.fill_diagonal(similarity, -np.inf)
+            i, j = np.unravel_index(np.argmax(similarity), similarity.shape)
+            merged = centroids[i] * counts[i] + centroids[j] * counts[j]
+            centroids[i] = merged / max(np.linalg.norm(merged), 1e-10)
+            counts[i] += counts[j]
+            centroids = np.delete(centroids, j, axis=0)
+            counts = np.delete(counts, j)
+        return centroids, counts.astype(np.int64)
+
+    @staticmethod
+    def _assign(embeddings: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """将每个分段分配给最相似的簇中心，并按首次出现顺序重新编号"""
+        labels = (embeddings @ centroids.T).argmax(axis=1)
+        _, first_seen = np.unique(labels, return_index=True)
+        order = labels[np.sort(first_seen)]
+        remap = np.zeros(len(centroids), dtype=np.int64)
+        remap[order] = np.arange(len(order))
+        return remap[labels]
+
+    def cluster(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        对声纹向量聚类
+
+        Args:
+            embeddings: 形状为 (分段数, 维度) 的L2归一化向量
+
+        Returns:
+            每个分段的说话人编号数组
+        """
+        if len(embeddings) == 0:
+            return np.zeros(0, dtype=np.int64)
+        if len(embeddings) <= self.exact_limit:
+            return self._cluster_exact(embeddings)
+        return self._cluster_incremental(embeddings)
+
+    def diarize(self, audio_path: str) -> List[Dict[str, Any]]:
+        """
+        对人声音频进行说话人分离
+
+        Args:
+            audio_path: 输入音频文件路径（VoiceDivide输出的vocals.wav）
+
+        Returns:
+            分段列表 [{'start': 秒, 'end': 秒, 'speaker': 说话人编号}, ...]
+        """
+        print(f"正在进行说话人聚类: {audio_path}")
+        segments = self.extract_segments(audio_path)
+        if not segments:
+            print("未检测到有效语音分段")
+            return []
+
+        embeddings = np.stack([seg["embedding"] for seg in segments])
+        labels = self.cluster(embeddings)
+
+        result = [
+            {"start": seg["start"], "end": seg["end"], "speaker": int(label)}
+            for seg, label in zip(segments, labels)
+        ]
+        print(f"说话人聚类完成: {len(result)} 个分段, {len(set(labels.tolist()))} 个说话人")
+        return result
+
+    @staticmethod
+    def turns(segments: List[Dict[str, Any]], max_gap: float = 0.5) -> List[Dict[str, Any]]:
+        """
+        将同一说话人相邻的分段合并为发言轮次，供逐轮识别、翻译和合成
+
+        Args:
+            segments: diarize() 返回的分段列表
+            max_gap: 同一说话人的两个分段间隔不超过该值（秒）时合并
+
+        Returns:
+            轮次列表 [{'start': 秒, 'end': 秒, 'speaker': 说话人编号}, ...]
+        """
+        result: List[Dict[str, Any]] = []
+        for seg in segments:
+            last = result[-1] if result else None
+            if last is not None and last["speaker"] == seg["speaker"] and seg["start"] - last["end"] <= max_gap:
+                last["end"] = seg["end"]
+            else:
+                result.append({"start": seg["start"], "end": seg["end"], "speaker": seg["speaker"]})
+        return result
+
+    @staticmethod
+    def map_speakers(segments: List[Dict[str, Any]], choices: Sequence[Any],
+                     repeat: bool = True) -> Dict[int, Any]:
+        """
+        为每个说话人分配一个选项（如TTS发音人或口型同步的人脸位置）
+        说话时长越长的说话人优先获得靠前的选项
+
+        Args:
+            segments: diarize() 返回的分段列表
+            choices: 可选项列表，例如 ["xiaoyan", "aisjiuxu"]
+            repeat: 选项不足时是否循环使用；为False时多出的说话人不分配（人脸不能共用）
+
+        Returns:
+            {说话人编号: 选项}
+        """
+        if not choices:
+            return {}
+        durations: Dict[int, float] = {}
+        for seg in segments:
+            durations[seg["speaker"]] = durations.get(seg["speaker"], 0.0) + seg["end"] - seg["start"]
+        ranked = sorted(durations, key=lambda speaker: -durations[speaker])
+        if not repeat:
+            ranked = ranked[:len(choices)]
+        return {speaker: choices[i % len(choices)] for i, speaker in enumerate(ranked)}
+
+if __name__ == "__main__":
+    # 使用示例
+    diarizer = SpeakerCluster(threshold=0.75)
+    segments = diarizer.diarize("output_folder/vocals.wav")
+    voices = SpeakerCluster.map_speakers(segments, ["xiaoyan", "aisjiuxu"])
+    for seg in segments:
+        print(f"{seg['start']:.2f}-{seg['end']:.2f}s 说话人{seg['speaker']} 发音人={voices[seg['speaker']]}")
@@ -1,33 +1,74 @@
 import os
+import contextlib
 import wave
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator
+
+from tracing.tracing import traced, add_bytes, file_size
+from lazyimport.lazyimport import lazy_import
+
+asyncio = lazy_import("asyncio")
 
 class SpeechRecognizer:
     """语音识别工具，使用Vosk识别语音"""
     
-    def __init__(self, model_path: Optional[str] = None, language: str = "ja"):
+    def __init__(self, model_path: Optional[str] = None, language: str = "ja",
+                 registry: Optional[Any] = None):
         self.model = None
         self.model_path = model_path
         self.language = language
         self.sample_rate = 16000  # Vosk推荐采样率
+        self.registry = registry  # 可选的ModelRegistry，由其统一管理模型常驻
+        self.registry_key = f"vosk:{model_path or self.language}"
+        if self.registry is not None:
+            from modelregistry.modelregistry import path_size_mb
+            # Vosk加载后的内存占用与模型目录大小相近，目录不存在时按小模型估算
+            size_mb = path_size_mb(model_path) * 1.2 or 500
+            self.registry.register(self.registry_key, self._create_model,
+                                   size_mb=size_mb, on_evict=self._on_evict)
+    
+    def _create_model(self) -> Any:
+        """创建Vosk模型实例"""
+        # 实际使用时取消注释并安装vosk库
+        # from vosk import Model
+        # if not self.model_path:
+        #     self.model_path = Model.get_model_path(f"vosk-model-{self.language}")
+        # return Model(self.model_path)
+        return None
+    
+    def _on_evict(self) -> None:
+        """模型被注册表卸载时清除本实例持有的引用"""
+        self.model = None
+
+    @contextlib.contextmanager
+    def _model_in_use(self) -> Iterator[Any]:
+        """加载模型并在使用期间保持常驻；使用注册表时以固定的方式阻止卸载"""
+        if self.registry is None:
+            if self.model is None:
+                self.load_model()
+            yield self.model
+            return
+        with self.registry.use(self.registry_key) as model:
+            self.model = model
+            yield model
     
+    @traced("SpeechRecognizer.load_model", "model")
     def load_model(self) -> None:
         """加载Vosk模型"""
+        if self.registry is not None:
+            # 每次使用都经过注册表，以便更新LRU顺序和命中计数
+            self.model = self.registry.get(self.registry_key)
+            return
         if self.model is not None:
             return  # 模型已加载
             
         try:
-            # 实际使用时取消注释并安装vosk库
-            # from vosk import Model, KaldiRecognizer
-            # if not self.model_path:
-            #     from vosk import Model
-            #     self.model_path = Model.get_model_path(f"vosk-model-{self.language}")
-            # self.model = Model(self.model_path)
+            self.model = self._create_model()
             print(f"语音识别模型已加载: {self.language}")
         except Exception as e:
             print(f"模型加载失败: {str(e)}")
             raise
     
+    @traced("SpeechRecognizer.recognize")
     def recognize(self, audio_path: str) -> str:
         """
         识别音频中的语音
@@ -38,45 +79,65 @@ class SpeechRecognizer:
         Returns:
             识别出的文本
         """
-        if self.model is None:
-            self.load_model()
+        # 使用期间固定模型，防止其他工具加载模型时将其卸载
+        with self._model_in_use():
+        
+            # 实际使用时取消注释
+            # from vosk import KaldiRecognizer
+            # wf = wave.open(audio_path, "rb")
+            # if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getcomptype() != "NONE":
+            #     print("Audio file must be WAV format mono PCM.")
+            #     return ""
+        
+            # # 创建识别器
+            # rec = KaldiRecognizer(self.model, wf.getframerate())
+            # rec.SetWords(True)
         
-        # 实际使用时取消注释
-        # from vosk import KaldiRecognizer
-        # wf = wave.open(audio_path, "rb")
-        # if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getcomptype() != "NONE":
-        #     print("Audio file must be WAV format mono PCM.")
-        #     return ""
+            # # 处理音频
+            # result = ""
+            # while True:
+            #     data = wf.readframes(4000)
+            #     if len(data) == 0:
+            #         break
+            #     if rec.AcceptWaveform(data):
+            #         part_result = json.loads(rec.Result())
+            #         result += part_result.get("text", "") + " "
         
-        # # 创建识别器
-        # rec = KaldiRecognizer(self.model, wf.getframerate())
-        # rec.SetWords(True)
+            # part_result = json.loads(rec.FinalResult())
+            # result += part_result.get("text", "")
         
-        # # 处理音频
-        # result = ""
-        # while True:
-        #     data = wf.readframes(4000)
-        #     if len(data) == 0:
-        #         break
-        #     if rec.AcceptWaveform(data):
-        #         part_result = json.loads(rec.Result())
-        #         result += part_result.get("text", "") + " "
+            print(f"正在识别音频: {audio_path}")
+            add_bytes(read=file_size(audio_path))
         
-        # part_result = json.loads(rec.FinalResult())
-        # result += part_result.get("text", "")
+            # 模拟识别结果
+            if self.language == "ja":
+                result = "これは日本語の音声サンプルです。音声認識テストです。"
+            else:
+                result = "这是一段语音示例。这是语音识别测试。"
+            
+            return result.strip()
+    
+    async def recognize_async(self, audio_path: str, timeout: Optional[float] = None) -> str:
+        """
+        异步识别音频中的语音
         
-        print(f"正在识别音频: {audio_path}")
+        Vosk在进程内运行，因此在线程池中执行 recognize()；超时后不再等待结果，
+        但已经开始的识别会在后台线程中运行完毕
         
-        # 模拟识别结果
-        if self.language == "ja":
-            result = "これは日本語の音声サンプルです。音声認識テストです。"
-        else:
-            result = "这是一段语音示例。这是语音识别测试。"
+        Args:
+            audio_path: 输入音频文件路径
+            timeout: 超时时间（秒）
             
-        return result.strip()
+        Returns:
+            识别出的文本
+        """
+        return await asyncio.wait_for(asyncio.to_thread(self.recognize, audio_path), timeout)
     
     def release(self) -> None:
         """释放模型资源"""
+        if self.registry is not None:
+            self.registry.release(self.registry_key)
+            return
         if self.model is not None:
             del self.model
             self.model = None
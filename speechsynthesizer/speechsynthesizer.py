@@ -4,20 +4,128 @@ import base64
 import hashlib
 import hmac
 import json
-import urllib.request
 import urllib.parse
-from typing import Optional, Dict, Any
-from datetime import datetime
+from typing import Optional, Dict, Any, Tuple
+
+from tracing.tracing import traced, get_tracer, add_bytes
+from lazyimport.lazyimport import lazy_import
+from datetime import datetime, timezone
+
+# urllib.request会连带导入http.client、ssl和email，只在真正发送请求时导入
+urlrequest = lazy_import("urllib.request")
+asyncio = lazy_import("asyncio")
+
+# 科大讯飞TTS API地址，可通过环境变量指向本地模拟服务（见 fakeapis）
+DEFAULT_API_URL = "https://tts-api.xfyun.cn/v2/tts"
+API_URL_ENV = "XFYUN_TTS_URL"
+
+
+class TTSAPIError(RuntimeError):
+    """科大讯飞TTS返回的错误，code为API错误码（例如11202表示QPS超限，401表示鉴权失败）"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
 
 class SpeechSynthesizer:
     """语音合成工具，使用科大讯飞TTS API"""
     
-    def __init__(self, app_id: Optional[str] = None, api_key: Optional[str] = None):
+    def __init__(self, app_id: Optional[str] = None, api_key: Optional[str] = None,
+                 api_url: Optional[str] = None, strict: bool = False):
         self.app_id = app_id
         self.api_key = api_key
-        self.api_url = "https://tts-api.xfyun.cn/v2/tts"
-        self.host = "tts-api.xfyun.cn"
+        self.api_url = api_url or os.environ.get(API_URL_ENV) or DEFAULT_API_URL
+        self.strict = strict  # 为True时API不可用直接抛出异常，不退回模拟合成（用于负载测试）
+        parts = urllib.parse.urlsplit(self.api_url)
+        self.host = parts.netloc
+        self.api_path = parts.path or "/"
     
+    def _build_request(self, text: str, voice: str) -> Tuple[bytes, Dict[str, str]]:
+        """
+        构建带鉴权信息的TTS请求
+        
+        Returns:
+            (请求体, 请求头)
+        """
+        # 构建请求数据
+        data = {
+            "common": {"app_id": self.app_id},
+            "business": {
+                "aue": "lame",  # 音频编码，lame为MP3格式
+                "sfl": 1,       # 流式返回
+                "auf": "audio/L16;rate=16000",  # 音频采样率
+                "vcn": voice,   # 发音人
+                "speed": 50,    # 语速，默认50
+                "volume": 50,   # 音量，默认50
+                "pitch": 50,    # 音高，默认50
+            },
+            "data": {
+                "text": base64.b64encode(text.encode()).decode(),
+                "status": 2,    # 2表示完整的文本
+            }
+        }
+        
+        # 构建鉴权URL
+        now = datetime.now(timezone.utc)
+        date = now.strftime("%a, %d %b %Y %H:%M:%S GMT")
+        signature_origin = f"host: {self.host}\ndate: {date}\nGET {self.api_path} HTTP/1.1"
+        signature_sha = hmac.new(
+            self.api_key.encode(), 
+            signature_origin.encode(), 
+            digestmod=hashlib.sha256
+        ).digest()
+        signature = base64.b64encode(signature_sha).decode()
+        authorization_origin = f'api_key="{self.app_id}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature}"'
+        authorization = base64.b64encode(authorization_origin.encode()).decode()
+        
+        # 设置请求头
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": authorization,
+            "Host": self.host,
+            "Date": date
+        }
+        return json.dumps(data).encode(), headers
+    
+    def _save_result(self, result: Dict[str, Any], output_path: str, status: int = 200) -> bool:
+        """
+        解析TTS响应并写入音频文件，返回是否成功
+
+        严格模式下API错误抛出 TTSAPIError；鉴权失败的响应没有code字段，以HTTP状态码作为错误码
+        """
+        if result.get("code") == 0:
+            audio_data = base64.b64decode(result["data"]["audio"])
+            with open(output_path, "wb") as f:
+                f.write(audio_data)
+            add_bytes(written=len(audio_data))
+            print(f"语音合成成功: {output_path}")
+            return True
+        else:
+            print(f"语音合成失败: {result.get('message', '未知错误')}")
+            if self.strict:
+                raise TTSAPIError(result.get("code", status), result.get("message", "未知错误"))
+            return False
+    
+    def _check_mock_allowed(self) -> None:
+        """严格模式下不允许使用模拟合成"""
+        if self.strict:
+            raise RuntimeError("未配置科大讯飞API凭证")
+    
+    @staticmethod
+    def _write_mock(text: str, output_path: str) -> bool:
+        """写入模拟语音合成结果，返回是否成功"""
+        print("使用模拟语音合成")
+        try:
+            with open(output_path, "w") as f:
+                f.write(f"模拟TTS内容: {text[:20]}")
+            print(f"模拟语音合成完成: {output_path}")
+            return True
+        except Exception as e:
+            print(f"写入文件失败: {str(e)}")
+            return False
+    
+    @traced("SpeechSynthesizer.synthesize")
     def synthesize(self, text: str, output_path: str, voice: str = "xiaoyan") -> str:
         """
         将文本转换为语音
@@ -40,81 +148,91 @@ class SpeechSynthesizer:
         # 如果有API凭证，使用科大讯飞API
         if self.app_id and self.api_key:
             try:
-                # 构建请求数据
-                data = {
-                    "common": {"app_id": self.app_id},
-                    "business": {
-                        "aue": "lame",  # 音频编码，lame为MP3格式
-                        "sfl": 1,       # 流式返回
-                        "auf": "audio/L16;rate=16000",  # 音频采样率
-                        "vcn": voice,   # 发音人
-                        "speed": 50,    # 语速，默认50
-                        "volume": 50,   # 音量，默认50
-                        "pitch": 50,    # 音高，默认50
-                    },
-                    "data": {
-                        "text": base64.b64encode(text.encode()).decode(),
-                        "status": 2,    # 2表示完整的文本
-                    }
-                }
-                
-                # 构建鉴权URL
-                now = datetime.now()
-                date = now.strftime("%a, %d %b %Y %H:%M:%S GMT")
-                signature_origin = f"host: {self.host}\ndate: {date}\nGET /v2/tts HTTP/1.1"
-                signature_sha = hmac.new(
-                    self.api_key.encode(), 
-                    signature_origin.encode(), 
-                    digestmod=hashlib.sha256
-                ).digest()
-                signature = base64.b64encode(signature_sha).decode()
-                authorization_origin = f'api_key="{self.app_id}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature}"'
-                authorization = base64.b64encode(authorization_origin.encode()).decode()
-                
-                # 设置请求头
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": authorization,
-                    "Host": self.host,
-                    "Date": date
-                }
+                body, headers = self._build_request(text, voice)
                 
                 # 发送请求
-                req = urllib.request.Request(
+                req = urlrequest.Request(
                     self.api_url, 
-                    data=json.dumps(data).encode(), 
+                    data=body, 
                     headers=headers,
                     method="POST"
                 )
                 
                 # 解析响应
-                with urllib.request.urlopen(req) as response:
-                    result = json.loads(response.read().decode())
-                    if result["code"] == 0:
-                        audio_data = base64.b64decode(result["data"]["audio"])
-                        with open(output_path, "wb") as f:
-                            f.write(audio_data)
-                        print(f"语音合成成功: {output_path}")
-                    else:
-                        print(f"语音合成失败: {result['message']}")
-                        return ""
+                with get_tracer().span("http.xfyun_tts", "network") as span:
+                    get_tracer().count("net.round_trips")
+                    try:
+                        with urlrequest.urlopen(req) as response:
+                            raw, status = response.read(), response.status
+                    except urlrequest.HTTPError as e:
+                        # 鉴权失败以HTTP错误状态返回，响应体同样是JSON
+                        raw, status = e.read(), e.code
+                    span.set(status=status, request_bytes=len(body), response_bytes=len(raw))
+                result = json.loads(raw.decode())
+                if self._save_result(result, output_path, status):
+                    return output_path
+                return ""
             except Exception as e:
                 print(f"API调用失败: {str(e)}")
+                if self.strict:
+                    raise
                 # 如果API调用失败，使用模拟合成
         
-        # 如果没有API凭证或API调用失败，使用模拟合成
-        print("使用模拟语音合成")
+        # 如果没有API凭证或API调用失败，使用模拟合成（仅用于演示）
+        self._check_mock_allowed()
+        if not self._write_mock(text, output_path):
+            return ""
+        time.sleep(1)  # 模拟处理时间
+        return output_path
+    
+    @traced("SpeechSynthesizer.synthesize_async")
+    async def synthesize_async(self, text: str, output_path: str, voice: str = "xiaoyan",
+                               timeout: Optional[float] = 60) -> str:
+        """
+        异步将文本转换为语音，网络请求不阻塞事件循环
         
-        # 模拟语音合成（仅用于演示）
-        try:
-            with open(output_path, "w") as f:
-                f.write(f"模拟TTS内容: {text[:20]}")
-            print(f"模拟语音合成完成: {output_path}")
-            time.sleep(1)  # 模拟处理时间
-        except Exception as e:
-            print(f"写入文件失败: {str(e)}")
+        Args:
+            text: 需要合成的文本
+            output_path: 输出音频文件路径
+            voice: 发音人，默认为"xiaoyan"
+            timeout: 请求超时时间（秒）
+            
+        Returns:
+            输出音频文件路径
+        """
+        if not text.strip():
+            print("文本为空，无法合成语音")
             return ""
             
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        
+        if self.app_id and self.api_key:
+            from aioutils.aioutils import http_request
+            try:
+                body, headers = self._build_request(text, voice)
+                with get_tracer().span("http.xfyun_tts", "network") as span:
+                    get_tracer().count("net.round_trips")
+                    response = await http_request("POST", self.api_url, data=body,
+                                                  headers=headers, timeout=timeout)
+                    span.set(status=response.status, request_bytes=len(body), response_bytes=len(response.body))
+                if self._save_result(response.json(), output_path, response.status):
+                    return output_path
+                return ""
+            except asyncio.TimeoutError:
+                # 超时视为失败，不退回模拟结果，避免把占位内容当作成功结果
+                print(f"API调用超时: {timeout}秒")
+                if self.strict:
+                    raise
+                return ""
+            except Exception as e:
+                print(f"API调用失败: {str(e)}")
+                if self.strict:
+                    raise
+        
+        self._check_mock_allowed()
+        if not self._write_mock(text, output_path):
+            return ""
+        await asyncio.sleep(1)  # 模拟处理时间
         return output_path
 
 
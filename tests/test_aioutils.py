@@ -0,0 +1,83 @@
+import asyncio
+import os
+import subprocess
+import time
+
+import pytest
+
+from aioutils.aioutils import run_command
+from tracing.tracing import get_tracer
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="进程组仅在POSIX上可用")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(params=[False, True], ids=["plain", "traced"])
+def tracing(request):
+    tracer = get_tracer()
+    if request.param:
+        tracer.enable()
+    yield request.param
+    tracer.disable()
+
+
+def alive(pid):
+    """进程存在且不是僵尸进程"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def grandchild_command(tmp_path):
+    """shell在后台派生一个sleep并等待它，sleep的pid写入文件"""
+    pid_file = tmp_path / "pid"
+    return ["sh", "-c", f"sleep 30 & echo $! > {pid_file}; wait"], pid_file
+
+
+def wait_for_pid(pid_file):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if pid_file.exists() and pid_file.read_text().strip():
+            return int(pid_file.read_text())
+        time.sleep(0.01)
+    raise AssertionError("子进程没有写出pid")
+
+
+def assert_gone(pid):
+    deadline = time.monotonic() + 5
+    while alive(pid) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not alive(pid)
+
+
+def test_timeout_kills_process_group(tmp_path, tracing):
+    cmd, pid_file = grandchild_command(tmp_path)
+    with pytest.raises(subprocess.TimeoutExpired):
+        run(run_command(cmd, timeout=0.5))
+    assert_gone(wait_for_pid(pid_file))
+
+
+def test_cancel_kills_process_group(tmp_path, tracing):
+    cmd, pid_file = grandchild_command(tmp_path)
+
+    async def scenario():
+        task = asyncio.ensure_future(run_command(cmd))
+        await asyncio.to_thread(wait_for_pid, pid_file)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(scenario())
+    assert_gone(wait_for_pid(pid_file))
+
+
+def test_check_raises_on_failure(tracing):
+    result = run(run_command(["sh", "-c", "echo out; exit 3"]))
+    assert result.returncode == 3 and result.stdout == "out\n"
+    with pytest.raises(subprocess.CalledProcessError):
+        run(run_command(["sh", "-c", "exit 3"], check=True))
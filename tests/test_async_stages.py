@@ -0,0 +1,69 @@
+import asyncio
+import os
+
+import pytest
+
+import aioutils.aioutils as aioutils
+from lipsync.lipsync import LipSync
+from speechsynthesizer.speechsynthesizer import SpeechSynthesizer
+from texttranslator.texttranslator import TextTranslator
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def hanging_api(monkeypatch):
+    """API请求总是超时"""
+    async def http_request(*args, **kwargs):
+        raise asyncio.TimeoutError()
+    monkeypatch.setattr(aioutils, "http_request", http_request)
+
+
+def test_translate_timeout_raises_when_strict(hanging_api):
+    translator = TextTranslator(app_id="id", app_key="key", strict=True)
+    with pytest.raises(asyncio.TimeoutError):
+        run(translator.translate_async("こんにちは", timeout=0.1))
+
+
+def test_translate_timeout_returns_empty(hanging_api):
+    translator = TextTranslator(app_id="id", app_key="key")
+    assert run(translator.translate_async("こんにちは", timeout=0.1)) == ""
+
+
+def test_synthesize_timeout_raises_when_strict(hanging_api, tmp_path):
+    synthesizer = SpeechSynthesizer(app_id="id", api_key="key", strict=True)
+    with pytest.raises(asyncio.TimeoutError):
+        run(synthesizer.synthesize_async("你好", str(tmp_path / "out.wav"), timeout=0.1))
+
+
+def test_synthesize_timeout_returns_empty(hanging_api, tmp_path):
+    synthesizer = SpeechSynthesizer(app_id="id", api_key="key")
+    assert run(synthesizer.synthesize_async("你好", str(tmp_path / "out.wav"), timeout=0.1)) == ""
+
+
+def lip_sync_with(tmp_path, build_command):
+    lip_sync = LipSync()
+    lip_sync.set_wav2lip_path(str(tmp_path))
+    lip_sync._build_command = build_command
+    return lip_sync
+
+
+def test_lip_sync_async_falls_back_like_sync(tmp_path):
+    def broken(*args, **kwargs):
+        raise RuntimeError("模型加载失败")
+    lip_sync = lip_sync_with(tmp_path, broken)
+    paths = [str(tmp_path / name) for name in ("missing.mp4", "missing.wav")]
+
+    sync_out = str(tmp_path / "sync.mp4")
+    async_out = str(tmp_path / "async.mp4")
+    assert lip_sync.synchronize(*paths, sync_out) == sync_out
+    assert run(lip_sync.synchronize_async(*paths, async_out)) == async_out
+    assert os.path.exists(async_out)
+
+
+def test_lip_sync_async_timeout_returns_empty(tmp_path):
+    lip_sync = lip_sync_with(tmp_path, lambda *args, **kwargs: ["sleep", "5"])
+    out = str(tmp_path / "out.mp4")
+    assert run(lip_sync.synchronize_async("in.mp4", "in.wav", out, timeout=0.2)) == ""
@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks import benchmark
+from tracing.tracing import run
+
+
+def allocate(mb):
+    return [sys.executable, "-c", f"b = bytearray({mb} * 1024 * 1024)"]
+
+
+@pytest.fixture
+def fake_stages(monkeypatch):
+    def spawning(case, out):
+        return lambda: run(allocate(case["mb"]), check=True)
+
+    def in_process(case, out):
+        return lambda: bytearray(case["mb"] * 1024 * 1024)
+
+    monkeypatch.setitem(benchmark.STAGES, "fake.spawning", (spawning, "audio"))
+    monkeypatch.setitem(benchmark.STAGES, "fake.in_process", (in_process, "audio"))
+
+
+@pytest.mark.skipif(not hasattr(os, "wait4"), reason="需要 os.wait4")
+def test_peak_rss_comes_from_children(fake_stages, tmp_path):
+    result = benchmark.run_worker("fake.spawning", {"mb": 400}, str(tmp_path))
+    assert result["child_processes"] == 1
+    assert 400 <= result["peak_rss_mb"] < 600
+
+
+def test_in_process_stage_reports_own_peak(fake_stages, tmp_path):
+    result = benchmark.run_worker("fake.in_process", {"mb": 1}, str(tmp_path))
+    assert result["child_processes"] == 0
+    assert result["peak_rss_mb"] > 0
+
+
+def test_worker_runs_in_output_dir(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_run(cmd, **kwargs):
+        calls.append(kwargs)
+        row = {"wall_s": 1.0, "cpu_s": 0.5, "peak_rss_mb": 10.0, "child_processes": 1}
+        return subprocess.CompletedProcess(cmd, 0, json.dumps(row) + "\n", "")
+
+    monkeypatch.setattr(benchmark.subprocess, "run", fake_run)
+    case = {"name": "video_5s", "seconds": 5}
+    item = benchmark.measure("main.main", case, str(tmp_path), repeat=2)
+    cwds = [kwargs["cwd"] for kwargs in calls]
+    assert cwds == [str(tmp_path / "runs" / "main_main" / "video_5s" / str(i)) for i in range(2)]
+    assert all(os.path.isdir(cwd) for cwd in cwds)
+    assert benchmark.ROOT in calls[0]["env"]["PYTHONPATH"].split(os.pathsep)
+    assert item["rtf"] == 0.2 and item["peak_rss_mb"] == 10.0
+
+
+def test_end_to_end_stage_keeps_cwd(tmp_path):
+    cwd = os.getcwd()
+    benchmark.stage_end_to_end({"video": "in.mp4"}, str(tmp_path))
+    assert os.getcwd() == cwd
+
+
+def test_compare_flags_regressions_over_threshold():
+    baseline = {"results": [{"stage": "s", "case": "c", "wall_s": 1.0, "cpu_s": 0.005, "peak_rss_mb": 100}]}
+    results = {"results": [{"stage": "s", "case": "c", "wall_s": 1.3, "cpu_s": 0.5, "peak_rss_mb": 110}]}
+    regressions = benchmark.compare(results, baseline, 0.15)
+    # cpu_s 基线过小不参与比较，峰值内存增幅在阈值内
+    assert [(r["metric"], r["change"]) for r in regressions] == [("wall_s", 0.3)]
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="需要FFmpeg")
+def test_measure_runs_worker_subprocess(tmp_path):
+    cases = benchmark.generate_inputs(str(tmp_path / "work"), shutil.which("ffmpeg"))
+    case = next(case for case in cases if case["kind"] == "video" and case["seconds"] == 5)
+    item = benchmark.measure("VideoComposer.compose_final_video", case, str(tmp_path / "work"), repeat=1)
+    assert item["child_processes"] >= 1
+    assert item["peak_rss_mb"] > 0 and item["wall_s"] > 0
@@ -0,0 +1,83 @@
+import json
+import time
+from email.utils import formatdate
+
+from fakeapis.fakeapis import FakeAPIServer, RateLimiter
+from speechsynthesizer.speechsynthesizer import SpeechSynthesizer
+from texttranslator.texttranslator import TextTranslator
+
+
+def baidu_params(server, app_key=None, text="こんにちは"):
+    translator = TextTranslator(server.baidu_app_id, app_key or server.baidu_app_key, api_url=server.translate_url)
+    return translator._build_payload(text, "jp", "zh")
+
+
+def xfyun_headers(server, api_key=None, app_id=None):
+    synthesizer = SpeechSynthesizer(app_id or server.xfyun_app_id, api_key or server.xfyun_api_key,
+                                    api_url=server.tts_url)
+    body, headers = synthesizer._build_request("你好", "xiaoyan")
+    # 服务端读取请求头时统一转为小写
+    return body, {name.lower(): value for name, value in headers.items()}
+
+
+def test_baidu_signature_accepted():
+    server = FakeAPIServer()
+    result = server._translate(baidu_params(server, text="一行\n二行"))
+    assert [item["dst"] for item in result["trans_result"]] == ["[zh] 一行", "[zh] 二行"]
+    assert server.stats == {"translate.ok": 1}
+
+
+def test_baidu_errors():
+    server = FakeAPIServer()
+    assert server._translate(baidu_params(server, app_key="wrong"))["error_code"] == "54001"
+    params = baidu_params(server)
+    params["appid"] = "other"
+    assert server._translate(params)["error_code"] == "52003"
+    params = baidu_params(server)
+    del params["salt"]
+    assert server._translate(params)["error_code"] == "54000"
+    assert server.stats == {"translate.error.54001": 1, "translate.error.52003": 1, "translate.error.54000": 1}
+
+
+def test_xfyun_signature_accepted():
+    server = FakeAPIServer()
+    body, headers = xfyun_headers(server)
+    assert server._check_xfyun_auth(headers) is None
+    result = server._synthesize(body)
+    assert result["code"] == 0 and result["data"]["audio"]
+
+
+def test_xfyun_auth_errors():
+    server = FakeAPIServer()
+    _, headers = xfyun_headers(server, api_key="wrong")
+    assert server._check_xfyun_auth(headers) == "HMAC signature does not match"
+    _, headers = xfyun_headers(server, app_id="other")
+    assert server._check_xfyun_auth(headers) == "Unauthorized"
+
+    # 签名正确但Date头偏差过大
+    _, headers = xfyun_headers(server)
+    headers["date"] = formatdate(time.time() - 3600, usegmt=True)
+    assert "valid date" in server._check_xfyun_auth(headers)
+    headers["authorization"] = "not base64!"
+    assert server._check_xfyun_auth(headers) == "Unauthorized"
+
+
+def test_qps_limits_return_api_error_codes():
+    server = FakeAPIServer(translate_qps=2, tts_qps=1)
+    codes = [server._translate(baidu_params(server)).get("error_code") for _ in range(3)]
+    assert codes == [None, None, "54003"]
+    body, _ = xfyun_headers(server)
+    assert [server._synthesize(body)["code"] for _ in range(2)] == [0, 11202]
+
+
+def test_rate_limiter_window_per_key():
+    limiter = RateLimiter(qps=1)
+    assert limiter.allow("a") and not limiter.allow("a")
+    assert limiter.allow("b")
+    limiter.windows["a"][0] -= 1.0  # 最早的请求移出1秒窗口
+    assert limiter.allow("a")
+
+
+def test_malformed_tts_body():
+    server = FakeAPIServer()
+    assert server._synthesize(json.dumps({"common": {}}).encode())["code"] == 10163
@@ -0,0 +1,250 @@
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from framestore import framestore
+from framestore.framestore import (FrameStore, Frames, HEADER_SIZE, CHANNELS, FRAMES_ENV,
+                                   _write_header, read_header, open_frames)
+from framestore.wav2lip import FrameCapture, install, scale_box, adapter_command, adapter_env
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="帧存储依赖flock")
+
+FAKE_CV2 = types.SimpleNamespace(CAP_PROP_FPS=5, CAP_PROP_FRAME_COUNT=7, CAP_PROP_FRAME_WIDTH=3,
+                                 CAP_PROP_FRAME_HEIGHT=4)
+
+
+def write_frames(path, count=3, width=4, height=2, fps=25.0, source="/videos/in.mp4", **extra):
+    """不经过ffmpeg直接写出帧文件，第i帧的像素值均为i"""
+    header = {"version": 1, "source": source, "width": width, "height": height, "channels": CHANNELS,
+              "fps": fps, "count": count, "frame_bytes": width * height * CHANNELS, "offset": HEADER_SIZE,
+              **extra}
+    with open(path, "wb") as f:
+        _write_header(f, header)
+        for index in range(count):
+            f.write(bytes([index]) * (width * height * CHANNELS))
+    return str(path)
+
+
+def test_header_round_trip(tmp_path):
+    path = write_frames(tmp_path / "a.frames", source="/videos/源.mp4")
+    header = read_header(path)
+    assert header["source"] == "/videos/源.mp4" and header["count"] == 3
+    assert os.path.getsize(path) == HEADER_SIZE + 3 * 4 * 2 * CHANNELS
+
+    with open(tmp_path / "b.frames", "wb") as f:
+        with pytest.raises(ValueError):
+            _write_header(f, {"source": "x" * HEADER_SIZE})
+    (tmp_path / "c.frames").write_bytes(b"\0" * HEADER_SIZE)
+    with pytest.raises(ValueError):
+        read_header(str(tmp_path / "c.frames"))
+
+
+def test_frames_are_read_only_views(tmp_path):
+    path = write_frames(tmp_path / "a.frames", fps=12.5)
+    with open_frames(path) as frames:
+        assert len(frames) == 3 and frames.size == (4, 2) and frames.fps == 12.5
+        assert frames[2].shape == (2, 4, CHANNELS) and (frames[2] == 2).all()
+        assert frames[1:].shape == (2, 2, 4, CHANNELS)
+        with pytest.raises(ValueError):
+            frames[0][0, 0, 0] = 9
+    assert frames.array is None
+
+
+def test_open_frames_from_environment(tmp_path, monkeypatch):
+    monkeypatch.delenv(FRAMES_ENV, raising=False)
+    with pytest.raises(ValueError):
+        open_frames()
+    monkeypatch.setenv(FRAMES_ENV, write_frames(tmp_path / "a.frames"))
+    with open_frames() as frames:
+        assert len(frames) == 3
+
+
+def make_store(tmp_path, ages):
+    """按给定的距今秒数创建大小相同（1 MB）的帧文件"""
+    store = FrameStore(store_dir=str(tmp_path / "store"), budget_mb=0)
+    paths = []
+    for name, age in ages:
+        path = os.path.join(store.store_dir, f"{name}.frames")
+        with open(path, "wb") as f:
+            f.truncate(2 ** 20)
+        stamp = 1_000_000 - age
+        os.utime(path, (stamp, stamp))
+        paths.append(path)
+    return store, paths
+
+
+def test_cleanup_removes_least_recently_used_first(tmp_path):
+    store, (old, middle, new) = make_store(tmp_path, [("old", 30), ("middle", 20), ("new", 10)])
+    assert store.cleanup(budget_mb=2) == [old]
+    assert store.cleanup(budget_mb=1, keep=middle) == [new]
+    assert os.listdir(store.store_dir) == ["middle.frames"]
+    assert store.stats()["files"] == 1
+
+
+def test_cleanup_skips_frames_in_use(tmp_path):
+    store, (old, middle, new) = make_store(tmp_path, [("old", 30), ("middle", 20), ("new", 10)])
+    # 其他进程打开帧时持有共享锁，清理跳过该文件，转而删除下一个
+    fd = os.open(old, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        assert store.cleanup(budget_mb=2) == [middle]
+    finally:
+        os.close(fd)
+    assert store.cleanup(budget_mb=1) == [old]
+
+
+def test_open_fails_when_cleanup_wins_the_race(tmp_path, monkeypatch):
+    path = write_frames(tmp_path / "a.frames")
+    flock = fcntl.flock
+
+    def replace_then_lock(fd, operation):
+        # 模拟打开后、加共享锁前，清理删除了文件，随后又重新解码出同名文件
+        os.remove(path)
+        write_frames(path)
+        flock(fd, operation)
+
+    monkeypatch.setattr(framestore.fcntl, "flock", replace_then_lock)
+    with pytest.raises(FileNotFoundError):
+        Frames(path)
+
+
+def test_get_decodes_again_after_losing_the_race(tmp_path, monkeypatch):
+    store = FrameStore(store_dir=str(tmp_path / "store"))
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"video")
+    path = os.path.join(store.store_dir, "in.frames")
+    ensured = []
+
+    def ensure(source_path, height=None):
+        ensured.append(source_path)
+        if not os.path.exists(path):
+            write_frames(path, count=len(ensured))
+        return path
+
+    flock = fcntl.flock
+    raced = []
+
+    def flock_after_cleanup(fd, operation):
+        if not raced:
+            raced.append(True)
+            os.remove(path)
+        flock(fd, operation)
+
+    monkeypatch.setattr(store, "ensure", ensure)
+    monkeypatch.setattr(framestore.fcntl, "flock", flock_after_cleanup)
+    with store.get(str(source)) as frames:
+        # 第一次打开时文件已被删除，重新ensure后打开的是第二次解码的文件
+        assert len(ensured) == 2 and len(frames) == 2
+
+
+def test_frame_capture_reads_store_frames(tmp_path):
+    with open_frames(write_frames(tmp_path / "a.frames", count=2, fps=30.0)) as frames:
+        capture = FrameCapture(frames, FAKE_CV2)
+        assert capture.isOpened() and capture.get(FAKE_CV2.CAP_PROP_FPS) == 30.0
+        assert capture.get(FAKE_CV2.CAP_PROP_FRAME_COUNT) == 2
+        assert (capture.get(FAKE_CV2.CAP_PROP_FRAME_WIDTH), capture.get(FAKE_CV2.CAP_PROP_FRAME_HEIGHT)) == (4, 2)
+        assert capture.get(99) == 0
+        reads = [capture.read() for _ in range(3)]
+        assert [ok for ok, _ in reads] == [True, True, False]
+        assert (reads[1][1] == 1).all() and reads[2][1] is None
+
+
+def test_install_only_redirects_the_source_video(tmp_path):
+    source = tmp_path / "in.mp4"
+    cv2 = types.SimpleNamespace(**vars(FAKE_CV2), VideoCapture=lambda path, *args: ("opencv", path))
+    with open_frames(write_frames(tmp_path / "a.frames", source=str(source))) as frames:
+        install(frames, cv2)
+        assert isinstance(cv2.VideoCapture(str(source)), FrameCapture)
+        assert cv2.VideoCapture(str(tmp_path / "other.mp4")) == ("opencv", str(tmp_path / "other.mp4"))
+
+
+def test_scale_box_to_working_resolution():
+    header = {"width": 640, "height": 360, "source_width": 1280, "source_height": 720}
+    args = ["--face", "in.mp4", "--box", "100", "300", "-1", "641", "--nosmooth"]
+    assert scale_box(args, header) == ["--face", "in.mp4", "--box", "50", "150", "-1", "320", "--nosmooth"]
+    assert scale_box(args, {"width": 640, "height": 360}) == args
+    assert scale_box(["--face", "in.mp4"], header) == ["--face", "in.mp4"]
+
+
+FAKE_CV2_MODULE = """
+CAP_PROP_FPS = 5
+CAP_PROP_FRAME_COUNT = 7
+CAP_PROP_FRAME_WIDTH = 3
+CAP_PROP_FRAME_HEIGHT = 4
+
+class VideoCapture:
+    # 测试环境没有OpenCV，被调用说明推理脚本自行解码了视频
+    def __init__(self, path):
+        raise RuntimeError("decoded by opencv")
+"""
+
+FAKE_INFERENCE = """
+import argparse, json, cv2, helper
+parser = argparse.ArgumentParser()
+parser.add_argument("--face")
+parser.add_argument("--outfile")
+parser.add_argument("--box", nargs=4, type=int, default=[-1, -1, -1, -1])
+args = parser.parse_args()
+stream = cv2.VideoCapture(args.face)
+frames = []
+while True:
+    ok, frame = stream.read()
+    if not ok:
+        break
+    frames.append(int(frame[0, 0, 0]))
+with open(args.outfile, "w") as f:
+    json.dump({"fps": stream.get(cv2.CAP_PROP_FPS), "frames": frames, "box": args.box, "helper": helper.NAME}, f)
+"""
+
+
+def test_adapter_runs_inference_script_on_store_frames(tmp_path, monkeypatch):
+    wav2lip = tmp_path / "Wav2Lip"
+    wav2lip.mkdir()
+    (wav2lip / "inference.py").write_text(FAKE_INFERENCE)
+    (wav2lip / "helper.py").write_text("NAME = 'wav2lip helper'\n")  # 脚本目录下的模块可以导入
+    (tmp_path / "cv2.py").write_text(FAKE_CV2_MODULE)
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"video")
+    path = write_frames(tmp_path / "a.frames", count=3, width=4, height=2, fps=24.0, source=str(source),
+                        source_width=8, source_height=4)
+
+    monkeypatch.setenv("PYTHONPATH", str(tmp_path))
+    outfile = tmp_path / "result.json"
+    cmd = adapter_command(str(wav2lip / "inference.py"),
+                          ["--face", str(source), "--outfile", str(outfile), "--box", "2", "4", "0", "8"],
+                          python=sys.executable)
+    subprocess.run(cmd, check=True, cwd=str(wav2lip), env=adapter_env(path), capture_output=True)
+    result = json.loads(outfile.read_text())
+    assert result == {"fps": 24.0, "frames": [0, 1, 2], "box": [1, 2, 0, 4], "helper": "wav2lip helper"}
+
+    # 未传入帧文件时脚本照常自行解码
+    env = adapter_env()
+    assert FRAMES_ENV not in env
+    failed = subprocess.run(cmd, cwd=str(wav2lip), env=env, capture_output=True, text=True)
+    assert failed.returncode != 0 and "decoded by opencv" in failed.stderr
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="需要FFmpeg")
+def test_decode_once_and_reuse(tmp_path, monkeypatch):
+    source = str(tmp_path / "in.mp4")
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc=duration=1:size=160x120:rate=25",
+                    "-c:v", "libx264", "-pix_fmt", "yuv420p", source], check=True)
+    store = FrameStore(store_dir=str(tmp_path / "store"))
+    with store.get(source, 60) as frames:
+        assert len(frames) == 25 and frames.size == (80, 60) and frames.fps == 25.0
+        assert (frames.header["source_width"], frames.header["source_height"]) == (160, 120)
+        assert frames[0].mean() > 0
+
+    def fail(*args):
+        raise AssertionError("不应再次解码")
+
+    monkeypatch.setattr(store, "_decode", fail)
+    with store.get(source, 60) as frames:
+        assert len(frames) == 25
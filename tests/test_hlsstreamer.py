@@ -0,0 +1,94 @@
+import asyncio
+import shutil
+
+import pytest
+
+from hlsstreamer.hlsstreamer import ProgressiveHLS
+from scheduler.scheduler import ResourceScheduler, ffmpeg_threads
+
+
+def read_playlist(streamer):
+    with open(streamer.playlist_path) as f:
+        return f.read().splitlines()
+
+
+def test_playlist_marks_init_changes_and_end(tmp_path):
+    streamer = ProgressiveHLS(str(tmp_path), chunk_seconds=4.0)
+    streamer.segments = [
+        {"init": "init_00000.mp4", "uri": "seg_00000_000.m4s", "duration": 4.0},
+        {"init": "init_00000.mp4", "uri": "seg_00001_000.m4s", "duration": 4.0},
+        {"init": "init_00002.mp4", "uri": "seg_00002_000.m4s", "duration": 2.5},
+    ]
+    streamer._write_playlist()
+    lines = read_playlist(streamer)
+    assert lines[:6] == [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        "#EXT-X-TARGETDURATION:5",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:EVENT",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+    ]
+    assert lines[6:] == [
+        '#EXT-X-MAP:URI="init_00000.mp4"',
+        "#EXTINF:4.000,", "seg_00000_000.m4s",
+        "#EXTINF:4.000,", "seg_00001_000.m4s",
+        "#EXT-X-DISCONTINUITY",
+        '#EXT-X-MAP:URI="init_00002.mp4"',
+        "#EXTINF:2.500,", "seg_00002_000.m4s",
+    ]
+    assert "#EXT-X-ENDLIST" not in lines
+
+    streamer._write_playlist(finished=True)
+    assert read_playlist(streamer)[-1] == "#EXT-X-ENDLIST"
+    assert not (tmp_path / "playlist.m3u8.tmp").exists()
+
+
+def test_publish_reuses_identical_init(tmp_path):
+    streamer = ProgressiveHLS(str(tmp_path))
+    for name, data in [("init_00000.mp4", b"same"), ("init_00001.mp4", b"same"), ("init_00002.mp4", b"other")]:
+        (tmp_path / name).write_bytes(data)
+    streamer._publish([{"init": "init_00000.mp4", "uri": "a.m4s", "duration": 6.0}])
+    streamer._publish([{"init": "init_00001.mp4", "uri": "b.m4s", "duration": 6.0}])
+    streamer._publish([{"init": "init_00002.mp4", "uri": "c.m4s", "duration": 6.0}])
+    assert [s["init"] for s in streamer.segments] == ["init_00000.mp4", "init_00000.mp4", "init_00002.mp4"]
+    assert not (tmp_path / "init_00001.mp4").exists()
+
+
+def test_chunks_inherit_callers_grant(tmp_path, monkeypatch):
+    streamer = ProgressiveHLS(str(tmp_path), chunk_seconds=2.0, workers=2,
+                              recognizer=object(), translator=object(),
+                              synthesizer=object(), lip_sync=object())
+    seen = []
+
+    def process_chunk(video_path, index, start, duration):
+        seen.append(ffmpeg_threads())
+        return []
+
+    monkeypatch.setattr(streamer, "probe_duration", lambda path: 6.0)
+    monkeypatch.setattr(streamer, "_process_chunk", process_chunk)
+
+    async def scenario():
+        scheduler = ResourceScheduler(cpus=4, memory_mb=8000)
+        async with scheduler.reserve("video_composer") as grant:
+            await asyncio.to_thread(streamer.process, "in.mp4")
+        return grant
+
+    grant = asyncio.run(scenario())
+    assert seen == [grant.ffmpeg_args()] * 3
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None,
+                    reason="需要FFmpeg")
+def test_process_publishes_every_chunk(tmp_path):
+    streamer = ProgressiveHLS(str(tmp_path / "hls"), chunk_seconds=2.0, workers=2)
+    source = streamer.make_test_source(str(tmp_path / "source.mp4"), duration=5.0, size="160x120")
+    published = []
+    playlist = streamer.process(source, on_segment=lambda index, path: published.append(index))
+    assert playlist == streamer.playlist_path
+    assert published == [0, 1, 2]
+    lines = read_playlist(streamer)
+    assert lines[-1] == "#EXT-X-ENDLIST"
+    durations = [float(line[len("#EXTINF:"):].rstrip(",")) for line in lines if line.startswith("#EXTINF:")]
+    assert len(durations) == 3
+    assert sum(durations) == pytest.approx(5.0, abs=0.2)
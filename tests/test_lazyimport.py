@@ -0,0 +1,62 @@
+import importlib
+import sys
+import threading
+
+import pytest
+
+from lazyimport.lazyimport import lazy_import, import_seconds
+
+
+@pytest.fixture
+def slow_module(tmp_path, monkeypatch):
+    """导入需要0.2秒的临时模块，放大并发首次访问的窗口"""
+    name = "slow_lazy_module"
+    (tmp_path / f"{name}.py").write_text("import time\ntime.sleep(0.2)\nvalue = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield name
+    sys.modules.pop(name, None)
+    import_seconds.pop(name, None)
+
+
+def access_concurrently(targets):
+    results, errors = [], []
+
+    def call(target):
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_module_is_not_imported_until_used(slow_module):
+    module = lazy_import(slow_module)
+    assert slow_module not in sys.modules
+    assert module.value == 42
+    assert slow_module in import_seconds
+
+
+def test_concurrent_first_access(slow_module):
+    module = lazy_import(slow_module)
+    results, errors = access_concurrently([lambda: module.value] * 8)
+    assert errors == [] and results == [42] * 8
+
+
+def test_access_while_another_thread_imports(slow_module):
+    # 普通导入进行中时 sys.modules 里是尚未初始化完的模块，代理不能复制它
+    module = lazy_import(slow_module)
+    importer = threading.Thread(target=importlib.import_module, args=(slow_module,))
+    importer.start()
+    while slow_module not in sys.modules:
+        pass
+    results, errors = access_concurrently([lambda: module.value] * 4)
+    importer.join()
+    assert errors == [] and results == [42] * 4
+    with pytest.raises(AttributeError):
+        module.missing
@@ -0,0 +1,68 @@
+import asyncio
+import socket
+
+import pytest
+
+import main
+from fakeapis.fakeapis import FakeAPIServer, LatencyModel
+from loadgen.loadgen import LoadGenerator, error_key, percentile
+from speechsynthesizer.speechsynthesizer import SpeechSynthesizer, TTSAPIError
+from texttranslator.texttranslator import TextTranslator, TranslateAPIError
+
+
+def run_load(tmp_path, jobs=6, translate_key=None, tts_key=None, **server_options):
+    """在进程内启动模拟服务，以严格模式的工具驱动流水线"""
+    async def scenario():
+        server = FakeAPIServer(translate_latency=LatencyModel(5, 0), tts_latency=LatencyModel(5, 0),
+                               chunk_interval_ms=0, **server_options)
+        await server.start()
+        try:
+            translator = TextTranslator(server.baidu_app_id, translate_key or server.baidu_app_key,
+                                        api_url=server.translate_url, strict=True)
+            synthesizer = SpeechSynthesizer(server.xfyun_app_id, tts_key or server.xfyun_api_key,
+                                            api_url=server.tts_url, strict=True)
+            generator = LoadGenerator(jobs, 3, str(tmp_path), translator, synthesizer)
+            return await generator.run(), server.stats
+        finally:
+            await server.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_drives_the_pipeline(tmp_path):
+    originals = {name: getattr(main, name) for name in ("main_async", "translate_text", "lip_sync_async")}
+    report, stats = run_load(tmp_path)
+    assert report["jobs"] == 6 and report["succeeded"] == 6 and report["errors"] == {}
+    assert stats == {"translate.ok": 6, "tts.ok": 6}
+    for name in ("total", "translate", "synthesize"):
+        assert report["latency_ms"][name]["p50"] > 0
+    # 每个任务经过完整流水线，写出了自己的最终视频
+    assert sorted(p.name for p in tmp_path.glob("job_*/final_video.mp4")) == ["final_video.mp4"] * 6
+    # 运行结束后恢复 main 中的原有实现
+    assert {name: getattr(main, name) for name in originals} == originals
+
+
+def test_errors_by_api_error_code(tmp_path):
+    report, _ = run_load(tmp_path, jobs=4, translate_qps=1)
+    assert report["succeeded"] == 1
+    assert report["errors"] == {"baidu:54003": 3}
+
+
+def test_signature_errors(tmp_path):
+    report, _ = run_load(tmp_path, jobs=2, translate_key="wrong")
+    assert report["errors"] == {"baidu:54001": 2}
+    report, stats = run_load(tmp_path, jobs=2, tts_key="wrong")
+    assert report["errors"] == {"xfyun:401": 2}
+    assert stats["tts.error.401"] == 2
+
+
+def test_error_key():
+    assert error_key("baidu", TranslateAPIError("54003", "Invalid Access Limit")) == "baidu:54003"
+    assert error_key("xfyun", TTSAPIError(11202, "licc limit")) == "xfyun:11202"
+    assert error_key("xfyun", socket.timeout()) == "xfyun:timeout"
+    assert error_key("baidu", ConnectionRefusedError()) == "baidu:ConnectionRefusedError"
+
+
+@pytest.mark.parametrize("p, expected", [(0, 1.0), (50, 2.5), (100, 4.0)])
+def test_percentile(p, expected):
+    assert percentile([4.0, 1.0, 3.0, 2.0], p) == expected
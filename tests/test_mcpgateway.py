@@ -0,0 +1,136 @@
+import asyncio
+import sys
+import threading
+import time
+
+import pytest
+
+from aioutils.aioutils import run_command
+from mcpgateway.mcpgateway import MCPGateway, ToolSpec, MethodNotFound, InvalidParams, _schema
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def gateway_with(tool, handler):
+    gateway = MCPGateway()
+    gateway.tools[tool] = ToolSpec(tool, "测试工具", _schema([]), handler)
+    return gateway
+
+
+def test_instance_is_created_once_under_concurrency():
+    gateway = MCPGateway()
+    created = []
+
+    def factory():
+        time.sleep(0.05)  # 放大检查与创建之间的窗口
+        created.append(object())
+        return created[-1]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(gateway._instance("tool", factory)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+    assert all(result is created[0] for result in results)
+
+
+def test_rpc_errors():
+    async def main():
+        gateway = MCPGateway()
+        await gateway.start()
+        try:
+            with pytest.raises(MethodNotFound):
+                await gateway.handle_request({"method": "nope"}, None)
+            with pytest.raises(InvalidParams):
+                await gateway.handle_request({"method": "tools/call", "params": {}}, None)
+            with pytest.raises(InvalidParams):
+                await gateway.handle_request({"method": "jobs/get", "params": {"jobId": "missing"}}, None)
+            assert await gateway.handle_request({"method": "notifications/initialized"}, None) is None
+        finally:
+            await gateway.stop()
+
+    run(main())
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="需要 sleep 命令")
+def test_cancel_running_async_job_kills_child():
+    started = []
+
+    async def handler(args):
+        started.append(True)
+        await run_command(["sleep", "30"])
+
+    async def main():
+        gateway = gateway_with("video_composer", handler)
+        await gateway.start()
+        try:
+            job = gateway.submit("video_composer", {})
+            while not started:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.1)
+            begin = time.monotonic()
+            assert gateway.cancel(job.id).status == "running"
+            await asyncio.wait_for(job.done.wait(), 10)
+            assert job.status == "cancelled"
+            assert time.monotonic() - begin < 5
+        finally:
+            await gateway.stop()
+
+    run(main())
+
+
+def test_cancel_running_thread_job_is_rejected():
+    release = threading.Event()
+
+    def handler(args):
+        release.wait(5)
+        return "done"
+
+    async def main():
+        gateway = gateway_with("speaker_cluster", handler)
+        await gateway.start()
+        try:
+            job = gateway.submit("speaker_cluster", {})
+            while job.status != "running":
+                await asyncio.sleep(0.01)
+            with pytest.raises(InvalidParams):
+                gateway.cancel(job.id)
+            release.set()
+            await asyncio.wait_for(job.done.wait(), 5)
+            assert job.status == "succeeded"
+            assert job.result == "done"
+            assert "progress" not in job.to_dict()
+        finally:
+            release.set()
+            await gateway.stop()
+
+    run(main())
+
+
+def test_cancel_queued_job():
+    release = threading.Event()
+
+    def handler(args):
+        release.wait(5)
+
+    async def main():
+        gateway = gateway_with("speaker_cluster", handler)
+        gateway.tools["speaker_cluster"].concurrency = 1
+        await gateway.start()
+        try:
+            first = gateway.submit("speaker_cluster", {})
+            second = gateway.submit("speaker_cluster", {})
+            assert gateway.cancel(second.id).status == "cancelled"
+            release.set()
+            await asyncio.wait_for(first.done.wait(), 5)
+            assert second.started_at is None
+        finally:
+            release.set()
+            await gateway.stop()
+
+    run(main())
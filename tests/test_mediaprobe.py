@@ -0,0 +1,151 @@
+import json
+import shutil
+import subprocess
+import threading
+import time
+
+import pytest
+
+from mediaprobe.mediaprobe import MediaProbe, container_for, can_copy, stream_args, plan_mode
+
+H264 = {"codec_type": "video", "codec_name": "h264"}
+VP8 = {"codec_type": "video", "codec_name": "vp8"}
+AAC_44K = {"codec_type": "audio", "codec_name": "aac", "sample_rate": 44100, "channels": 2}
+PCM_16K = {"codec_type": "audio", "codec_name": "pcm_s16le", "sample_rate": 16000, "channels": 1}
+
+PROBE_OUTPUT = json.dumps({
+    "format": {"format_name": "mov,mp4,m4a,3gp,3g2,mj2", "duration": "5.000000", "tags": {"title": "x"}},
+    "streams": [
+        {"index": 0, "codec_type": "video", "codec_name": "h264", "width": 320, "height": 240,
+         "disposition": {"default": 1}},
+        {"index": 1, "codec_type": "audio", "codec_name": "aac", "sample_rate": "44100", "channels": 2},
+    ],
+})
+
+
+def test_container_for_extension():
+    assert container_for("a.MP4") == "mp4"
+    assert container_for("a.mka") == "matroska"
+    assert container_for("a.unknown") == "matroska"
+
+
+def test_can_copy_follows_container():
+    assert can_copy(H264, "out.mp4")
+    assert not can_copy(VP8, "out.mp4")
+    assert can_copy(VP8, "out.mkv")
+    assert not can_copy(AAC_44K, "out.wav")
+    assert not can_copy(None, "out.mp4")
+
+
+@pytest.mark.parametrize("stream, kind, output, options, expected", [
+    (H264, "video", "out.mp4", {}, ["-c:v", "copy"]),
+    (VP8, "video", "out.mp4", {}, ["-c:v", "libx264", "-pix_fmt", "yuv420p"]),
+    (H264, "video", "out.mp4", {"filtered": True}, ["-c:v", "libx264", "-pix_fmt", "yuv420p"]),
+    (H264, "video", "out.webm", {}, ["-c:v", "libvpx-vp9"]),
+    (AAC_44K, "audio", "out.mp4", {"sample_rate": 44100, "channels": 2}, ["-c:a", "copy"]),
+    (AAC_44K, "audio", "out.mp4", {"sample_rate": 48000}, ["-c:a", "aac", "-ar", "48000"]),
+    (AAC_44K, "audio", "out.wav", {"sample_rate": 16000, "channels": 1},
+     ["-c:a", "pcm_s16le", "-ar", "16000", "-ac", "1"]),
+    (PCM_16K, "audio", "out.wav", {"sample_rate": 16000, "channels": 1}, ["-c:a", "copy"]),
+    (PCM_16K, "audio", "out.mp4", {}, ["-c:a", "aac"]),
+    (None, "audio", "out.mp4", {"sample_rate": 44100}, ["-c:a", "aac", "-ar", "44100"]),
+])
+def test_stream_args(stream, kind, output, options, expected):
+    assert stream_args(stream, kind, output, **options) == expected
+
+
+def test_plan_mode():
+    copy = ["-c:v", "copy", "-c:a", "copy"]
+    assert plan_mode(copy, "in.mp4", "out.mov") == "copy"
+    assert plan_mode(copy, "in.mp4", "out.mkv") == "remux"
+    assert plan_mode(["-c:v", "copy", "-c:a", "aac"], "in.mp4", "out.mp4") == "transcode"
+    assert plan_mode(["-c", "copy"], "in.ts", "out.mp4") == "remux"
+
+
+@pytest.fixture
+def fake_probe(tmp_path, monkeypatch):
+    """ffprobe替换为计数的假实现，每次调用耗时0.1秒以放大并发窗口"""
+    media = MediaProbe(cache_path=str(tmp_path / "cache"))
+    calls, running = [], []
+
+    def ffprobe(args):
+        calls.append(args)
+        running.append(args)
+        media.max_running = max(media.max_running, len(running))
+        time.sleep(0.1)
+        running.remove(args)
+        if "-show_format" in args:
+            return PROBE_OUTPUT
+        return "0.000000,K__\n0.040000,___\n2.000000,K__\n4.000000,K_\n"
+
+    monkeypatch.setattr(media, "available", lambda: True)
+    monkeypatch.setattr(media, "_ffprobe", ffprobe)
+    media.calls = calls
+    media.max_running = 0
+    return media
+
+
+def test_probe_compacts_and_caches(fake_probe, tmp_path):
+    video = tmp_path / "in.mp4"
+    video.write_bytes(b"video")
+    info = fake_probe.probe(str(video))
+    assert info.duration == 5.0 and info.video["width"] == 320
+    assert info.audio["sample_rate"] == 44100
+    assert "disposition" not in info.video and "tags" not in info.format
+
+    fake_probe.probe(str(video))
+    assert len(fake_probe.calls) == 1
+    # 新实例从磁盘缓存读取
+    fresh = MediaProbe(cache_path=fake_probe.cache_path)
+    assert fresh.probe(str(video)).to_dict() == info.to_dict()
+
+    video.write_bytes(b"changed video")
+    fake_probe.probe(str(video))
+    assert len(fake_probe.calls) == 2
+
+
+def test_concurrent_probes_run_once_per_file(fake_probe, tmp_path):
+    paths = []
+    for name in ("a.mp4", "b.mp4"):
+        (tmp_path / name).write_bytes(name.encode())
+        paths.append(str(tmp_path / name))
+    threads = [threading.Thread(target=fake_probe.probe, args=(path,)) for path in paths * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(fake_probe.calls) == 2
+    # 不同文件的ffprobe并行执行
+    assert fake_probe.max_running == 2
+    assert fake_probe.key_locks == {}
+
+
+def test_keyframes(fake_probe, tmp_path):
+    video = tmp_path / "in.mp4"
+    video.write_bytes(b"video")
+    assert fake_probe.keyframes(str(video)) == [0.0, 2.0, 4.0]
+    assert fake_probe.keyframe_before(str(video), 3.9) == 2.0
+    assert fake_probe.keyframe_before(str(video), 4.0) == 4.0
+    assert fake_probe.keyframe_before(str(video), -1) is None
+    assert len(fake_probe.calls) == 1
+
+
+def test_missing_file(fake_probe, tmp_path):
+    assert fake_probe.probe(str(tmp_path / "missing.mp4")) is None
+    assert fake_probe.keyframes(str(tmp_path / "missing.mp4")) == []
+    assert fake_probe.calls == []
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None, reason="需要FFmpeg")
+def test_real_ffprobe(tmp_path):
+    video = str(tmp_path / "in.mp4")
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error",
+                    "-f", "lavfi", "-i", "testsrc=duration=3:size=160x120:rate=25",
+                    "-f", "lavfi", "-i", "sine=duration=3",
+                    "-c:v", "libx264", "-g", "25", "-c:a", "aac", "-shortest", video], check=True)
+    media = MediaProbe(cache_path=str(tmp_path / "cache"))
+    info = media.probe(video)
+    assert info.video["codec_name"] == "h264" and info.audio["codec_name"] == "aac"
+    assert media.keyframes(video)[:3] == pytest.approx([0.0, 1.0, 2.0], abs=0.05)
+    args = stream_args(info.video, "video", "out.mkv") + stream_args(info.audio, "audio", "out.mkv")
+    assert plan_mode(args, video, "out.mkv") == "remux"
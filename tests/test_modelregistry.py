@@ -0,0 +1,100 @@
+import gc
+import threading
+import time
+
+from lipsync.lipsync import LipSync
+from modelregistry.modelregistry import ModelRegistry
+
+
+def make_registry(budget_mb=1000):
+    registry = ModelRegistry(budget_mb=budget_mb)
+    registry.register("a", lambda: "A", size_mb=400)
+    registry.register("b", lambda: "B", size_mb=400)
+    registry.register("c", lambda: "C", size_mb=400)
+    return registry
+
+
+def test_lru_evicts_least_recently_used():
+    registry = make_registry()
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")  # a 变为最近使用
+    registry.get("c")  # 超出预算，卸载 b
+    stats = registry.stats()
+    assert stats["models"]["a"]["loaded"] and stats["models"]["c"]["loaded"]
+    assert not stats["models"]["b"]["loaded"]
+    assert stats["loads"] == 3 and stats["hits"] == 1 and stats["evictions"] == 1
+
+
+def test_pinned_model_is_not_evicted_until_unpinned():
+    registry = make_registry(budget_mb=500)
+    with registry.use("a") as model:
+        assert model == "A"
+        registry.get("b")  # 预算不足，但 a 正在使用
+        assert registry.stats()["models"]["a"]["loaded"]
+        assert not registry.evict("a")
+    # 解除固定后卸载超出预算的模型
+    assert not registry.stats()["models"]["a"]["loaded"]
+    assert registry.used_mb <= 500
+
+
+def test_concurrent_get_loads_once():
+    registry = ModelRegistry(budget_mb=1000)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return object()
+
+    registry.register("slow", loader, size_mb=100)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("slow"))) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len({id(result) for result in results}) == 1
+
+
+def test_on_evict_registered_once_and_weakly():
+    registry = ModelRegistry(budget_mb=1000)
+    evicted = []
+
+    class Tool:
+        def on_evict(self):
+            evicted.append(self)
+
+    tool = Tool()
+    for _ in range(5):
+        registry.register("m", lambda: "M", size_mb=100, on_evict=tool.on_evict)
+    assert len(registry.entries["m"].on_evict) == 1
+    registry.get("m")
+    registry.evict("m")
+    assert evicted == [tool]
+
+    # 工具实例被回收后，注册表不再持有它，也不再调用其回调
+    evicted.clear()
+    del tool
+    gc.collect()
+    registry.get("m")
+    registry.evict("m")
+    assert evicted == []
+
+
+def test_lip_sync_release_only_unpins():
+    registry = ModelRegistry(budget_mb=4000)
+    lip_sync = LipSync(model_path="/nonexistent/wav2lip.pth", registry=registry)
+    first = lip_sync._reserve_memory()
+    second = lip_sync._reserve_memory()  # 另一个口型同步任务
+    lip_sync._release_memory(first)
+    stats = registry.stats()["models"][first]
+    # 另一个任务仍持有预留
+    assert stats["loaded"] and stats["in_use"] == 1
+    lip_sync._release_memory(second)
+    for _ in range(3):
+        lip_sync._release_memory(lip_sync._reserve_memory())
+    stats = registry.stats()["models"][first]
+    assert stats["in_use"] == 0
+    assert stats["loads"] == 1 and stats["evictions"] == 0
@@ -0,0 +1,125 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from preflight import preflight
+from preflight.preflight import Preflight, _list_names
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="模拟的ffmpeg是shell脚本")
+
+FAKE_FFMPEG = """#!/bin/sh
+echo "$1 $2" >> "{log}"
+case "$2" in
+  -version) echo "ffmpeg version {version} Copyright (c) 2000-2024" ;;
+  -encoders) printf 'Encoders:\\n V..... = Video\\n ------\\n V....D libx264              H.264\\n A....D aac                  AAC\\n' ;;
+  -filters) printf 'Filters:\\n  T.. = Timeline support\\n  ------\\n ... amix              N->A       Audio mixing.\\n' ;;
+esac
+"""
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+    path = tmp_path / "bin" / "ffmpeg"
+    path.parent.mkdir()
+    log = tmp_path / "calls.log"
+
+    def install(version="6.1"):
+        path.write_text(FAKE_FFMPEG.format(log=log, version=version))
+        path.chmod(0o755)
+        # 同一秒内改写时修改时间可能不变，显式推进以模拟升级
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        return str(path)
+
+    def calls():
+        return log.read_text().splitlines() if log.exists() else []
+
+    install.calls = calls
+    return install
+
+
+def test_probe_parses_version_encoders_and_filters(fake_ffmpeg, tmp_path):
+    binary = fake_ffmpeg()
+    info = Preflight(str(tmp_path / "cache.json")).ffmpeg(binary)
+    assert info["version"] == "6.1"
+    assert info["encoders"] == ["libx264", "aac"]
+    assert info["filters"] == ["amix"]
+
+
+def test_disk_cache_is_reused_across_instances(fake_ffmpeg, tmp_path):
+    binary = fake_ffmpeg()
+    cache = str(tmp_path / "cache.json")
+    first = Preflight(cache)
+    first.ffmpeg(binary)
+    assert len(fake_ffmpeg.calls()) == 3
+    assert first.has_encoder("libx264", binary) and not first.has_filter("loudnorm", binary)
+
+    # 新的实例（相当于新进程）从磁盘读取，不再执行ffmpeg
+    assert Preflight(cache).ffmpeg(binary)["version"] == "6.1"
+    assert len(fake_ffmpeg.calls()) == 3
+
+
+def test_replaced_binary_invalidates_entry(fake_ffmpeg, tmp_path):
+    binary = fake_ffmpeg("6.1")
+    cache = str(tmp_path / "cache.json")
+    Preflight(cache).ffmpeg(binary)
+    fake_ffmpeg("7.0")
+    assert Preflight(cache).ffmpeg(binary)["version"] == "7.0"
+    assert len(fake_ffmpeg.calls()) == 6
+
+
+def test_refresh_and_version_mismatch_reprobe(fake_ffmpeg, tmp_path):
+    binary = fake_ffmpeg()
+    cache = tmp_path / "cache.json"
+    Preflight(str(cache)).ffmpeg(binary)
+    Preflight(str(cache)).ffmpeg(binary, refresh=True)
+    assert len(fake_ffmpeg.calls()) == 6
+
+    data = json.loads(cache.read_text())
+    data["version"] = preflight.CACHE_VERSION + 1
+    cache.write_text(json.dumps(data))
+    Preflight(str(cache)).ffmpeg(binary)
+    assert len(fake_ffmpeg.calls()) == 9
+
+
+def test_missing_tool_is_reprobed_once_installed(fake_ffmpeg, tmp_path):
+    cache = str(tmp_path / "cache.json")
+    binary = str(tmp_path / "bin" / "ffmpeg")
+    assert Preflight(cache).ffmpeg(binary) is None
+    fake_ffmpeg()
+    assert Preflight(cache).ffmpeg(binary)["version"] == "6.1"
+
+
+def test_model_file_entry_follows_file(tmp_path):
+    checkpoint = tmp_path / "wav2lip_gan.pth"
+    cache = str(tmp_path / "cache.json")
+    assert Preflight(cache).model_file(str(checkpoint)) is None
+    checkpoint.write_bytes(b"\0" * 2 ** 20)
+    assert Preflight(cache).model_file(str(checkpoint))["size_mb"] == 1.0
+
+
+def test_unwritable_cache_keeps_memory_cache(fake_ffmpeg, tmp_path):
+    binary = fake_ffmpeg()
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    checker = Preflight(str(blocker / "cache.json"))  # 父路径是文件，无法写入
+    checker.ffmpeg(binary)
+    checker.ffmpeg(binary)
+    assert len(fake_ffmpeg.calls()) == 3
+
+
+def test_list_names_skips_legend():
+    output = "Encoders:\n V..... = Video\n A..... = Audio\n ------\n V....D libx264   H.264\n"
+    assert _list_names(output) == ["libx264"]
+
+
+def test_tool_modules_import_lazily():
+    # 导入工具模块不应连带导入网络库和asyncio，它们只在真正调用时才导入
+    code = ("import sys, main, texttranslator.texttranslator, speechsynthesizer.speechsynthesizer, lipsync.lipsync; "
+            "print([m for m in ('asyncio', 'requests', 'urllib.request', 'numpy') if m in sys.modules])")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=root, check=True)
+    assert result.stdout.strip() == "[]"
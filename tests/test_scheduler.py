@@ -0,0 +1,188 @@
+import asyncio
+
+import pytest
+
+from scheduler import scheduler
+from scheduler.scheduler import (ResourceScheduler, StageProfile, THREAD_ENV_VARS, child_env, current_grant,
+                                 ffmpeg_threads)
+
+PROFILES = {
+    "big": StageProfile("big", threads=4, memory_mb=1000),
+    "small": StageProfile("small", threads=1, memory_mb=100),
+    "io": StageProfile("io", memory_mb=10, io_bound=True),
+}
+
+
+@pytest.fixture(autouse=True)
+def plenty_of_memory(monkeypatch):
+    # 运行中的任务存在时调度器会读取实际可用内存，测试中固定为充足
+    monkeypatch.setattr(scheduler, "read_meminfo", lambda: {"MemAvailable": 1e6})
+
+
+def make_scheduler(**options):
+    return ResourceScheduler(**{"cpus": 4, "memory_mb": 10000, "profiles": PROFILES, **options})
+
+
+async def queue(sched, stage):
+    """提交预留请求并让出一次事件循环，返回代表该请求的任务"""
+    task = asyncio.ensure_future(sched.acquire(stage))
+    await asyncio.sleep(0)
+    return task
+
+
+def test_backfill_runs_smaller_stage_while_head_waits():
+    async def scenario():
+        sched = make_scheduler()
+        first = await sched.acquire("small")
+        big = await queue(sched, "big")
+        assert not big.done()
+        # 队首放不下，后面较小的任务先运行
+        backfilled = await queue(sched, "small")
+        assert backfilled.done() and not big.done()
+        assert sched.free_cpus == 2
+
+        sched.release(first)
+        sched.release(backfilled.result())
+        await asyncio.sleep(0)
+        assert big.done() and sched.free_cpus == 0
+        sched.release(big.result())
+        return sched.report()
+
+    report = asyncio.run(scenario())
+    assert report["free"] == {"cpus": 4, "memory_mb": 10000, "io_slots": 64}
+    assert report["waiting"] == 0
+    assert report["stages"]["small"]["count"] == 2 and report["stages"]["big"]["count"] == 1
+
+
+def test_starved_head_stops_backfill():
+    async def scenario():
+        sched = make_scheduler(starvation_seconds=0.05)
+        first = await sched.acquire("small")
+        big = await queue(sched, "big")
+        await asyncio.sleep(0.1)
+        # 队首等待超过 starvation_seconds，新来的小任务也要排在它后面
+        late = await queue(sched, "small")
+        assert not late.done() and not big.done()
+
+        sched.release(first)
+        await asyncio.sleep(0)
+        assert big.done() and not late.done()
+        sched.release(big.result())
+        await asyncio.sleep(0)
+        assert late.done()
+        sched.release(late.result())
+        return sched.report()
+
+    report = asyncio.run(scenario())
+    assert report["stages"]["big"]["wait_max_s"] >= 0.1
+    assert report["stages"]["small"]["count"] == 2 and report["waiting"] == 0
+
+
+def test_waiters_are_woken_in_arrival_order():
+    async def scenario():
+        sched = make_scheduler(cpus=1)
+        running = await sched.acquire("small")
+        waiting = [await queue(sched, "small") for _ in range(3)]
+        order = []
+        for _ in waiting:
+            sched.release(running)
+            await asyncio.sleep(0)
+            done = [task for task in waiting if task.done() and task not in order]
+            assert len(done) == 1
+            order.append(done[0])
+            running = done[0].result()
+        sched.release(running)
+        return order == waiting
+
+    assert asyncio.run(scenario())
+
+
+def test_oversized_request_is_clamped_to_capacity():
+    sched = make_scheduler(profiles={"huge": StageProfile("huge", threads=16, memory_mb=50000)})
+    grant = sched._request("huge")
+    assert (grant.threads, grant.memory_mb) == (4, 10000)
+    # 未知阶段按单线程处理
+    assert sched._request("unknown").threads == 1
+
+
+def test_io_bound_stages_use_io_slots_only():
+    async def scenario():
+        sched = make_scheduler(io_slots=1)
+        big = await sched.acquire("big")
+        io = await queue(sched, "io")
+        assert io.done() and sched.free_cpus == 0
+        second_io = await queue(sched, "io")
+        assert not second_io.done()
+        sched.release(io.result())
+        await asyncio.sleep(0)
+        assert second_io.done()
+        sched.release(second_io.result())
+        sched.release(big)
+        return sched.busy_cpu_seconds > 0
+
+    assert asyncio.run(scenario())
+
+
+def test_memory_is_checked_against_meminfo_while_busy(monkeypatch):
+    async def scenario():
+        sched = make_scheduler()
+        monkeypatch.setattr(scheduler, "read_meminfo", lambda: {"MemAvailable": 200.0})
+        # 没有任务运行时总是放行
+        first = await sched.acquire("small")
+        blocked = await queue(sched, "small")
+        assert not blocked.done()
+        sched.release(first)
+        await asyncio.sleep(0)
+        assert blocked.done()
+        sched.release(blocked.result())
+
+    asyncio.run(scenario())
+
+
+def test_cancel_while_queued_removes_waiter():
+    async def scenario():
+        sched = make_scheduler()
+        running = await sched.acquire("big")
+        waiting = await queue(sched, "small")
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert len(sched.waiters) == 0 and sched.stats["small"].queued == 0
+        sched.release(running)
+        assert sched.free_cpus == 4
+
+    asyncio.run(scenario())
+
+
+def test_cancel_after_grant_releases_resources():
+    async def scenario():
+        sched = make_scheduler()
+        running = await sched.acquire("big")
+        waiting = await queue(sched, "small")
+        # 资源已分配给等待者，但它恢复运行之前被取消
+        sched.release(running)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        return sched.free_cpus, sched.stats["small"].running
+
+    assert asyncio.run(scenario()) == (4, 0)
+
+
+def test_reservation_sets_thread_limits_for_children():
+    async def scenario():
+        sched = make_scheduler()
+        assert current_grant() is None and ffmpeg_threads() == []
+        assert child_env({"A": "1"}) == {"A": "1"}
+        async with sched.reserve("big") as grant:
+            assert current_grant() is grant
+            assert ffmpeg_threads() == ["-threads", "4"]
+            env = child_env({"OMP_NUM_THREADS": "2"})
+            # 调用方显式设置的值优先
+            assert env["OMP_NUM_THREADS"] == "2" and env[THREAD_ENV_VARS[1]] == "4"
+        async with sched.reserve("io"):
+            assert ffmpeg_threads() == [] and child_env(None) is None
+        assert current_grant() is None
+        return sched.free_cpus
+
+    assert asyncio.run(scenario()) == 4
@@ -0,0 +1,147 @@
+import wave
+
+import numpy as np
+
+from speakercluster.speakercluster import SpeakerCluster
+
+
+def write_wav(path, samples, sample_rate=16000):
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes((np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes())
+
+
+def test_cluster_degenerate_embeddings_terminates():
+    # 所有分段都没有邻居时，每轮仍需分配中心自身
+    labels = SpeakerCluster().cluster(np.zeros((3, 64), dtype=np.float32))
+    assert len(labels) == 3
+    assert (labels >= 0).all()
+
+
+def test_cluster_identical_embeddings():
+    embedding = np.ones((5, 64), dtype=np.float32) / 8.0
+    labels = SpeakerCluster().cluster(embedding)
+    assert labels.tolist() == [0] * 5
+
+
+def test_diarize_steady_tone(tmp_path):
+    path = tmp_path / "tone.wav"
+    t = np.arange(3 * 16000) / 16000
+    write_wav(path, 0.5 * np.sin(2 * np.pi * 220 * t))
+    segments = SpeakerCluster().diarize(str(path))
+    assert segments
+    assert all(seg["speaker"] >= 0 for seg in segments)
+
+
+def test_diarize_silence_has_no_speech(tmp_path):
+    path = tmp_path / "silence.wav"
+    write_wav(path, np.zeros(5 * 16000))
+    assert SpeakerCluster().diarize(str(path)) == []
+
+
+def test_silence_between_speech_is_not_speech(tmp_path):
+    # 大部分时间为静音时，静音部分不能被判定为语音
+    path = tmp_path / "mostly_silent.wav"
+    samples = np.zeros(10 * 16000)
+    t = np.arange(16000) / 16000
+    samples[16000:32000] = 0.3 * np.sin(2 * np.pi * 300 * t)
+    write_wav(path, samples)
+    segments = SpeakerCluster().extract_segments(str(path))
+    assert segments
+    assert all(0.9 <= seg["start"] and seg["end"] <= 2.1 for seg in segments)
+
+
+def synthetic_voice(f0, formants, seconds, rng, sample_rate=16000):
+    """带固定共振峰的谐波信号，基频缓慢变化，幅度按音节起伏"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = f0 * (1 + 0.05 * np.sin(2 * np.pi * 0.7 * t + rng.uniform(0, 6)))
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    signal = np.zeros_like(t)
+    for k in range(1, 40):
+        if k * f0 > 7000:
+            break
+        gain = sum(np.exp(-((k * f0 - formant) / 150) ** 2) for formant in formants) + 0.02
+        signal += gain * np.sin(k * phase)
+    signal *= 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t) ** 2
+    return 0.3 * signal / np.abs(signal).max()
+
+
+def conversation(path, voices, turns=10, seed=0):
+    rng = np.random.default_rng(seed)
+    parts = []
+    for i in range(turns):
+        f0, formants = voices[i % len(voices)]
+        parts.append(synthetic_voice(f0, formants, rng.uniform(1, 3), rng) * rng.uniform(0.3, 1.0))
+        parts.append(np.zeros(int(0.4 * 16000)))
+    write_wav(path, np.concatenate(parts))
+
+
+NARRATOR = (120, [500, 1500])
+SECOND_SPEAKER = (220, [800, 2600])
+
+
+def test_single_speaker_is_one_cluster(tmp_path):
+    # 只有一个说话人（最常见的旁白）时不能被拆成多个说话人
+    path = tmp_path / "narrator.wav"
+    for seed in range(3):
+        conversation(path, [NARRATOR], seed=seed)
+        segments = SpeakerCluster().diarize(str(path))
+        assert len(segments) > 5
+        assert {seg["speaker"] for seg in segments} == {0}
+
+
+def test_two_speakers_are_separated(tmp_path):
+    path = tmp_path / "dialog.wav"
+    conversation(path, [NARRATOR, SECOND_SPEAKER])
+    turns = SpeakerCluster.turns(SpeakerCluster().diarize(str(path)))
+    assert [turn["speaker"] for turn in turns] == [0, 1] * 5
+
+
+def test_turns_merge_adjacent_segments():
+    segments = [
+        {"start": 0.0, "end": 1.5, "speaker": 0},
+        {"start": 1.5, "end": 2.0, "speaker": 0},
+        {"start": 3.0, "end": 4.0, "speaker": 0},  # 间隔超过max_gap
+        {"start": 4.2, "end": 5.0, "speaker": 1},
+    ]
+    assert SpeakerCluster.turns(segments) == [
+        {"start": 0.0, "end": 2.0, "speaker": 0},
+        {"start": 3.0, "end": 4.0, "speaker": 0},
+        {"start": 4.2, "end": 5.0, "speaker": 1},
+    ]
+
+
+def test_map_speakers_ranks_by_talk_time():
+    segments = [
+        {"start": 0.0, "end": 1.0, "speaker": 0},
+        {"start": 1.0, "end": 5.0, "speaker": 1},
+        {"start": 5.0, "end": 5.5, "speaker": 2},
+    ]
+    assert SpeakerCluster.map_speakers(segments, ["a", "b"]) == {1: "a", 0: "b", 2: "a"}
+    # 人脸不能共用：选项不足时多出的说话人不分配
+    assert SpeakerCluster.map_speakers(segments, ["box"], repeat=False) == {1: "box"}
+    assert SpeakerCluster.map_speakers(segments, []) == {}
+
+
+def test_pipeline_plans_one_lip_sync_pass_per_face():
+    import main
+    turns = [
+        {"start": 0.0, "end": 1.0, "speaker": 0},
+        {"start": 1.0, "end": 4.0, "speaker": 1},
+        {"start": 4.0, "end": 5.0, "speaker": 0},
+    ]
+    clips = [dict(turn, audio=f"turn{i}.wav") for i, turn in enumerate(turns)]
+    passes = main._speaker_passes(turns, clips, [[0, 10, 0, 10]], "out")
+    # 只有一个人脸框时只同步说话最多的说话人
+    assert len(passes) == 1
+    own, box, track, output = passes[0]
+    assert [clip["audio"] for clip in own] == ["turn1.wav"]
+    assert box == [0, 10, 0, 10]
+
+    cmd = main._mix_command(clips, "mix.wav", duration=6.0)
+    assert cmd[-1] == "mix.wav"
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert "[1:a]adelay=1000:all=1[a1]" in graph
+    assert "amix=inputs=3" in graph and "apad=whole_dur=6.000" in graph
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+from aioutils.aioutils import run_command
+from tracing.tracing import Tracer, get_tracer, run
+
+
+@pytest.fixture
+def tracer():
+    tracer = get_tracer()
+    tracer.reset()
+    tracer.enable()
+    yield tracer
+    tracer.disable()
+    tracer.reset()
+
+
+def spans(tracer, name=None):
+    return [e for e in tracer.events if e["ph"] == "X" and (name is None or e["name"] == name)]
+
+
+def allocate(mb):
+    """在子进程中分配并触碰指定大小内存的命令"""
+    return [sys.executable, "-c", f"b = bytearray({mb} * 1024 * 1024)"]
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    with tracer.span("stage") as span:
+        span.set(value=1)
+        tracer.count("net.round_trips")
+    assert tracer.events == [] and tracer.counters == {}
+
+
+def test_concurrent_tasks_get_their_own_tracks(tracer):
+    async def stage(name):
+        with tracer.span(name):
+            await asyncio.sleep(0.05)
+            with tracer.span(name + ".inner"):
+                await asyncio.sleep(0.05)
+
+    async def scenario():
+        await asyncio.gather(stage("a"), stage("b"))
+
+    asyncio.run(scenario())
+    by_name = {e["name"]: e for e in spans(tracer)}
+    assert by_name["a"]["tid"] != by_name["b"]["tid"]
+    for name in ("a", "b"):
+        outer, inner = by_name[name], by_name[name + ".inner"]
+        assert outer["tid"] == inner["tid"]
+        assert outer["ts"] <= inner["ts"]
+        assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+    names = [e["args"]["name"] for e in tracer.events if e["ph"] == "M"]
+    assert len(names) == 2 and all(name.startswith("task ") for name in names)
+
+
+@pytest.mark.skipif(not hasattr(os, "wait4"), reason="需要 os.wait4")
+def test_rusage_is_per_child(tracer):
+    async def scenario():
+        await asyncio.gather(run_command(allocate(500)), run_command(allocate(1)))
+
+    asyncio.run(scenario())
+    run(allocate(250), check=True)
+    rss = sorted(e["args"]["child_max_rss_mb"] for e in spans(tracer))
+    assert len(rss) == 3
+    # fork出的子进程在exec前的常驻内存也计入ru_maxrss，分配量取远大于测试进程本身的值
+    assert rss[0] < 250 <= rss[1] < 500 <= rss[2]
+    # 汇总中峰值内存取最大值，CPU时间累加
+    item = tracer.summary()["spans"][f"exec:{os.path.basename(sys.executable)}"]
+    assert item["count"] == 3
+    assert item["child_max_rss_mb"] == rss[2]
+
+
+def test_counters_and_save(tracer, tmp_path):
+    with tracer.span("http.call", "network") as span:
+        tracer.count("net.round_trips")
+        tracer.count("net.round_trips")
+        span.add("bytes_read", 10)
+    with pytest.raises(ValueError):
+        with tracer.span("http.call", "network"):
+            raise ValueError("坏响应")
+
+    summary = tracer.summary()
+    assert summary["counters"] == {"net.round_trips": 2}
+    item = summary["spans"]["http.call"]
+    assert item["count"] == 2 and item["errors"] == 1
+    assert item["net.round_trips"] == 2 and item["bytes_read"] == 10
+
+    trace_path = tracer.save(str(tmp_path / "trace.json"))
+    with open(trace_path) as f:
+        events = json.load(f)["traceEvents"]
+    assert events[0]["name"] == "process_name"
+    assert (tmp_path / "trace.summary.json").exists()
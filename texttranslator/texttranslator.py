@@ -2,17 +2,81 @@ import os
 import json
 import hashlib
 import random
-import requests
 from typing import Optional, Dict, Any
 
+from tracing.tracing import traced, get_tracer
+from lazyimport.lazyimport import lazy_import
+
+# requests导入约需数十毫秒，只在调用API时导入
+requests = lazy_import("requests")
+asyncio = lazy_import("asyncio")
+
+# 百度翻译API地址，可通过环境变量指向本地模拟服务（见 fakeapis）
+DEFAULT_API_URL = "https://fanyi-api.baidu.com/api/trans/vip/translate"
+API_URL_ENV = "BAIDU_TRANSLATE_URL"
+
+
+class TranslateAPIError(RuntimeError):
+    """百度翻译API返回的错误，code为API错误码（例如54003表示QPS超限）"""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
 class TextTranslator:
     """文本翻译工具，使用百度翻译API"""
     
-    def __init__(self, app_id: Optional[str] = None, app_key: Optional[str] = None):
+    def __init__(self, app_id: Optional[str] = None, app_key: Optional[str] = None,
+                 api_url: Optional[str] = None, strict: bool = False):
         self.app_id = app_id
         self.app_key = app_key
-        self.api_url = "https://fanyi-api.baidu.com/api/trans/vip/translate"
+        self.api_url = api_url or os.environ.get(API_URL_ENV) or DEFAULT_API_URL
+        self.strict = strict  # 为True时API不可用直接抛出异常，不退回模拟翻译（用于负载测试）
+    
+    def _build_payload(self, text: str, from_lang: str, to_lang: str) -> Dict[str, str]:
+        """构建带签名的百度翻译API请求参数"""
+        salt = str(random.randint(32768, 65536))
+        sign = hashlib.md5((self.app_id + text + salt + self.app_key).encode()).hexdigest()
+        
+        return {
+            'appid': self.app_id,
+            'q': text,
+            'from': from_lang,
+            'to': to_lang,
+            'salt': salt,
+            'sign': sign
+        }
+    
+    def _parse_result(self, result: Dict[str, Any]) -> str:
+        """解析百度翻译API的响应，严格模式下API错误抛出 TranslateAPIError"""
+        if 'trans_result' in result:
+            return '\n'.join(item['dst'] for item in result['trans_result'])
+        else:
+            print(f"翻译错误: {result.get('error_msg', '未知错误')}")
+            if self.strict:
+                raise TranslateAPIError(str(result.get('error_code', '')), result.get('error_msg', '未知错误'))
+            return ""
     
+    def _check_mock_allowed(self) -> None:
+        """严格模式下不允许使用模拟翻译"""
+        if self.strict:
+            raise RuntimeError("未配置百度翻译API凭证")
+    
+    @staticmethod
+    def _mock_translate(text: str, from_lang: str, to_lang: str) -> str:
+        """没有API凭证或API调用失败时的模拟翻译"""
+        print("使用模拟翻译")
+        
+        # 模拟翻译结果（仅用于演示）
+        if from_lang == "jp" and to_lang == "zh":
+            if "日本語" in text:
+                return "这是日语语音样本。这是语音识别测试。"
+            return "模拟翻译：" + text[:10] + "..."
+        else:
+            return "模拟翻译结果"
+    
+    @traced("TextTranslator.translate")
     def translate(self, text: str, from_lang: str = "jp", to_lang: str = "zh") -> str:
         """
         翻译文本
@@ -31,39 +95,61 @@ class TextTranslator:
         # 如果有API凭证，使用百度翻译API
         if self.app_id and self.app_key:
             try:
-                salt = str(random.randint(32768, 65536))
-                sign = hashlib.md5((self.app_id + text + salt + self.app_key).encode()).hexdigest()
-                
-                payload = {
-                    'appid': self.app_id,
-                    'q': text,
-                    'from': from_lang,
-                    'to': to_lang,
-                    'salt': salt,
-                    'sign': sign
-                }
-                
-                response = requests.post(self.api_url, params=payload)
-                result = response.json()
-                
-                if 'trans_result' in result:
-                    return '\n'.join(item['dst'] for item in result['trans_result'])
-                else:
-                    print(f"翻译错误: {result.get('error_msg', '未知错误')}")
-                    return ""
+                payload = self._build_payload(text, from_lang, to_lang)
+                with get_tracer().span("http.baidu_translate", "network") as span:
+                    get_tracer().count("net.round_trips")
+                    response = requests.post(self.api_url, params=payload)
+                    span.set(status=response.status_code, response_bytes=len(response.content))
+                return self._parse_result(response.json())
             except Exception as e:
                 print(f"API调用失败: {str(e)}")
+                if self.strict:
+                    raise
         
         # 如果没有API凭证或API调用失败，使用模拟翻译
-        print("使用模拟翻译")
+        self._check_mock_allowed()
+        return self._mock_translate(text, from_lang, to_lang)
+    
+    @traced("TextTranslator.translate_async")
+    async def translate_async(self, text: str, from_lang: str = "jp", to_lang: str = "zh",
+                              timeout: Optional[float] = 30) -> str:
+        """
+        异步翻译文本，网络请求不阻塞事件循环
         
-        # 模拟翻译结果（仅用于演示）
-        if from_lang == "jp" and to_lang == "zh":
-            if "日本語" in text:
-                return "这是日语语音样本。这是语音识别测试。"
-            return "模拟翻译：" + text[:10] + "..."
-        else:
-            return "模拟翻译结果"
+        Args:
+            text: 需要翻译的文本
+            from_lang: 源语言，默认日语
+            to_lang: 目标语言，默认中文
+            timeout: 请求超时时间（秒）
+            
+        Returns:
+            翻译后的文本
+        """
+        if not text.strip():
+            return ""
+            
+        if self.app_id and self.app_key:
+            from aioutils.aioutils import http_request
+            try:
+                payload = self._build_payload(text, from_lang, to_lang)
+                with get_tracer().span("http.baidu_translate", "network") as span:
+                    get_tracer().count("net.round_trips")
+                    response = await http_request("POST", self.api_url, params=payload, timeout=timeout)
+                    span.set(status=response.status, response_bytes=len(response.body))
+                return self._parse_result(response.json())
+            except asyncio.TimeoutError:
+                # 超时视为失败，不退回模拟结果，避免把占位内容当作成功结果
+                print(f"API调用超时: {timeout}秒")
+                if self.strict:
+                    raise
+                return ""
+            except Exception as e:
+                print(f"API调用失败: {str(e)}")
+                if self.strict:
+                    raise
+        
+        self._check_mock_allowed()
+        return self._mock_translate(text, from_lang, to_lang)
     
     @staticmethod
     def get_language_code(language: str) -> str:
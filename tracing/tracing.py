@@ -0,0 +1,395 @@
+import os
+import sys
+import json
+import time
+import atexit
+import inspect
+import functools
+import threading
+import itertools
+import contextvars
+import subprocess
+import weakref
+from typing import Optional, Dict, Any, List, Callable
+
+# 设置该环境变量后自动启用追踪，并在进程退出时写入追踪文件
+TRACE_ENV = "VOICE_EMBEDDING_TRACE"
+
+
+class _NullSpan:
+    """追踪关闭时使用的空span，所有操作均为空操作"""
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+    def set(self, **args: Any) -> None:
+        pass
+
+    def add(self, key: str, value: float = 1) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+# 当前协程/线程所在的span，供被调用的代码追加信息
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=_NULL_SPAN)
+
+
+class Span:
+    """
+    一段计时区间，结束时作为Chrome trace的完整事件（ph=X）记录
+
+    同一事件循环上并发的协程在时间上交错，若按线程归类会产生部分重叠、不能正确嵌套的事件，
+    因此asyncio任务中的span记录在该任务自己的轨道上，其余span记录在所在线程的轨道上
+    """
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0.0
+        self.token = None
+        self.track = 0
+
+    def __enter__(self) -> "Span":
+        self.token = _current_span.set(self)
+        self.track = self.tracer._track()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        end = time.perf_counter()
+        _current_span.reset(self.token)
+        if exc_type is not None:
+            self.args["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._record_span(self, end)
+        return False
+
+    def set(self, **args: Any) -> None:
+        """设置span的附加信息"""
+        self.args.update(args)
+
+    def add(self, key: str, value: float = 1) -> None:
+        """累加span的计数类信息，例如读写字节数"""
+        self.args[key] = self.args.get(key, 0) + value
+
+
+class Tracer:
+    """追踪器，记录各阶段耗时、子进程资源占用、读写字节数和网络往返次数"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.events: List[Dict[str, Any]] = []
+        self.counters: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        # asyncio任务到轨道编号的映射；编号从 2**31 起分配，与系统线程号区分
+        self.task_tracks: "weakref.WeakKeyDictionary[Any, int]" = weakref.WeakKeyDictionary()
+        self.track_ids = itertools.count(2 ** 31)
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        """清空已记录的事件和计数"""
+        with self.lock:
+            self.events = []
+            self.counters = {}
+            self.task_tracks = weakref.WeakKeyDictionary()
+            self.origin = time.perf_counter()
+
+    def span(self, name: str, category: str = "stage", **args: Any):
+        """
+        创建计时区间，用法: with tracer.span("VoiceDivide.separate") as span: ...
+
+        追踪关闭时返回共享的空span，开销只有一次属性判断
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, category, args)
+
+    def _track(self) -> int:
+        """
+        当前span所在的轨道：asyncio任务内为该任务的轨道，否则为当前线程
+
+        任务内的代码顺序执行，同一轨道上的span总是正确嵌套
+        """
+        # 未导入asyncio时不可能处于任务中，避免为此导入asyncio
+        asyncio = sys.modules.get("asyncio")
+        task = None
+        if asyncio is not None:
+            try:
+                task = asyncio.current_task()
+            except RuntimeError:
+                task = None
+        if task is None:
+            return threading.get_native_id()
+        with self.lock:
+            track = self.task_tracks.get(task)
+            if track is None:
+                track = self.task_tracks[task] = next(self.track_ids)
+                self.events.append({
+                    "name": "thread_name", "ph": "M", "pid": self.pid, "tid": track,
+                    "args": {"name": f"task {task.get_name()}"},
+                })
+        return track
+
+    def _record_span(self, span: Span, end: float) -> None:
+        event = {
+            "name": span.name,
+            "cat": span.category,
+            "ph": "X",
+            "ts": (span.start - self.origin) * 1e6,
+            "dur": (end - span.start) * 1e6,
+            "pid": self.pid,
+            "tid": span.track,
+            "args": span.args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def count(self, name: str, value: float = 1) -> None:
+        """累加全局计数器（例如网络往返次数），同时计入当前span，并记录为Chrome trace计数事件"""
+        if not self.enabled:
+            return
+        _current_span.get().add(name, value)
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            self.events.append({
+                "name": name,
+                "ph": "C",
+                "ts": (time.perf_counter() - self.origin) * 1e6,
+                "pid": self.pid,
+                "args": {"value": self.counters[name]},
+            })
+
+    def summary(self) -> Dict[str, Any]:
+        """按span名称汇总耗时和资源占用，返回机器可读的字典"""
+        with self.lock:
+            events = list(self.events)
+            counters = dict(self.counters)
+
+        spans: Dict[str, Dict[str, Any]] = {}
+        for event in events:
+            if event["ph"] != "X":
+                continue
+            item = spans.setdefault(event["name"], {
+                "category": event["cat"], "count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0,
+            })
+            duration_ms = event["dur"] / 1000
+            item["count"] += 1
+            item["total_ms"] += duration_ms
+            item["max_ms"] = max(item["max_ms"], duration_ms)
+            args = event["args"]
+            if "error" in args:
+                item["errors"] += 1
+            for key, value in args.items():
+                if key == "returncode" or isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                if key.endswith("max_rss_mb"):
+                    item[key] = max(item.get(key, 0), value)  # 峰值取最大，其余累加
+                else:
+                    item[key] = item.get(key, 0) + value
+
+        for item in spans.values():
+            item["mean_ms"] = item["total_ms"] / item["count"]
+
+        return {"spans": spans, "counters": counters}
+
+    def save(self, trace_path: str, summary_path: Optional[str] = None) -> str:
+        """
+        写入Chrome/Perfetto追踪文件和汇总文件
+
+        Args:
+            trace_path: 追踪文件路径，可在 chrome://tracing 或 ui.perfetto.dev 中打开
+            summary_path: 汇总文件路径，默认为 <trace_path去掉扩展名>.summary.json
+
+        Returns:
+            追踪文件路径
+        """
+        if summary_path is None:
+            summary_path = os.path.splitext(trace_path)[0] + ".summary.json"
+        directory = os.path.dirname(os.path.abspath(trace_path))
+        os.makedirs(directory, exist_ok=True)
+
+        with self.lock:
+            events = list(self.events)
+        metadata = [{
+            "name": "process_name", "ph": "M", "pid": self.pid,
+            "args": {"name": "voice-embedding"},
+        }]
+        with open(trace_path, "w") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        with open(summary_path, "w") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        print(f"追踪文件已保存: {trace_path}, 汇总: {summary_path}")
+        return trace_path
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """获取进程内共享的追踪器"""
+    return _tracer
+
+
+def traced(name: str, category: str = "stage") -> Callable:
+    """为函数添加计时区间的装饰器，追踪关闭时只增加一次属性判断"""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _tracer.enabled:
+                    return await func(*args, **kwargs)
+                with _tracer.span(name, category):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _tracer.enabled:
+                return func(*args, **kwargs)
+            with _tracer.span(name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span() -> Any:
+    """返回当前所在的span，追踪关闭或不在span内时返回空span"""
+    return _current_span.get()
+
+
+def add_bytes(read: int = 0, written: int = 0) -> None:
+    """为当前span累加读写字节数"""
+    if not _tracer.enabled:
+        return
+    span = _current_span.get()
+    if read:
+        span.add("bytes_read", read)
+    if written:
+        span.add("bytes_written", written)
+
+
+def file_size(path: Optional[str]) -> int:
+    """返回文件大小，文件不存在时返回0"""
+    try:
+        return os.path.getsize(path) if path else 0
+    except OSError:
+        return 0
+
+
+class TracedPopen(subprocess.Popen):
+    """
+    记录子进程资源占用的Popen
+
+    回收子进程时使用 os.wait4 获取该子进程自身的rusage（CPU时间和峰值内存），
+    多个子进程并发运行时也不会互相干扰
+    """
+
+    rusage = None
+
+    def _try_wait(self, wait_flags):
+        if not hasattr(os, "wait4"):
+            return super()._try_wait(wait_flags)
+        try:
+            pid, status, rusage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            pid, status = self.pid, 0
+        else:
+            if pid == self.pid:
+                self.rusage = rusage
+        return (pid, status)
+
+
+def record_rusage(span: Any, rusage: Any) -> None:
+    """将子进程的rusage写入span"""
+    if rusage is None:
+        return
+    # Linux上ru_maxrss单位为KB，macOS上为字节
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    span.set(
+        child_cpu_user_s=round(rusage.ru_utime, 4),
+        child_cpu_sys_s=round(rusage.ru_stime, 4),
+        child_max_rss_mb=round(rusage.ru_maxrss / divisor, 1),
+    )
+    # 块设备读写次数以512字节为单位，只统计真正落盘的I/O
+    span.add("bytes_read", rusage.ru_inblock * 512)
+    span.add("bytes_written", rusage.ru_oublock * 512)
+
+
+def run(cmd: List[str], **kwargs: Any) -> subprocess.CompletedProcess:
+    """
+    与 subprocess.run 相同，追踪开启时额外记录子进程的耗时、CPU时间和峰值内存
+    
+    在调度器的资源预留内调用时，按预留设置子进程的线程数
+    """
+    from scheduler.scheduler import child_env  # 调度器依赖本模块，在调用时导入
+    env = child_env(kwargs.get("env"))
+    if env is not None:
+        kwargs["env"] = env
+    if not _tracer.enabled:
+        return subprocess.run(cmd, **kwargs)
+    with _tracer.span(f"exec:{os.path.basename(cmd[0])}", "subprocess", argv=" ".join(cmd)) as span:
+        try:
+            result = subprocess.run(cmd, **kwargs) if os.name != "posix" else _run_traced(cmd, span, **kwargs)
+        except subprocess.CalledProcessError as e:
+            span.set(returncode=e.returncode)
+            raise
+        span.set(returncode=result.returncode)
+        return result
+
+
+def _run_traced(cmd: List[str], span: Span, input: Optional[Any] = None, capture_output: bool = False,
+                timeout: Optional[float] = None, check: bool = False, **kwargs: Any) -> subprocess.CompletedProcess:
+    """subprocess.run 的等价实现，使用 TracedPopen 以获得子进程的rusage"""
+    if capture_output:
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+    with TracedPopen(cmd, **kwargs) as process:
+        try:
+            stdout, stderr = process.communicate(input, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            record_rusage(span, process.rusage)
+            raise
+        except:
+            process.kill()
+            raise
+        returncode = process.poll()
+    record_rusage(span, process.rusage)
+    if check and returncode:
+        raise subprocess.CalledProcessError(returncode, process.args, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(process.args, returncode, stdout, stderr)
+
+
+def enable_from_env() -> None:
+    """根据环境变量启用追踪，并注册进程退出时保存追踪文件"""
+    trace_path = os.environ.get(TRACE_ENV)
+    if trace_path and not _tracer.enabled:
+        _tracer.enable()
+        atexit.register(_tracer.save, trace_path)
+
+
+enable_from_env()
+
+
+if __name__ == "__main__":
+    # 使用示例
+    tracer = get_tracer()
+    tracer.enable()
+    with tracer.span("demo.stage") as span:
+        run(["sleep", "0.2"], check=True)
+        tracer.count("net.round_trips")
+        span.add("bytes_written", 1024)
+    tracer.save("output/trace.json")
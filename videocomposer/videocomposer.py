@@ -1,14 +1,24 @@
 import os
 import subprocess
 import time
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+from tracing.tracing import traced, add_bytes, file_size, run
+from mediaprobe.mediaprobe import MediaInfo, get_media_probe, stream_args, plan_mode
+from scheduler.scheduler import ffmpeg_threads
 
 class VideoComposer:
     """视频合成工具，使用FFmpeg处理视频"""
     
-    def __init__(self, ffmpeg_path: Optional[str] = None):
+    def __init__(self, ffmpeg_path: Optional[str] = None, media_probe: Optional[Any] = None):
         self.ffmpeg_path = ffmpeg_path or "ffmpeg"
+        self.media_probe = media_probe or get_media_probe()  # 按输入的实际编码选择复制或转码
+    
+    def _probe(self, path: Optional[str]) -> Optional[MediaInfo]:
+        """获取媒体信息，ffprobe不可用或文件无法解析时返回None"""
+        return self.media_probe.probe(path) if path else None
     
+    @traced("VideoComposer.extract_audio")
     def extract_audio(self, video_path: str, output_path: str) -> str:
         """
         从视频中提取音频
@@ -24,21 +34,13 @@ class VideoComposer:
             # 确保输出目录存在
             os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
             
-            # 构建FFmpeg命令
-            cmd = [
-                self.ffmpeg_path, "-y",
-                "-i", video_path,
-                "-vn",  # 不要视频
-                "-acodec", "pcm_s16le",  # 音频编码
-                "-ar", "44100",  # 采样率
-                "-ac", "2",  # 声道数
-                output_path
-            ]
+            cmd = self._extract_audio_command(video_path, output_path)
             
             # 执行命令
             print(f"提取音频命令: {' '.join(cmd)}")
-            subprocess.run(cmd, check=True, capture_output=True)
+            run(cmd, check=True, capture_output=True)
             print(f"音频提取成功: {output_path}")
+            add_bytes(read=file_size(video_path), written=file_size(output_path))
             
             return output_path
         except Exception as e:
@@ -53,6 +55,78 @@ class VideoComposer:
             except:
                 return ""
     
+    def _extract_audio_command(self, video_path: str, output_path: str) -> List[str]:
+        """构建提取音频的FFmpeg命令，音轨已是目标格式时直接复制"""
+        info = self._probe(video_path)
+        if info is None:
+            # 无法获取输入信息时统一转为 44.1kHz 双声道 16位PCM
+            codec_args = ["-acodec", "pcm_s16le", "-ar", "44100", "-ac", "2"]
+        else:
+            codec_args = stream_args(info.audio, "audio", output_path, sample_rate=44100, channels=2)
+        return [
+            self.ffmpeg_path, "-y",
+            "-i", video_path,
+            "-vn",  # 不要视频
+        ] + codec_args + ffmpeg_threads() + [output_path]
+    
+    @staticmethod
+    def _default_output_path(video_path: str) -> str:
+        """根据输入视频路径自动生成输出路径"""
+        basename = os.path.basename(video_path)
+        name, ext = os.path.splitext(basename)
+        return os.path.join(os.path.dirname(video_path), f"{name}_final{ext}")
+    
+    def _compose_command(self, video_path: str, background_audio_path: Optional[str],
+                         output_path: str) -> Optional[List[str]]:
+        """
+        构建合成最终视频的FFmpeg命令，输入与输出相同时返回None
+        
+        根据ffprobe得到的输入编码决定各个流复制还是转码：视频编码与输出容器兼容时直接复制，
+        只有混音后的音频必须重新编码
+        """
+        video_info = self._probe(video_path)
+        if background_audio_path and os.path.exists(background_audio_path):
+            # 合并视频和背景音乐
+            if video_info is not None and video_info.audio is None:
+                # 视频没有音轨时只使用背景音乐
+                audio_filter = "[1:a]volume=0.3[a]"
+            else:
+                audio_filter = "[0:a]volume=1.0[a1];[1:a]volume=0.3[a2];[a1][a2]amix=inputs=2:duration=longest[a]"
+            video_args = ["-c:v", "copy"] if video_info is None else stream_args(video_info.video, "video", output_path)
+            return [
+                self.ffmpeg_path, "-y",
+                "-i", video_path,
+                "-i", background_audio_path,
+                "-filter_complex", audio_filter,
+                "-map", "0:v:0", "-map", "[a]",
+            ] + video_args + stream_args(None, "audio", output_path, filtered=True) + ffmpeg_threads() + [output_path]
+        if output_path != video_path:
+            # 如果没有背景音乐，尽量直接复制视频
+            if video_info is None:
+                codec_args = ["-c", "copy"]
+            else:
+                codec_args = stream_args(video_info.video, "video", output_path)
+                if video_info.audio is not None:
+                    codec_args += stream_args(video_info.audio, "audio", output_path)
+            print(f"处理方式: {plan_mode(codec_args, video_path, output_path)}")
+            return [
+                self.ffmpeg_path, "-y",
+                "-i", video_path,
+            ] + codec_args + ffmpeg_threads() + [output_path]
+        return None
+    
+    @staticmethod
+    def _write_mock_video(video_path: str, background_audio_path: Optional[str], output_path: str) -> str:
+        """合成失败时创建一个空文件作为替代"""
+        try:
+            with open(output_path, "w") as f:
+                f.write(f"模拟最终视频文件: {video_path} + {background_audio_path}")
+            print(f"创建了模拟视频文件: {output_path}")
+            return output_path
+        except:
+            return ""
+    
+    @traced("VideoComposer.compose_final_video")
     def compose_final_video(self, video_path: str, background_audio_path: Optional[str] = None, output_path: str = None) -> str:
         """
         合成最终视频，可以添加背景音乐
@@ -67,76 +141,100 @@ class VideoComposer:
         """
         if output_path is None:
             # 自动生成输出路径
-            basename = os.path.basename(video_path)
-            name, ext = os.path.splitext(basename)
-            output_path = os.path.join(os.path.dirname(video_path), f"{name}_final{ext}")
+            output_path = self._default_output_path(video_path)
         
         # 确保输出目录存在
         os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
         
         try:
-            if background_audio_path and os.path.exists(background_audio_path):
-                # 合并视频和背景音乐
-                cmd = [
-                    self.ffmpeg_path, "-y",
-                    "-i", video_path,
-                    "-i", background_audio_path,
-                    "-filter_complex", "[0:a]volume=1.0[a1];[1:a]volume=0.3[a2];[a1][a2]amix=inputs=2:duration=longest",
-                    "-c:v", "copy",
-                    output_path
-                ]
-                
+            cmd = self._compose_command(video_path, background_audio_path, output_path)
+            if cmd is not None:
                 print(f"视频合成命令: {' '.join(cmd)}")
-                subprocess.run(cmd, check=True, capture_output=True)
+                run(cmd, check=True, capture_output=True)
                 print(f"视频合成成功: {output_path}")
+                add_bytes(read=file_size(video_path) + file_size(background_audio_path),
+                          written=file_size(output_path))
             else:
-                # 如果没有背景音乐，直接复制视频
-                if output_path != video_path:
-                    cmd = [
-                        self.ffmpeg_path, "-y",
-                        "-i", video_path,
-                        "-c", "copy",
-                        output_path
-                    ]
-                    
-                    print(f"视频复制命令: {' '.join(cmd)}")
-                    subprocess.run(cmd, check=True, capture_output=True)
-                    print(f"视频复制成功: {output_path}")
-                else:
-                    print(f"输入和输出路径相同，无需复制: {output_path}")
+                print(f"输入和输出路径相同，无需复制: {output_path}")
             
             return output_path
         except Exception as e:
             print(f"视频合成失败: {str(e)}")
+            return self._write_mock_video(video_path, background_audio_path, output_path)
+    
+    @traced("VideoComposer.extract_audio_async")
+    async def extract_audio_async(self, video_path: str, output_path: str,
+                                  timeout: Optional[float] = None) -> str:
+        """
+        异步从视频中提取音频，超时或任务取消时FFmpeg子进程会被终止
+        
+        Args:
+            video_path: 输入视频文件路径
+            output_path: 输出音频文件路径
+            timeout: 超时时间（秒）
             
-            # 创建一个空文件作为替代
-            try:
-                with open(output_path, "w") as f:
-                    f.write(f"模拟最终视频文件: {video_path} + {background_audio_path}")
-                print(f"创建了模拟视频文件: {output_path}")
-                return output_path
-            except:
-                return ""
+        Returns:
+            输出音频文件路径，失败时返回空字符串
+        """
+        from aioutils.aioutils import run_command
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            cmd = self._extract_audio_command(video_path, output_path)
+            print(f"提取音频命令: {' '.join(cmd)}")
+            await run_command(cmd, timeout=timeout, check=True)
+            print(f"音频提取成功: {output_path}")
+            return output_path
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"音频提取失败: {str(e)}")
+            return ""
     
-    def check_ffmpeg(self) -> bool:
-        """检查FFmpeg是否可用"""
+    @traced("VideoComposer.compose_final_video_async")
+    async def compose_final_video_async(self, video_path: str, background_audio_path: Optional[str] = None,
+                                        output_path: str = None, timeout: Optional[float] = None) -> str:
+        """
+        异步合成最终视频，超时或任务取消时FFmpeg子进程会被终止
+        
+        Args:
+            video_path: 输入视频文件路径（带有同步口型的视频）
+            background_audio_path: 背景音乐文件路径（可选）
+            output_path: 输出视频文件路径
+            timeout: 超时时间（秒）
+            
+        Returns:
+            输出视频文件路径
+        """
+        from aioutils.aioutils import run_command
+        if output_path is None:
+            output_path = self._default_output_path(video_path)
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        
         try:
-            result = subprocess.run(
-                [self.ffmpeg_path, "-version"], 
-                capture_output=True, 
-                text=True
-            )
-            if result.returncode == 0:
-                version = result.stdout.split('\n')[0]
-                print(f"FFmpeg可用: {version}")
-                return True
-            else:
-                print("FFmpeg检查失败")
-                return False
-        except Exception as e:
-            print(f"FFmpeg不可用: {str(e)}")
+            cmd = self._compose_command(video_path, background_audio_path, output_path)
+            if cmd is not None:
+                print(f"视频合成命令: {' '.join(cmd)}")
+                await run_command(cmd, timeout=timeout, check=True)
+                print(f"视频合成成功: {output_path}")
+            return output_path
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"视频合成失败: {str(e)}")
+            return self._write_mock_video(video_path, background_audio_path, output_path)
+    
+    def check_ffmpeg(self, refresh: bool = False) -> bool:
+        """
+        检查FFmpeg是否可用
+        
+        结果由preflight按可执行文件的路径和修改时间缓存在磁盘上，重复调用不会再启动子进程
+        
+        Args:
+            refresh: 是否忽略缓存重新探测
+        """
+        from preflight.preflight import get_preflight
+        info = get_preflight().ffmpeg(self.ffmpeg_path, refresh)
+        if info is None:
+            print(f"FFmpeg不可用: {self.ffmpeg_path}")
             return False
-
+        print(f"FFmpeg可用: {info['version_line']}")
+        return True
 
 if __name__ == "__main__":
     # 使用示例
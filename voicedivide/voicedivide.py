@@ -1,30 +1,70 @@
 import os
-import numpy as np
-from typing import Dict, Optional, Any
+import contextlib
+import shutil
+from typing import Dict, Optional, Any, Iterator
+
+from tracing.tracing import traced, add_bytes, file_size
+from lazyimport.lazyimport import lazy_import
+
+asyncio = lazy_import("asyncio")
 
 class VoiceDivide:
     """音频分离工具，使用Spleeter分离人声和背景音乐"""
     
-    def __init__(self, model_path: Optional[str] = None, device: str = 'cpu'):
+    def __init__(self, model_path: Optional[str] = None, device: str = 'cpu',
+                 registry: Optional[Any] = None):
         self.model = None
         self.model_path = model_path
         self.device = device
         self.sample_rate = 44100  # 默认采样率
+        self.registry = registry  # 可选的ModelRegistry，由其统一管理模型常驻
+        self.registry_key = f"spleeter:2stems:{device}"
+        if self.registry is not None:
+            # Spleeter 2stems 在TensorFlow下约占用800MB内存
+            self.registry.register(self.registry_key, self._create_model,
+                                   size_mb=800, on_evict=self._on_evict)
+        
+    def _create_model(self) -> Any:
+        """创建Spleeter模型实例"""
+        # 在实际使用时取消注释并安装spleeter库
+        # from spleeter.separator import Separator
+        # return Separator('spleeter:2stems', stft_backend='tensorflow')
+        return None
+    
+    def _on_evict(self) -> None:
+        """模型被注册表卸载时清除本实例持有的引用"""
+        self.model = None
+
+    @contextlib.contextmanager
+    def _model_in_use(self) -> Iterator[Any]:
+        """加载模型并在使用期间保持常驻；使用注册表时以固定的方式阻止卸载"""
+        if self.registry is None:
+            if self.model is None:
+                self.load_model()
+            yield self.model
+            return
+        with self.registry.use(self.registry_key) as model:
+            self.model = model
+            yield model
         
+    @traced("VoiceDivide.load_model", "model")
     def load_model(self) -> None:
         """加载Spleeter模型"""
+        if self.registry is not None:
+            # 每次使用都经过注册表，以便更新LRU顺序和命中计数
+            self.model = self.registry.get(self.registry_key)
+            return
         if self.model is not None:
             return  # 模型已加载
             
         try:
-            # 在实际使用时取消注释并安装spleeter库
-            # from spleeter.separator import Separator
-            # self.model = Separator('spleeter:2stems', stft_backend='tensorflow')
+            self.model = self._create_model()
             print(f"音频分离模型已加载")
         except Exception as e:
             print(f"模型加载失败: {str(e)}")
             raise
     
+    @traced("VoiceDivide.separate")
     def separate(self, audio_path: str, output_dir: str) -> Dict[str, str]:
         """
         分离音频中的人声和背景音乐
@@ -36,39 +76,81 @@ class VoiceDivide:
         Returns:
             包含分离后音频路径的字典 {'vocals': 路径, 'accompaniment': 路径}
         """
-        if self.model is None:
-            self.load_model()
+        # 使用期间固定模型，防止其他工具加载模型时将其卸载
+        with self._model_in_use():
             
-        os.makedirs(output_dir, exist_ok=True)
+            os.makedirs(output_dir, exist_ok=True)
         
-        # 使用Spleeter进行分离
-        # 在实际使用时取消注释
-        # self.model.separate_to_file(
-        #     audio_path, 
-        #     output_dir, 
-        #     filename_format='{instrument}.{codec}'
-        # )
-        print(f"正在分离音频: {audio_path} -> {output_dir}")
+            # 使用Spleeter进行分离
+            # 在实际使用时取消注释
+            # self.model.separate_to_file(
+            #     audio_path, 
+            #     output_dir, 
+            #     filename_format='{instrument}.{codec}'
+            # )
+            print(f"正在分离音频: {audio_path} -> {output_dir}")
+        
+            # 构建输出文件路径
+            vocal_path = os.path.join(output_dir, "vocals.wav")
+            bgm_path = os.path.join(output_dir, "accompaniment.wav")
         
-        # 构建输出文件路径
-        vocal_path = os.path.join(output_dir, "vocals.wav")
-        bgm_path = os.path.join(output_dir, "accompaniment.wav")
+            # 模拟处理过程，实际应用中可删除
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            with open(vocal_path, 'w') as f:
+                f.write("模拟人声文件")
+            with open(bgm_path, 'w') as f:
+                f.write("模拟背景音乐文件")
+        
+            add_bytes(read=file_size(audio_path), written=file_size(vocal_path) + file_size(bgm_path))
+            return {
+                "vocals": vocal_path,
+                "accompaniment": bgm_path
+            }
+    
+    @traced("VoiceDivide.separate_async")
+    async def separate_async(self, audio_path: str, output_dir: str,
+                             timeout: Optional[float] = None) -> Dict[str, str]:
+        """
+        异步分离音频中的人声和背景音乐
         
-        # 模拟处理过程，实际应用中可删除
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        with open(vocal_path, 'w') as f:
-            f.write("模拟人声文件")
-        with open(bgm_path, 'w') as f:
-            f.write("模拟背景音乐文件")
+        可以找到spleeter命令时以子进程方式运行，超时或任务取消时子进程会被终止；
+        否则在线程池中执行同步的 separate()
+        
+        Args:
+            audio_path: 输入音频文件路径
+            output_dir: 输出目录
+            timeout: 超时时间（秒）
+            
+        Returns:
+            包含分离后音频路径的字典 {'vocals': 路径, 'accompaniment': 路径}
+        """
+        spleeter = shutil.which("spleeter")
+        if spleeter is None:
+            return await asyncio.wait_for(asyncio.to_thread(self.separate, audio_path, output_dir), timeout)
+        
+        from aioutils.aioutils import run_command
+        os.makedirs(output_dir, exist_ok=True)
+        cmd = [
+            spleeter, "separate",
+            "-p", "spleeter:2stems",
+            "-o", output_dir,
+            "-f", "{instrument}.{codec}",
+            audio_path
+        ]
+        print(f"正在分离音频: {audio_path} -> {output_dir}")
+        await run_command(cmd, timeout=timeout, check=True)
         
         return {
-            "vocals": vocal_path,
-            "accompaniment": bgm_path
+            "vocals": os.path.join(output_dir, "vocals.wav"),
+            "accompaniment": os.path.join(output_dir, "accompaniment.wav")
         }
     
     def release(self) -> None:
         """释放模型资源"""
+        if self.registry is not None:
+            self.registry.release(self.registry_key)
+            return
         if self.model is not None:
             del self.model
             self.model = None